@@ -0,0 +1,81 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+"""
+Compares the throughput (samples per second, summed over all chains) of running
+chains one after another versus running them at once in a ``BatchedWorld``.
+
+Usage::
+
+    python benchmarks/batched_chains_benchmark.py --num-chains 1 4 16 64
+"""
+
+import argparse
+import time
+
+import beanmachine.ppl as bm
+import torch
+import torch.distributions as dist
+
+
+@bm.random_variable
+def mu():
+    return dist.Normal(0.0, 1.0)
+
+
+@bm.random_variable
+def sigma():
+    return dist.HalfNormal(1.0)
+
+
+@bm.random_variable
+def y():
+    # unsqueeze the (optional) chain dimension so that the model broadcasts
+    return dist.Normal(mu().unsqueeze(-1), sigma().unsqueeze(-1))
+
+
+def throughput(algorithm, num_chains: int, num_samples: int, batch: bool) -> float:
+    observations = {y(): torch.randn(20) + 1.0}
+    start = time.perf_counter()
+    algorithm.infer(
+        [mu(), sigma()],
+        observations,
+        num_samples,
+        num_chains=num_chains,
+        num_adaptive_samples=0,
+        show_progress_bar=False,
+        batch_chains=batch,
+    )
+    return num_chains * num_samples / (time.perf_counter() - start)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--num-chains", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--num-samples", type=int, default=200)
+    args = parser.parse_args()
+
+    algorithms = {
+        "ancestral MH": bm.SingleSiteAncestralMetropolisHastings(),
+        "global HMC": bm.GlobalHamiltonianMonteCarlo(
+            1.0,
+            initial_step_size=0.1,
+            adapt_step_size=False,
+            adapt_mass_matrix=False,
+            nnc_compile=False,
+        ),
+    }
+    print(
+        f"{'algorithm':>14} {'chains':>7} {'sequential (/s)':>16} {'batched (/s)':>13}"
+    )
+    for name, algorithm in algorithms.items():
+        for num_chains in args.num_chains:
+            sequential = throughput(algorithm, num_chains, args.num_samples, False)
+            batched = throughput(algorithm, num_chains, args.num_samples, True)
+            print(f"{name:>14} {num_chains:>7} {sequential:>16.0f} {batched:>13.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+"""
+Compares the average latency of many small parallel ``infer`` calls when each call
+starts a new pool of processes versus when the calls share a ``ChainExecutor``.
+
+Usage::
+
+    python benchmarks/chain_executor_benchmark.py --num-calls 20 --mp-context spawn
+"""
+
+import argparse
+import time
+
+import beanmachine.ppl as bm
+import torch
+import torch.distributions as dist
+from beanmachine.ppl.inference import ChainExecutor
+
+
+@bm.random_variable
+def mu():
+    return dist.Normal(0.0, 1.0)
+
+
+@bm.random_variable
+def y():
+    return dist.Normal(mu(), 1.0)
+
+
+def latency(num_calls: int, mp_context: str, executor=None) -> float:
+    mh = bm.SingleSiteAncestralMetropolisHastings()
+    start = time.perf_counter()
+    for _ in range(num_calls):
+        mh.infer(
+            [mu()],
+            {y(): torch.randn(())},
+            num_samples=50,
+            num_chains=2,
+            show_progress_bar=False,
+            run_in_parallel=True,
+            mp_context=mp_context,
+            chain_executor=executor,
+        )
+    return (time.perf_counter() - start) / num_calls * 1e3
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--num-calls", type=int, default=20)
+    parser.add_argument("--mp-context", default="spawn")
+    args = parser.parse_args()
+
+    new_pool = latency(args.num_calls, args.mp_context)
+    with ChainExecutor(num_workers=2, mp_context=args.mp_context) as executor:
+        latency(1, args.mp_context, executor)  # warm up the workers
+        shared = latency(args.num_calls, args.mp_context, executor)
+    print(f"{'new pool (ms/call)':>20} {'executor (ms/call)':>20}")
+    print(f"{new_pool:>20.0f} {shared:>20.0f}")
+
+
+if __name__ == "__main__":
+    main()
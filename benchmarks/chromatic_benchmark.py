@@ -0,0 +1,69 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+"""
+Compares the time per iteration of single site ancestral MH on a grid-structured
+model (a Gaussian Markov random field) when the nodes are updated one at a time
+versus one color class at a time.
+
+Usage::
+
+    python benchmarks/chromatic_benchmark.py --size 20 --num-samples 50
+"""
+
+import argparse
+import time
+
+import beanmachine.ppl as bm
+import torch
+import torch.distributions as dist
+
+
+class GridModel:
+    @bm.random_variable
+    def x(self, i, j):
+        loc = torch.tensor(0.0)
+        if i > 0:
+            loc = loc + 0.5 * self.x(i - 1, j)
+        if j > 0:
+            loc = loc + 0.5 * self.x(i, j - 1)
+        return dist.Normal(loc, 1.0)
+
+    @bm.random_variable
+    def y(self, i, j):
+        return dist.Normal(self.x(i, j), 1.0)
+
+
+def time_per_iteration(size: int, num_samples: int, chromatic: bool) -> float:
+    model = GridModel()
+    sites = [(i, j) for i in range(size) for j in range(size)]
+    mh = bm.SingleSiteAncestralMetropolisHastings(chromatic=chromatic)
+    start = time.perf_counter()
+    mh.infer(
+        [model.x(*site) for site in sites],
+        {model.y(*site): torch.randn(()) for site in sites},
+        num_samples=num_samples,
+        num_chains=1,
+        show_progress_bar=False,
+        static_structure=True,
+    )
+    return (time.perf_counter() - start) / num_samples * 1e3
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--size", type=int, default=20)
+    parser.add_argument("--num-samples", type=int, default=50)
+    args = parser.parse_args()
+
+    sequential = time_per_iteration(args.size, args.num_samples, chromatic=False)
+    chromatic = time_per_iteration(args.size, args.num_samples, chromatic=True)
+    print(f"{args.size}x{args.size} grid, time per iteration:")
+    print(f"  one node at a time:       {sequential:.1f} ms")
+    print(f"  one color class at a time: {chromatic:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
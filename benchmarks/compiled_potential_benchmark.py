@@ -0,0 +1,114 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+"""
+Measures the compile time of the compiled potential energy and gradient of HMC, the
+time per gradient with and without compilation, and the wall time of NUTS with and
+without compilation, on a hierarchical model with many small random variables.
+
+Usage::
+
+    python benchmarks/compiled_potential_benchmark.py --num-groups 10 50
+"""
+
+import argparse
+import time
+
+import beanmachine.ppl as bm
+import torch
+import torch.distributions as dist
+from beanmachine.ppl.inference.proposer.hmc_proposer import HMCProposer
+from beanmachine.ppl.world import World
+
+
+@bm.random_variable
+def mu():
+    return dist.Normal(0.0, 1.0)
+
+
+@bm.random_variable
+def sigma():
+    return dist.HalfNormal(1.0)
+
+
+@bm.random_variable
+def theta(i):
+    return dist.Normal(mu(), sigma())
+
+
+@bm.random_variable
+def y(i):
+    return dist.Normal(theta(i), 1.0)
+
+
+def observations(num_groups: int):
+    return {y(i): torch.tensor(float(i % 3)) for i in range(num_groups)}
+
+
+def time_per_gradient(proposer: HMCProposer, num_iters: int = 100) -> float:
+    positions = proposer._positions
+    start = time.perf_counter()
+    for _ in range(num_iters):
+        proposer._potential_grads(positions)
+    return (time.perf_counter() - start) / num_iters * 1e3
+
+
+def nuts_wall_time(num_groups: int, num_samples: int, compile_potential: bool):
+    torch.manual_seed(0)
+    nuts = bm.GlobalNoUTurnSampler(
+        nnc_compile=False, compile_potential=compile_potential
+    )
+    start = time.perf_counter()
+    nuts.infer(
+        [mu()],
+        observations(num_groups),
+        num_samples,
+        num_chains=1,
+        show_progress_bar=False,
+    )
+    return time.perf_counter() - start
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--num-groups", type=int, nargs="+", default=[10, 50])
+    parser.add_argument("--num-samples", type=int, default=200)
+    args = parser.parse_args()
+
+    print(
+        f"{'params':>7} {'compile (s)':>12} {'eager (ms/grad)':>16}"
+        f" {'compiled (ms/grad)':>19} {'NUTS eager (s)':>15} {'NUTS compiled (s)':>18}"
+    )
+    for num_groups in args.num_groups:
+        world = World(observations(num_groups))
+        for i in range(num_groups):
+            world.call(y(i))
+        proposer = HMCProposer(
+            world, world.latent_nodes, 0, trajectory_length=1.0, nnc_compile=False
+        )
+        eager_time = time_per_gradient(proposer)
+        start = time.perf_counter()
+        proposer = HMCProposer(
+            world,
+            world.latent_nodes,
+            0,
+            trajectory_length=1.0,
+            nnc_compile=False,
+            compile_potential=True,
+        )
+        compile_time = time.perf_counter() - start
+        compiled_time = time_per_gradient(proposer)
+        nuts_times = [
+            nuts_wall_time(num_groups, args.num_samples, compile_potential)
+            for compile_potential in (False, True)
+        ]
+        print(
+            f"{num_groups + 2:>7} {compile_time:>12.2f} {eager_time:>16.3f}"
+            f" {compiled_time:>19.3f} {nuts_times[0]:>15.2f} {nuts_times[1]:>18.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
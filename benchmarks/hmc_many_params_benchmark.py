@@ -0,0 +1,74 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+"""
+Measures the time per iteration of global HMC and NUTS on a hierarchical model with
+many small parameter tensors, where the per-parameter bookkeeping of the leapfrog
+steps can dominate the cost of evaluating the model.
+
+Usage::
+
+    python benchmarks/hmc_many_params_benchmark.py --num-groups 10 50 100
+"""
+
+import argparse
+import time
+
+import beanmachine.ppl as bm
+import torch
+import torch.distributions as dist
+
+
+@bm.random_variable
+def mu():
+    return dist.Normal(0.0, 1.0)
+
+
+@bm.random_variable
+def theta(i):
+    return dist.Normal(mu(), 1.0)
+
+
+@bm.random_variable
+def y(i):
+    return dist.Normal(theta(i), 1.0)
+
+
+def time_per_iteration(
+    inference: bm.inference.base_inference.BaseInference,
+    num_groups: int,
+    num_samples: int,
+) -> float:
+    torch.manual_seed(0)
+    observations = {y(i): torch.tensor(float(i % 3)) for i in range(num_groups)}
+    start = time.perf_counter()
+    inference.infer(
+        [mu()],
+        observations,
+        num_samples,
+        num_chains=1,
+        num_adaptive_samples=num_samples,
+        show_progress_bar=False,
+    )
+    return (time.perf_counter() - start) / (2 * num_samples) * 1e3
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--num-groups", type=int, nargs="+", default=[10, 50, 100])
+    parser.add_argument("--num-samples", type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"{'params':>7} {'HMC (ms/it)':>12} {'NUTS (ms/it)':>13}")
+    for num_groups in args.num_groups:
+        hmc = bm.GlobalHamiltonianMonteCarlo(trajectory_length=1.0)
+        nuts = bm.GlobalNoUTurnSampler(nnc_compile=False)
+        hmc_time = time_per_iteration(hmc, num_groups, args.num_samples)
+        nuts_time = time_per_iteration(nuts, num_groups, args.num_samples)
+        print(f"{num_groups + 1:>7} {hmc_time:>12.2f} {nuts_time:>13.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+"""
+Compares the minimum effective sample size per second of NUTS with a diagonal, a
+dense, and a diagonal-plus-low-rank mass matrix on a strongly correlated Gaussian
+posterior whose coordinates are split across several random variables.
+
+Usage::
+
+    python benchmarks/mass_matrix_benchmark.py --dim 20 --correlation 0.95
+"""
+
+import argparse
+import time
+
+import beanmachine.ppl as bm
+import torch
+import torch.distributions as dist
+from beanmachine.ppl.diagnostics.common_statistics import effective_sample_size
+
+
+class CorrelatedGaussian:
+    """The posterior of x is (nearly) MultivariateNormal(0, covariance), where
+    covariance has a constant correlation and marginal scales from 0.1 to 10."""
+
+    def __init__(self, dim: int, correlation: float, num_blocks: int = 4) -> None:
+        covariance = torch.full((dim, dim), correlation)
+        covariance.fill_diagonal_(1.0)
+        scales = torch.logspace(-1, 1, dim)
+        self.covariance = scales[:, None] * covariance * scales
+        self.blocks = torch.arange(dim).chunk(num_blocks)
+
+    @bm.random_variable
+    def x(self, i):
+        return dist.Independent(dist.Normal(torch.zeros(len(self.blocks[i])), 100.0), 1)
+
+    @bm.random_variable
+    def y(self):
+        x = torch.cat([self.x(i) for i in range(len(self.blocks))])
+        return dist.MultivariateNormal(x, self.covariance)
+
+
+def min_ess_per_second(
+    model: CorrelatedGaussian, mass_matrix_type: str, num_samples: int
+) -> float:
+    torch.manual_seed(0)
+    nuts = bm.GlobalNoUTurnSampler(nnc_compile=False, mass_matrix_type=mass_matrix_type)
+    queries = [model.x(i) for i in range(len(model.blocks))]
+    start = time.perf_counter()
+    samples = nuts.infer(
+        queries,
+        {model.y(): torch.zeros(len(model.covariance))},
+        num_samples,
+        num_chains=1,
+        show_progress_bar=False,
+    )
+    elapsed = time.perf_counter() - start
+    ess = torch.cat([effective_sample_size(samples[q]) for q in queries])
+    return ess.min().item() / elapsed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--dim", type=int, default=20)
+    parser.add_argument("--correlation", type=float, default=0.95)
+    parser.add_argument("--num-samples", type=int, default=500)
+    args = parser.parse_args()
+
+    model = CorrelatedGaussian(args.dim, args.correlation)
+    for mass_matrix_type in ("diagonal", "dense", "low_rank"):
+        ess = min_ess_per_second(model, mass_matrix_type, args.num_samples)
+        print(f"{mass_matrix_type:>9}: min ESS/s = {ess:.2f}")
+
+
+if __name__ == "__main__":
+    main()
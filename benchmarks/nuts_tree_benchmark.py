@@ -0,0 +1,79 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+"""
+Measures the time per leapfrog step of NUTS on an ill-conditioned Gaussian (without
+mass matrix adaptation), where most of the trajectories are built to the maximum
+tree depth and the bookkeeping of the tree building algorithm is significant
+compared to the cheap gradients.
+
+Usage::
+
+    python benchmarks/nuts_tree_benchmark.py --max-tree-depth 8 10 --compile-potential
+"""
+
+import argparse
+import time
+
+import beanmachine.ppl as bm
+import torch
+import torch.distributions as dist
+from beanmachine.ppl.inference.proposer.nuts_proposer import NUTSProposer
+
+
+@bm.random_variable
+def x():
+    return dist.Normal(torch.zeros(10), torch.logspace(-2, 1, 10))
+
+
+def time_per_step(
+    max_tree_depth: int, num_samples: int, compile_potential: bool
+) -> float:
+    num_steps = 0
+    build_tree_base_case = NUTSProposer._build_tree_base_case
+
+    def counted_build_tree_base_case(self, root, args):
+        nonlocal num_steps
+        num_steps += 1
+        return build_tree_base_case(self, root, args)
+
+    NUTSProposer._build_tree_base_case = counted_build_tree_base_case
+    try:
+        torch.manual_seed(0)
+        nuts = bm.GlobalNoUTurnSampler(
+            max_tree_depth=max_tree_depth,
+            adapt_mass_matrix=False,
+            nnc_compile=False,
+            compile_potential=compile_potential,
+        )
+        sampler = nuts.sampler([x()], {}, num_samples, num_samples)
+        # exclude the time to initialize (and compile) the proposer
+        next(sampler)
+        num_steps = 0
+        start = time.perf_counter()
+        for _ in sampler:
+            pass
+        elapsed = time.perf_counter() - start
+    finally:
+        NUTSProposer._build_tree_base_case = build_tree_base_case
+    return elapsed / num_steps * 1e3
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--max-tree-depth", type=int, nargs="+", default=[8, 10])
+    parser.add_argument("--num-samples", type=int, default=50)
+    parser.add_argument("--compile-potential", action="store_true")
+    args = parser.parse_args()
+
+    for max_tree_depth in args.max_tree_depth:
+        step_time = time_per_step(
+            max_tree_depth, args.num_samples, args.compile_potential
+        )
+        print(f"max_tree_depth={max_tree_depth}: {step_time:.3f} ms/step")
+
+
+if __name__ == "__main__":
+    main()
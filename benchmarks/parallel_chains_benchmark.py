@@ -0,0 +1,68 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+"""
+Compares the wall time of running chains in parallel processes when the samples are
+sent back to the parent process through the result pipe of the pool versus when they
+are written in place into preallocated shared memory buffers.
+
+Usage::
+
+    python benchmarks/parallel_chains_benchmark.py --dims 10 1000 --num-samples 2000
+"""
+
+import argparse
+import contextlib
+import time
+from unittest import mock
+
+import beanmachine.ppl as bm
+import torch
+import torch.distributions as dist
+
+
+@bm.random_variable
+def theta(dim: int):
+    return dist.Independent(dist.Normal(torch.zeros(dim), 1.0), 1)
+
+
+def wall_time(dim: int, num_samples: int, shared_memory: bool) -> float:
+    mh = bm.SingleSiteAncestralMetropolisHastings()
+    # without buffers, the chains fall back to returning their samples
+    context = (
+        contextlib.nullcontext()
+        if shared_memory
+        else mock.patch.object(type(mh), "_allocate_sample_buffers", return_value=None)
+    )
+    with context:
+        start = time.perf_counter()
+        mh.infer(
+            [theta(dim)],
+            {},
+            num_samples,
+            num_chains=4,
+            num_adaptive_samples=0,
+            show_progress_bar=False,
+            run_in_parallel=True,
+            mp_context="fork",
+        )
+        return time.perf_counter() - start
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--dims", type=int, nargs="+", default=[10, 1000])
+    parser.add_argument("--num-samples", type=int, default=2000)
+    args = parser.parse_args()
+
+    print(f"{'dim':>6} {'pipe (s)':>9} {'shared memory (s)':>18}")
+    for dim in args.dims:
+        pipe = wall_time(dim, args.num_samples, False)
+        shared = wall_time(dim, args.num_samples, True)
+        print(f"{dim:>6} {pipe:>9.2f} {shared:>18.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+"""
+Compares the per-iteration latency of single site ancestral MH on a random effects
+model where the group effects are written as an indexed family of random variables
+(``bm.random_variable``) versus a plate (``bm.plate``).
+
+Usage::
+
+    python benchmarks/plate_benchmark.py --num-groups 100 1000 10000
+"""
+
+import argparse
+import time
+
+import beanmachine.ppl as bm
+import torch
+import torch.distributions as dist
+
+
+class RandomEffectsModel:
+    @bm.random_variable
+    def mu(self):
+        return dist.Normal(0.0, 1.0)
+
+    @bm.random_variable
+    def theta(self, i):
+        return dist.Normal(self.mu(), 1.0)
+
+    @bm.random_variable
+    def y(self, i):
+        return dist.Normal(self.theta(i), 1.0)
+
+
+class PlateRandomEffectsModel:
+    def __init__(self, num_groups: int):
+        self.num_groups = num_groups
+        # bm.plate needs the number of sites at decoration time
+        self.theta = bm.plate(size=num_groups)(self._theta)
+        self.y = bm.plate(size=num_groups)(self._y)
+
+    @bm.random_variable
+    def mu(self):
+        return dist.Normal(0.0, 1.0)
+
+    def _theta(self, i):
+        return dist.Normal(self.mu(), 1.0)
+
+    def _y(self, i):
+        return dist.Normal(self.theta(i), 1.0)
+
+
+def time_per_iteration(model, observations, num_samples: int) -> float:
+    """Returns the average latency of an MH iteration (in milliseconds)"""
+    sampler = bm.SingleSiteAncestralMetropolisHastings().sampler(
+        [model.mu()], observations, num_samples=num_samples
+    )
+    next(sampler)  # initialization
+    start = time.perf_counter()
+    for _ in sampler:
+        pass
+    return (time.perf_counter() - start) / (num_samples - 1) * 1e3
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--num-groups", type=int, nargs="+", default=[100, 1000])
+    parser.add_argument("--num-samples", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'groups':>8} {'per-site (ms)':>14} {'plate (ms)':>12}")
+    for num_groups in args.num_groups:
+        data = torch.randn(num_groups)
+        model = RandomEffectsModel()
+        observations = {model.y(i): data[i] for i in range(num_groups)}
+        per_site_ms = time_per_iteration(model, observations, args.num_samples)
+
+        plate_model = PlateRandomEffectsModel(num_groups)
+        observations = {plate_model.y(): data}
+        plate_ms = time_per_iteration(plate_model, observations, args.num_samples)
+        print(f"{num_groups:>8} {per_site_ms:>14.1f} {plate_ms:>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
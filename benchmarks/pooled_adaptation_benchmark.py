@@ -0,0 +1,87 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+"""
+Compares the quality of the adaptation of NUTS with and without pooling the
+adaptation statistics across the chains, on a Gaussian whose marginal scales span
+three orders of magnitude. The quality is measured by the error of the adapted
+(diagonal) inverse mass matrix with respect to the true variances, and by the
+minimum effective sample size per draw of the (non-adaptive) samples.
+
+Usage::
+
+    python benchmarks/pooled_adaptation_benchmark.py --num-adaptive-samples 100 400
+"""
+
+import argparse
+import time
+from unittest.mock import patch
+
+import beanmachine.ppl as bm
+import torch
+import torch.distributions as dist
+from beanmachine.ppl.diagnostics.common_statistics import effective_sample_size
+from beanmachine.ppl.inference.proposer.hmc_proposer import HMCProposer
+
+SCALES = torch.logspace(-1, 2, 20)
+
+
+@bm.random_variable
+def x():
+    return dist.Normal(torch.zeros(len(SCALES)), SCALES)
+
+
+def run(num_adaptive_samples: int, num_samples: int, num_chains: int, pool: bool):
+    log_errors = []
+    finish_adaptation = HMCProposer.finish_adaptation
+
+    def record_mass_matrix(self):
+        finish_adaptation(self)
+        log_errors.append((self._mass_inv.log() - SCALES.log() * 2).abs().max())
+
+    torch.manual_seed(0)
+    nuts = bm.GlobalNoUTurnSampler(nnc_compile=False, pool_adaptation=pool)
+    start = time.perf_counter()
+    with patch.object(HMCProposer, "finish_adaptation", record_mass_matrix):
+        samples = nuts.infer(
+            [x()],
+            {},
+            num_samples,
+            num_chains=num_chains,
+            num_adaptive_samples=num_adaptive_samples,
+            show_progress_bar=False,
+            run_in_threads=True,
+        )
+    elapsed = time.perf_counter() - start
+    ess = effective_sample_size(samples[x()]).min().item()
+    return max(log_errors).item(), ess / (num_chains * num_samples), elapsed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--num-adaptive-samples", type=int, nargs="+", default=[100, 400]
+    )
+    parser.add_argument("--num-samples", type=int, default=200)
+    parser.add_argument("--num-chains", type=int, default=4)
+    args = parser.parse_args()
+
+    print(
+        f"{'warmup':>7} {'pooled':>7} {'max |log error| of M^-1':>24}"
+        f" {'min ESS/draw':>13} {'time (s)':>9}"
+    )
+    for num_adaptive_samples in args.num_adaptive_samples:
+        for pool in (False, True):
+            log_error, ess, elapsed = run(
+                num_adaptive_samples, args.num_samples, args.num_chains, pool
+            )
+            print(
+                f"{num_adaptive_samples:>7} {str(pool):>7} {log_error:>24.3f}"
+                f" {ess:>13.3f} {elapsed:>9.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
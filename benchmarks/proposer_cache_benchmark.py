@@ -0,0 +1,84 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+"""
+Measures the per-iteration cost of collecting the proposers of a static model with
+many sites, when the proposers are requested from the inference kernel at every
+iteration versus reused by the ``Sampler`` while the structure of the world is
+unchanged.
+
+Usage::
+
+    python benchmarks/proposer_cache_benchmark.py --sizes 10000 50000
+"""
+
+import argparse
+import time
+from typing import Callable
+
+import beanmachine.ppl as bm
+import torch
+import torch.distributions as dist
+from beanmachine.ppl.inference.sampler import Sampler
+from beanmachine.ppl.world import World
+
+
+@bm.random_variable
+def theta(i):
+    return dist.Normal(0.0, 1.0)
+
+
+@bm.random_variable
+def sigma(i):
+    return dist.HalfNormal(1.0)
+
+
+@bm.random_variable
+def y(i):
+    return dist.Normal(theta(i), sigma(i))
+
+
+def time_per_call(fn: Callable[[], object], num_iterations: int) -> float:
+    """Returns the average latency of ``fn`` (in milliseconds)"""
+    start = time.perf_counter()
+    for _ in range(num_iterations):
+        fn()
+    return (time.perf_counter() - start) / num_iterations * 1e3
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 50000])
+    parser.add_argument("--num-iterations", type=int, default=10)
+    args = parser.parse_args()
+
+    print(f"{'sites':>8} {'kernel':>28} {'uncached (ms)':>14} {'cached (ms)':>12}")
+    for size in args.sizes:
+        observations = {y(i): torch.tensor(0.0) for i in range(size)}
+        world = World.initialize_world([], observations, static_structure=True)
+        kernels = {
+            "SingleSiteAncestralMH": bm.SingleSiteAncestralMetropolisHastings(),
+            "CompositionalInference": bm.CompositionalInference(
+                {
+                    theta: bm.SingleSiteAncestralMetropolisHastings(),
+                    sigma: bm.SingleSiteRandomWalk(),
+                }
+            ),
+        }
+        for name, kernel in kernels.items():
+            sampler = Sampler(kernel, world)
+            sampler._get_proposers(world)  # populate the cache
+            uncached = time_per_call(
+                lambda: kernel.get_proposers(world, world.latent_nodes, 0),
+                args.num_iterations,
+            )
+            cached = time_per_call(
+                lambda: sampler._get_proposers(world), args.num_iterations
+            )
+            print(f"{2 * size:>8} {name:>28} {uncached:>14.2f} {cached:>12.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+"""
+Measures the overhead of creating, hashing, and comparing RVIdentifiers of an
+indexed random variable family, which is what dictionaries keyed by RVIdentifier
+(World, Variable.parents/children, proposer maps, MonteCarloSamples) pay on every
+lookup.
+
+Usage::
+
+    python benchmarks/rv_identifier_benchmark.py --num-rvs 100000
+"""
+
+import argparse
+import time
+
+import beanmachine.ppl as bm
+import torch.distributions as dist
+
+
+class Model:
+    @bm.random_variable
+    def theta(self, i, j):
+        return dist.Normal(0.0, 1.0)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--num-rvs", type=int, default=100000)
+    parser.add_argument("--num-repeats", type=int, default=10)
+    args = parser.parse_args()
+
+    model = Model()
+    indices = [(i, str(i)) for i in range(args.num_rvs)]
+
+    start = time.perf_counter()
+    rvs = [model.theta(*idx) for idx in indices]
+    create_s = time.perf_counter() - start
+
+    # a second round of calls returns the identifiers of existing nodes, which is
+    # what happens when a model is re-run during inference
+    start = time.perf_counter()
+    rvs_again = [model.theta(*idx) for idx in indices]
+    recreate_s = time.perf_counter() - start
+
+    table = dict.fromkeys(rvs)
+    start = time.perf_counter()
+    for _ in range(args.num_repeats):
+        for rv in rvs:
+            table[rv]
+    lookup_s = (time.perf_counter() - start) / args.num_repeats
+
+    start = time.perf_counter()
+    for _ in range(args.num_repeats):
+        for rv in rvs_again:
+            table[rv]
+    lookup_again_s = (time.perf_counter() - start) / args.num_repeats
+
+    start = time.perf_counter()
+    for _ in range(args.num_repeats):
+        set(rvs) - set(rvs_again[: len(rvs_again) // 2])
+    set_diff_s = (time.perf_counter() - start) / args.num_repeats
+
+    print(f"{args.num_rvs} RVs")
+    print(f"create keys:                 {create_s * 1e3:8.1f} ms")
+    print(f"re-create keys:              {recreate_s * 1e3:8.1f} ms")
+    print(f"dict lookup (same keys):     {lookup_s * 1e3:8.1f} ms")
+    print(f"dict lookup (re-created):    {lookup_again_s * 1e3:8.1f} ms")
+    print(f"set difference:              {set_diff_s * 1e3:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+"""
+Compares the wall time of running the chains of a Bayesian logistic regression with
+NUTS one after the other, in threads of the current process, and in a pool of
+processes. The chains spend most of their time in the (GIL-releasing) matrix
+products of the model when the number of data points is large.
+
+Usage::
+
+    python benchmarks/threaded_chains_benchmark.py --num-data 1000 100000
+"""
+
+import argparse
+import time
+
+import beanmachine.ppl as bm
+import torch
+import torch.distributions as dist
+
+
+class LogisticRegression:
+    def __init__(self, X: torch.Tensor) -> None:
+        self.X = X
+
+    @bm.random_variable
+    def beta(self):
+        return dist.Independent(dist.Normal(torch.zeros(self.X.shape[1]), 1.0), 1)
+
+    @bm.random_variable
+    def y(self):
+        return dist.Independent(dist.Bernoulli(logits=self.X @ self.beta()), 1)
+
+
+def wall_time(num_data: int, num_samples: int, mode: str) -> float:
+    X = torch.randn(num_data, 20)
+    model = LogisticRegression(X)
+    y = dist.Bernoulli(logits=X @ torch.randn(20)).sample()
+    nuts = bm.GlobalNoUTurnSampler(nnc_compile=False)
+    start = time.perf_counter()
+    nuts.infer(
+        [model.beta()],
+        {model.y(): y},
+        num_samples,
+        num_chains=4,
+        show_progress_bar=False,
+        run_in_threads=mode == "threads",
+        run_in_parallel=mode == "processes",
+        mp_context="fork" if mode == "processes" else None,
+    )
+    return time.perf_counter() - start
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--num-data", type=int, nargs="+", default=[1000, 100000])
+    parser.add_argument("--num-samples", type=int, default=200)
+    args = parser.parse_args()
+
+    print(f"{'data':>8} {'serial (s)':>11} {'threads (s)':>12} {'processes (s)':>14}")
+    for num_data in args.num_data:
+        times = [
+            wall_time(num_data, args.num_samples, mode)
+            for mode in ("serial", "threads", "processes")
+        ]
+        print(f"{num_data:>8} {times[0]:>11.2f} {times[1]:>12.2f} {times[2]:>14.2f}")
+
+
+if __name__ == "__main__":
+    main()
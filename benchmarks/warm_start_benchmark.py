@@ -0,0 +1,83 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+"""
+Compares a cold start of NUTS with warm starts from the tuning state that the cold
+start saved into a ``TuningCache``, on a Gaussian whose marginal scales span three
+orders of magnitude and whose mean is refitted to updated data. The warm starts use
+a fraction of the adaptation of the cold start. The quality is measured by the
+minimum effective sample size per draw of the (non-adaptive) samples.
+
+Usage::
+
+    python benchmarks/warm_start_benchmark.py --num-adaptive-samples 1000 100 25
+"""
+
+import argparse
+import tempfile
+import time
+
+import beanmachine.ppl as bm
+import torch
+import torch.distributions as dist
+from beanmachine.ppl.diagnostics.common_statistics import effective_sample_size
+
+SCALES = torch.logspace(-1, 2, 20)
+
+
+@bm.random_variable
+def mu():
+    return dist.Normal(torch.zeros(len(SCALES)), 10 * SCALES)
+
+
+@bm.random_variable
+def y(i):
+    return dist.Normal(mu(), SCALES)
+
+
+def run(num_adaptive_samples: int, num_samples: int, tuning_cache: str, seed: int):
+    torch.manual_seed(seed)
+    # the data (but not the structure of the model) changes between the runs
+    observations = {y(i): torch.randn(len(SCALES)) * SCALES for i in range(3)}
+    nuts = bm.GlobalNoUTurnSampler(nnc_compile=False, tuning_cache=tuning_cache)
+    start = time.perf_counter()
+    samples = nuts.infer(
+        [mu()],
+        observations,
+        num_samples,
+        num_chains=1,
+        num_adaptive_samples=num_adaptive_samples,
+        show_progress_bar=False,
+    )
+    elapsed = time.perf_counter() - start
+    ess = effective_sample_size(samples[mu()]).min().item()
+    return ess / num_samples, elapsed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--num-adaptive-samples", type=int, nargs="+", default=[1000, 100, 25]
+    )
+    parser.add_argument("--num-samples", type=int, default=500)
+    args = parser.parse_args()
+
+    print(f"{'start':>6} {'warmup':>7} {'min ESS/draw':>13} {'time (s)':>9}")
+    with tempfile.TemporaryDirectory() as tuning_cache:
+        for i, num_adaptive_samples in enumerate(args.num_adaptive_samples):
+            ess, elapsed = run(num_adaptive_samples, args.num_samples, tuning_cache, i)
+            print(
+                f"{'cold' if i == 0 else 'warm':>6} {num_adaptive_samples:>7}"
+                f" {ess:>13.3f} {elapsed:>9.1f}"
+            )
+        # a cold start with the shortest adaptation, for comparison
+        with tempfile.TemporaryDirectory() as empty_cache:
+            num_adaptive_samples = args.num_adaptive_samples[-1]
+            ess, elapsed = run(num_adaptive_samples, args.num_samples, empty_cache, i)
+            print(f"{'cold':>6} {num_adaptive_samples:>7} {ess:>13.3f} {elapsed:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+"""
+Measures the per-step latency of single site updates on worlds of increasing size.
+The model is a collection of independent Normal-Normal pairs, so the work done by
+each update should ideally be independent of the number of sites in the world.
+
+Usage::
+
+    python benchmarks/world_benchmark.py --sizes 100 1000 10000
+"""
+
+import argparse
+import random
+import time
+from typing import Callable
+
+import beanmachine.ppl as bm
+import torch
+import torch.distributions as dist
+from beanmachine.ppl.inference.proposer.single_site_ancestral_proposer import (
+    SingleSiteAncestralProposer,
+)
+from beanmachine.ppl.world import World
+
+
+@bm.random_variable
+def theta(i):
+    return dist.Normal(0.0, 1.0)
+
+
+@bm.random_variable
+def y(i):
+    return dist.Normal(theta(i), 1.0)
+
+
+def build_world(num_sites: int) -> World:
+    observations = {y(i): torch.tensor(0.0) for i in range(num_sites)}
+    return World.initialize_world([], observations)
+
+
+def time_per_step(fn: Callable[[int], None], num_sites: int, num_steps: int) -> float:
+    """Returns the average latency of ``fn`` (in microseconds)"""
+    indices = [random.randrange(num_sites) for _ in range(num_steps)]
+    start = time.perf_counter()
+    for i in indices:
+        fn(i)
+    return (time.perf_counter() - start) / num_steps * 1e6
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--num-steps", type=int, default=1000)
+    args = parser.parse_args()
+
+    print(f"{'sites':>8} {'copy (us)':>12} {'replace (us)':>14} {'MH step (us)':>14}")
+    for num_sites in args.sizes:
+        world = build_world(num_sites)
+        value = torch.tensor(0.5)
+        proposers = {}
+
+        def mh_step(i: int) -> None:
+            if i not in proposers:
+                proposers[i] = SingleSiteAncestralProposer(theta(i))
+            proposers[i].propose(world)
+
+        copy_us = time_per_step(lambda i: world.copy(), num_sites, args.num_steps)
+        replace_us = time_per_step(
+            lambda i: world.replace({theta(i): value}), num_sites, args.num_steps
+        )
+        mh_us = time_per_step(mh_step, num_sites, args.num_steps)
+        print(f"{num_sites:>8} {copy_us:>12.1f} {replace_us:>14.1f} {mh_us:>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
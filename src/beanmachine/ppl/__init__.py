@@ -27,6 +27,7 @@ from .model import (
     functional,
     get_beanmachine_logger,
     param,
+    plate,
     random_variable,
     RVIdentifier,
 )
@@ -56,6 +57,7 @@ __all__ = [
     "functional",
     "seed",
     "param",
+    "plate",
     "r_hat",
     "random_variable",
     "simulate",
@@ -3,7 +3,10 @@
 # This source code is licensed under the MIT license found in the
 # LICENSE file in the root directory of this source tree.
 
+from beanmachine.ppl.inference.async_sampler import AsyncSampler
 from beanmachine.ppl.inference.bmg_inference import BMGInference
+from beanmachine.ppl.inference.chain_executor import ChainExecutor
+from beanmachine.ppl.inference.chain_rng import ChainRNG
 from beanmachine.ppl.inference.compositional_infer import CompositionalInference
 from beanmachine.ppl.inference.hmc_inference import (
     GlobalHamiltonianMonteCarlo,
@@ -13,7 +16,14 @@ from beanmachine.ppl.inference.nuts_inference import (
     GlobalNoUTurnSampler,
     SingleSiteNoUTurnSampler,
 )
+from beanmachine.ppl.inference.posterior_moments import PosteriorMoments
 from beanmachine.ppl.inference.predictive import empirical, simulate
+from beanmachine.ppl.inference.proposer.hmc_utils import HMCTuningState, TuningCache
+from beanmachine.ppl.inference.sample_sink import (
+    NpyFileSink,
+    SampleSink,
+    SharedMemorySink,
+)
 from beanmachine.ppl.inference.single_site_ancestral_mh import (
     SingleSiteAncestralMetropolisHastings,
 )
@@ -22,22 +32,33 @@ from beanmachine.ppl.inference.single_site_random_walk import SingleSiteRandomWa
 from beanmachine.ppl.inference.single_site_uniform_mh import (
     SingleSiteUniformMetropolisHastings,
 )
+from beanmachine.ppl.inference.stopping_rule import StoppingRule
 from beanmachine.ppl.inference.utils import seed, VerboseLevel
 from beanmachine.ppl.legacy.inference import RejectionSampling
 
 
 __all__ = [
+    "AsyncSampler",
     "BMGInference",
+    "ChainExecutor",
+    "ChainRNG",
     "CompositionalInference",
     "GlobalHamiltonianMonteCarlo",
     "GlobalNoUTurnSampler",
+    "HMCTuningState",
+    "NpyFileSink",
+    "PosteriorMoments",
     "RejectionSampling",
+    "SampleSink",
+    "SharedMemorySink",
     "SingleSiteAncestralMetropolisHastings",
     "SingleSiteHamiltonianMonteCarlo",
     "SingleSiteNewtonianMonteCarlo",
     "SingleSiteNoUTurnSampler",
     "SingleSiteRandomWalk",
     "SingleSiteUniformMetropolisHastings",
+    "StoppingRule",
+    "TuningCache",
     "VerboseLevel",
     "empirical",
     "seed",
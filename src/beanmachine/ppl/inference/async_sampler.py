@@ -0,0 +1,181 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import threading
+from concurrent.futures import Executor
+from types import TracebackType
+from typing import Any, AsyncIterator, Optional, Type, TYPE_CHECKING
+
+
+if TYPE_CHECKING:
+    from beanmachine.ppl.inference.sampler import Sampler
+    from beanmachine.ppl.world import World
+
+
+# marks the end of the sampling
+_DONE = object()
+
+
+class AsyncSampler(AsyncIterator["World"]):
+    """
+    An asynchronous iterator over the worlds of a ``Sampler``, which can be consumed
+    from an ``asyncio`` event loop without blocking it, e.g. to serve many concurrent
+    inference requests from a single process. The inference iterations run in an
+    executor, one at a time.
+
+    Example::
+
+        sampler = bm.GlobalNoUTurnSampler().sampler(queries, observations, 1000)
+        async with AsyncSampler(sampler) as async_sampler:
+            async for world in async_sampler:
+                ...
+
+    By default, the next world is only computed when the consumer asks for it, so the
+    inference runs at the pace of the consumer. With ``max_prefetch``, up to
+    ``max_prefetch`` worlds are computed ahead of the consumer in the background, and
+    the inference pauses when they have not been consumed yet.
+
+    Calling ``cancel`` (e.g. from another thread) or ``aclose`` stops the iteration
+    after the iteration in progress. Cancelling a task that awaits the next world
+    does not interrupt the iteration in progress either: the world it returns is
+    returned to the next call instead.
+
+    Args:
+        sampler: The sampler to iterate over.
+        executor: The executor that runs the iterations. Defaults to the default
+            executor of the event loop.
+        max_prefetch: The maximum number of worlds to compute ahead of the consumer,
+            defaults to 0.
+    """
+
+    def __init__(
+        self,
+        sampler: Sampler,
+        executor: Optional[Executor] = None,
+        max_prefetch: int = 0,
+    ):
+        if max_prefetch < 0:
+            raise ValueError(
+                f"max_prefetch should be non-negative, but got {max_prefetch}."
+            )
+        self.sampler = sampler
+        self.executor = executor
+        self.max_prefetch = max_prefetch
+        self._cancelled = threading.Event()
+        self._is_done = False
+        self._is_running = False
+        # the iteration in progress in the executor
+        self._pending: Optional[asyncio.Future] = None
+        # the prefetched worlds and the task that computes them
+        self._queue: Optional[asyncio.Queue] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._producer: Optional[asyncio.Task] = None
+
+    def __aiter__(self) -> AsyncSampler:
+        return self
+
+    async def __anext__(self) -> World:
+        if self._is_running:
+            raise RuntimeError("The AsyncSampler is already waiting for a world.")
+        self._is_running = True
+        try:
+            if self._is_done:
+                raise StopAsyncIteration
+            if self.max_prefetch == 0:
+                world = await self._step()
+            else:
+                world = await self._get_prefetched()
+            if world is _DONE:
+                self._is_done = True
+                raise StopAsyncIteration
+            return world
+        finally:
+            self._is_running = False
+
+    def cancel(self) -> None:
+        """Stop the iteration after the iteration in progress. This method is
+        thread-safe."""
+        self._cancelled.set()
+
+    async def aclose(self) -> None:
+        """Stop the iteration and wait for the iteration in progress to finish, after
+        which the sampler is no longer in use."""
+        self.cancel()
+        self._is_done = True
+        if self._producer is not None:
+            self._producer.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._producer
+        if self._pending is not None:
+            with contextlib.suppress(Exception):
+                await self._pending
+            self._pending = None
+
+    async def __aenter__(self) -> AsyncSampler:
+        return self
+
+    async def __aexit__(
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc_val: Optional[BaseException],
+        exc_tb: Optional[TracebackType],
+    ) -> None:
+        await self.aclose()
+
+    def _next_world(self) -> Any:
+        if self._cancelled.is_set():
+            return _DONE
+        try:
+            return next(self.sampler)
+        except StopIteration:
+            return _DONE
+
+    async def _step(self) -> Any:
+        """Run the next iteration in the executor. If the caller is cancelled, the
+        iteration still completes and its world is returned by the next call."""
+        if self._pending is None:
+            loop = asyncio.get_running_loop()
+            self._pending = loop.run_in_executor(self.executor, self._next_world)
+        try:
+            # if the caller is cancelled, the iteration in progress is kept for the
+            # next call
+            world = await asyncio.shield(self._pending)
+        except Exception:
+            self._pending = None
+            raise
+        self._pending = None
+        return world
+
+    async def _get_prefetched(self) -> Any:
+        if self._producer is None:
+            self._queue = asyncio.Queue()
+            self._slots = asyncio.Semaphore(self.max_prefetch)
+            self._producer = asyncio.get_running_loop().create_task(self._produce())
+        assert self._queue is not None and self._slots is not None
+        item = await self._queue.get()
+        if item is not _DONE:
+            self._slots.release()
+        if isinstance(item, BaseException):
+            self._is_done = True
+            raise item
+        return item
+
+    async def _produce(self) -> None:
+        assert self._queue is not None and self._slots is not None
+        while True:
+            # wait for the consumer to catch up
+            await self._slots.acquire()
+            try:
+                world = await self._step()
+            except Exception as e:
+                await self._queue.put(e)
+                return
+            await self._queue.put(world)
+            if world is _DONE:
+                return
@@ -3,16 +3,29 @@
 # This source code is licensed under the MIT license found in the
 # LICENSE file in the root directory of this source tree.
 
+import contextlib
 import copy
+import threading
 import warnings
 from abc import ABCMeta, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
 from functools import partial
-from typing import List, Optional, Set, Tuple
+from typing import Any, Callable, Generator, Iterable, List, Optional, Set, Tuple, Union
 
 import torch
+from beanmachine.ppl.inference.chain_executor import ChainExecutor
+from beanmachine.ppl.inference.chain_rng import ChainRNG
 from beanmachine.ppl.inference.monte_carlo_samples import MonteCarloSamples
+from beanmachine.ppl.inference.posterior_moments import PosteriorMoments, RunningMoments
 from beanmachine.ppl.inference.proposer.base_proposer import BaseProposer
+from beanmachine.ppl.inference.proposer.hmc_utils import AdaptationChannel
+from beanmachine.ppl.inference.proposer_profiler import (
+    ProposerProfiler,
+    ProposerProfileReport,
+)
+from beanmachine.ppl.inference.sample_sink import SampleSink, SharedMemorySink
 from beanmachine.ppl.inference.sampler import Sampler
+from beanmachine.ppl.inference.stopping_rule import _StoppingChannel, StoppingRule
 from beanmachine.ppl.inference.utils import (
     _execute_in_new_thread,
     _verify_queries_and_observations,
@@ -20,7 +33,13 @@ from beanmachine.ppl.inference.utils import (
     VerboseLevel,
 )
 from beanmachine.ppl.model.rv_identifier import RVIdentifier
-from beanmachine.ppl.world import init_to_uniform, InitializeFn, RVDict, World
+from beanmachine.ppl.world import (
+    BatchedWorld,
+    init_to_uniform,
+    InitializeFn,
+    RVDict,
+    World,
+)
 from torch import multiprocessing as mp
 from tqdm.auto import tqdm
 from tqdm.notebook import tqdm as notebook_tqdm
@@ -34,6 +53,11 @@ class BaseInference(metaclass=ABCMeta):
 
     # maximum value of a seed
     _MAX_SEED_VAL: int = 2**32 - 1
+    # whether the proposers pool their adaptation statistics across the chains, in
+    # which case the chains have to run at the same time
+    pool_adaptation: bool = False
+    # the channel of the current chain to pool the adaptation statistics through
+    _adaptation_channel: Optional[AdaptationChannel] = None
 
     @abstractmethod
     def get_proposers(
@@ -65,10 +89,27 @@ class BaseInference(metaclass=ABCMeta):
         max_init_retries: int,
         chain_id: int,
         seed: Optional[int] = None,
-    ) -> Tuple[List[torch.Tensor], List[torch.Tensor]]:
+        static_structure: bool = False,
+        sample_sink: Optional[SampleSink] = None,
+        thin: int = 1,
+        accumulate: Literal["samples", "moments"] = "samples",
+        stopping_channel: Optional[_StoppingChannel] = None,
+        profile: bool = False,
+        adaptation_channel: Optional[AdaptationChannel] = None,
+    ) -> Tuple[
+        List[Union[torch.Tensor, RunningMoments, None]],
+        List[torch.Tensor],
+        Optional[ProposerProfileReport],
+    ]:
         """
         Run a single chain of inference. Return a list of samples (in the same order as
-        the queries) and a list of log likelihood on observations
+        the queries), a list of log likelihood on observations, and the profile of the
+        proposers if ``profile`` is True (or None otherwise). If
+        ``sample_sink`` is provided, the values are written in place into the buffers
+        of the sink at index ``chain_id`` and are returned as None (unless their shapes
+        do not match the buffers, in which case they are returned as usual). If
+        ``accumulate`` is "moments", the running moments of the (non-adaptive)
+        samples of each query are returned instead, without any log likelihood.
 
         Args:
             queries: A list of queries.
@@ -82,6 +123,86 @@ class BaseInference(metaclass=ABCMeta):
             chain_id: The index of the current chain.
             seed: If provided, the seed will be used to initialize the state of the
             random number generators for the current chain
+            static_structure: Whether the dependency structure of the model is fixed.
+            sample_sink: Optional sink whose buffers have been allocated for the
+                samples and the log likelihoods of all chains.
+            thin: Only keep every ``thin``-th sample.
+            accumulate: Whether to collect the "samples" or only their "moments".
+            stopping_channel: If provided, the chain synchronizes with the other
+                chains after every block of samples to decide whether to stop early.
+                This requires ``sample_sink``.
+            profile: Whether to profile the proposers (see ``ProposerProfiler``).
+            adaptation_channel: If provided, the proposers of the chain pool their
+                adaptation statistics with the other chains through the channel (see
+                ``pool_adaptation``).
+        """
+        chain = self._iter_chain(
+            queries,
+            observations,
+            num_samples,
+            num_adaptive_samples,
+            show_progress_bar,
+            initialize_fn,
+            max_init_retries,
+            chain_id,
+            seed,
+            static_structure,
+            sample_sink,
+            thin,
+            accumulate,
+            stopping_channel and stopping_channel.stopping_rule.block_size,
+            profile,
+            adaptation_channel,
+        )
+        try:
+            num_samples_collected = next(chain)
+            while True:
+                assert stopping_channel is not None and sample_sink is not None
+                stop = stopping_channel.should_stop(
+                    chain_id, num_samples_collected, sample_sink.samples
+                )
+                num_samples_collected = chain.send(stop)
+        except StopIteration as e:
+            return e.value
+        except BaseException:
+            if stopping_channel is not None:
+                stopping_channel.abort()
+            if adaptation_channel is not None:
+                adaptation_channel.abort()
+            raise
+
+    def _iter_chain(
+        self,
+        queries: List[RVIdentifier],
+        observations: RVDict,
+        num_samples: int,
+        num_adaptive_samples: int,
+        show_progress_bar: bool,
+        initialize_fn: InitializeFn,
+        max_init_retries: int,
+        chain_id: int,
+        seed: Optional[int] = None,
+        static_structure: bool = False,
+        sample_sink: Optional[SampleSink] = None,
+        thin: int = 1,
+        accumulate: Literal["samples", "moments"] = "samples",
+        block_size: Optional[int] = None,
+        profile: bool = False,
+        adaptation_channel: Optional[AdaptationChannel] = None,
+    ) -> Generator[
+        int,
+        Optional[bool],
+        Tuple[
+            List[Union[torch.Tensor, RunningMoments, None]],
+            List[torch.Tensor],
+            Optional[ProposerProfileReport],
+        ],
+    ]:
+        """
+        A generator version of ``_single_chain_infer``, which returns the results of
+        the chain when it is exhausted. If ``block_size`` is provided, the generator
+        yields the number of (non-adaptive) samples collected so far after every
+        ``block_size`` samples, and the chain stops early if True is sent back.
         """
         if seed is not None:
             set_seed(seed)
@@ -91,6 +212,7 @@ class BaseInference(metaclass=ABCMeta):
             if show_progress_bar and issubclass(tqdm, notebook_tqdm):
                 print(" ", end="", flush=True)
 
+        profiler = ProposerProfiler() if profile else None
         sampler = self.sampler(
             queries,
             observations,
@@ -98,20 +220,38 @@ class BaseInference(metaclass=ABCMeta):
             num_adaptive_samples,
             initialize_fn,
             max_init_retries,
+            static_structure,
+            thin=thin,
+            profiler=profiler,
+        )
+        if adaptation_channel is not None:
+            # the kernel is a copy that is only used by the current chain
+            sampler.kernel._adaptation_channel = adaptation_channel.for_chain(chain_id)
+        if accumulate == "moments":
+            samples = _MomentCollector(len(queries), num_adaptive_samples // thin)
+            # the log likelihoods are not needed for the moments of the queries
+            observations = {}
+        else:
+            samples = _SampleCollector(
+                len(queries), chain_id, sample_sink and sample_sink.samples
+            )
+        log_likelihoods = _SampleCollector(
+            len(observations), chain_id, sample_sink and sample_sink.log_likelihoods
         )
-        samples = [[] for _ in queries]
-        log_likelihoods = [[] for _ in observations]
+
+        num_adaptive_samples //= thin
+        num_samples_collected = -num_adaptive_samples
 
         # Main inference loop
         for world in tqdm(
             sampler,
-            total=num_samples + num_adaptive_samples,
+            total=num_samples // thin + num_adaptive_samples,
             desc="Samples collected",
             disable=not show_progress_bar,
             position=chain_id,
         ):
             for idx, obs in enumerate(observations):
-                log_likelihoods[idx].append(world.log_prob([obs]))
+                log_likelihoods.append(idx, world.log_prob([obs]))
             # Extract samples
             for idx, query in enumerate(queries):
                 raw_val = world.call(query)
@@ -119,11 +259,152 @@ class BaseInference(metaclass=ABCMeta):
                     raise TypeError(
                         "The value returned by a queried function must be a tensor."
                     )
-                samples[idx].append(raw_val)
+                samples.append(idx, raw_val)
 
-        samples = [torch.stack(val) for val in samples]
-        log_likelihoods = [torch.stack(val) for val in log_likelihoods]
-        return samples, log_likelihoods
+            num_samples_collected += 1
+            if (
+                block_size is not None
+                and num_samples_collected > 0
+                and num_samples_collected % block_size == 0
+            ):
+                if (yield num_samples_collected):
+                    break
+
+        return (
+            samples.collect(),
+            log_likelihoods.collect(),
+            profiler and profiler.to_report(),
+        )
+
+    def _allocate_sample_buffers(
+        self,
+        sample_sink: SampleSink,
+        queries: List[RVIdentifier],
+        observations: RVDict,
+        num_chains: int,
+        num_total_samples: int,
+        initialize_fn: InitializeFn,
+        max_init_retries: int,
+        static_structure: bool = False,
+    ) -> bool:
+        """
+        Preallocate the buffers of the sink that the chains write their samples into
+        (e.g. so that the samples of chains running in subprocesses do not need to be
+        pickled and sent back to the parent process). The shapes and dtypes of the
+        buffers are inferred from an initial world, which is drawn without consuming
+        the random number generators, so that the chains are the same with and
+        without a sink. Returns False (without allocating anything) if the queries do
+        not return tensors.
+        """
+        with torch.random.fork_rng(devices=[]):
+            world = World.initialize_world(
+                queries,
+                observations,
+                initialize_fn,
+                max_init_retries,
+                static_structure=static_structure,
+            )
+            values = [world.call(query) for query in queries]
+        if not all(isinstance(value, torch.Tensor) for value in values):
+            return False
+        log_likelihoods = [world.log_prob([obs]) for obs in observations]
+        sample_sink.allocate(
+            [(value.shape, value.dtype) for value in values],
+            [(value.shape, value.dtype) for value in log_likelihoods],
+            num_chains,
+            num_total_samples,
+        )
+        return True
+
+    def _batched_chain_infer(
+        self,
+        queries: List[RVIdentifier],
+        observations: RVDict,
+        num_samples: int,
+        num_adaptive_samples: int,
+        show_progress_bar: bool,
+        initialize_fn: InitializeFn,
+        max_init_retries: int,
+        num_chains: int,
+        static_structure: bool = False,
+        thin: int = 1,
+        accumulate: Literal["samples", "moments"] = "samples",
+        profile: bool = False,
+    ) -> List[
+        Tuple[
+            List[Union[torch.Tensor, RunningMoments]],
+            List[torch.Tensor],
+            Optional[ProposerProfileReport],
+        ]
+    ]:
+        """
+        Run all of the chains at once in a single ``BatchedWorld``. Return a list of
+        samples and log likelihoods (in the same format as ``_single_chain_infer``)
+        for each chain. If ``accumulate`` is "moments", a single result with the
+        running moments of all chains (along a leading chain dimension) is returned.
+        The profile of the proposers, which covers all of the chains, is returned with
+        the first result.
+        """
+        profiler = ProposerProfiler() if profile else None
+        sampler = self.sampler(
+            queries,
+            observations,
+            num_samples,
+            num_adaptive_samples,
+            initialize_fn,
+            max_init_retries,
+            static_structure,
+            num_chains=num_chains,
+            thin=thin,
+            profiler=profiler,
+        )
+        if accumulate == "moments":
+            moments = _MomentCollector(len(queries), num_adaptive_samples // thin)
+            observations = {}
+        samples = [[] for _ in queries]
+        log_likelihoods = [[] for _ in observations]
+        batched = None
+
+        for world in tqdm(
+            sampler,
+            total=num_samples // thin + num_adaptive_samples // thin,
+            desc="Samples collected",
+            disable=not show_progress_bar,
+        ):
+            for idx, obs in enumerate(observations):
+                log_likelihoods[idx].append(world.log_prob([obs]))
+            if batched is None:
+                # the model has no control flow that depends on the values, so the
+                # queries that depend on latent variables are the same in all worlds
+                batched = [world.is_batched(query) for query in queries]
+            for idx, query in enumerate(queries):
+                raw_val = world.call(query)
+                if not isinstance(raw_val, torch.Tensor):
+                    raise TypeError(
+                        "The value returned by a queried function must be a tensor."
+                    )
+                if not batched[idx]:
+                    # e.g. a functional that does not depend on any latent variables
+                    raw_val = raw_val.expand((num_chains,) + raw_val.shape)
+                if accumulate == "moments":
+                    moments.append(idx, raw_val)
+                else:
+                    samples[idx].append(raw_val)
+
+        report = profiler and profiler.to_report()
+        if accumulate == "moments":
+            return [(moments.collect(), [], report)]
+        # move the chain dimension to the front and split the chains
+        samples = [torch.stack(val, dim=1) for val in samples]
+        log_likelihoods = [torch.stack(val, dim=1) for val in log_likelihoods]
+        return [
+            (
+                [val[chain] for val in samples],
+                [val[chain] for val in log_likelihoods],
+                report if chain == 0 else None,
+            )
+            for chain in range(num_chains)
+        ]
 
     def infer(
         self,
@@ -138,7 +419,16 @@ class BaseInference(metaclass=ABCMeta):
         run_in_parallel: bool = False,
         mp_context: Optional[Literal["fork", "spawn", "forkserver"]] = None,
         verbose: Optional[VerboseLevel] = None,
-    ) -> MonteCarloSamples:
+        static_structure: bool = False,
+        batch_chains: bool = False,
+        sample_sink: Optional[SampleSink] = None,
+        thin: int = 1,
+        accumulate: Literal["samples", "moments"] = "samples",
+        chain_executor: Optional[ChainExecutor] = None,
+        stopping_rule: Optional[StoppingRule] = None,
+        profile: bool = False,
+        run_in_threads: bool = False,
+    ) -> Union[MonteCarloSamples, PosteriorMoments]:
         """
         Performs inference and returns a ``MonteCarloSamples`` object with samples from the posterior.
 
@@ -161,6 +451,48 @@ class BaseInference(metaclass=ABCMeta):
                 to used for parallel inference.
             verbose: (Deprecated) Whether to display the progress bar. This option
                 is deprecated, please use ``show_progress_bar`` instead.
+            static_structure: Whether the dependency structure of the model is fixed,
+                i.e. the parents of every random variable do not depend on the values
+                of other random variables. If True, the parent and children sets are
+                traced once during initialization and reused for all of the
+                subsequent iterations (defaults to False).
+            batch_chains: Whether to run all of the chains at once in a single
+                process, where the values of all chains are stored along a leading
+                batch dimension (see ``BatchedWorld``). This requires the model to
+                broadcast over the chain dimension. Defaults to False.
+            sample_sink: Where the samples are written into as the chains run (e.g.
+                an ``NpyFileSink`` to stream them into memory-mapped files), in
+                which case the returned ``MonteCarloSamples`` reads from the sink.
+                Defaults to a ``SharedMemorySink`` if ``run_in_parallel`` is True and
+                to collecting the samples in memory otherwise.
+            thin: Only keep every ``thin``-th sample (of the adaptation and of the
+                sampling phases), so that ``num_samples // thin`` samples are
+                returned for each chain. Defaults to 1.
+            accumulate: If "moments", only the running means and variances of the
+                queries (excluding the adaptive samples) are kept, and a
+                ``PosteriorMoments`` summary is returned instead of the samples, whose
+                memory usage does not grow with ``num_samples``. Defaults to
+                "samples".
+            chain_executor: If provided, the chains are run in parallel in the
+                persistent worker processes of the executor (instead of in a new pool
+                of processes), which can be shared by many calls to ``infer``.
+            stopping_rule: If provided, ``num_samples`` is the maximum number of
+                samples, and all chains stop early once the diagnostics of their
+                samples satisfy the rule (see ``StoppingRule``). The samples are
+                collected in a ``sample_sink`` (a ``SharedMemorySink`` by default)
+                so that the diagnostics can be computed across chains.
+            profile: Whether to record the time spent by each proposer (see
+                ``ProposerProfiler``), in which case the report of all chains is
+                returned as the ``profile_report`` of the result. Defaults to False.
+            run_in_threads: Whether to run the chains in parallel in threads of the
+                current process, where each chain draws from its own random number
+                generators (see ``ChainRNG``). This avoids the startup and memory
+                costs of processes, and is the most effective when the model is
+                dominated by large tensor operations (which release the GIL).
+                The chains of an inference that pools its adaptation statistics
+                across the chains (e.g. ``GlobalNoUTurnSampler(pool_adaptation=True)``)
+                always run in threads unless run_in_parallel or batch_chains is
+                True. Defaults to False.
         """
         if verbose is not None:
             warnings.warn(
@@ -177,6 +509,72 @@ class BaseInference(metaclass=ABCMeta):
         )
         if num_adaptive_samples is None:
             num_adaptive_samples = self._get_default_num_adaptive_samples(num_samples)
+        pool_adaptation = self.pool_adaptation and num_chains > 1 and not batch_chains
+        _check_infer_options(
+            num_samples,
+            num_chains,
+            run_in_parallel,
+            batch_chains,
+            sample_sink,
+            thin,
+            accumulate,
+            chain_executor,
+            stopping_rule,
+            run_in_threads,
+            pool_adaptation,
+        )
+        if chain_executor is not None:
+            run_in_parallel = True
+        if stopping_rule is not None and sample_sink is None:
+            sample_sink = SharedMemorySink()
+
+        if batch_chains:
+            chain_results = self._batched_chain_infer(
+                queries,
+                observations,
+                num_samples,
+                num_adaptive_samples,
+                show_progress_bar,
+                initialize_fn,
+                max_init_retries,
+                num_chains,
+                static_structure,
+                thin,
+                accumulate,
+                profile,
+            )
+            if accumulate == "moments":
+                ((moments, _, _),) = chain_results
+                results = PosteriorMoments(
+                    dict(zip(queries, moments)), num_adaptive_samples // thin
+                )
+            else:
+                results = _to_monte_carlo_samples(
+                    chain_results, queries, observations, num_adaptive_samples // thin
+                )
+            results.profile_report = _merge_profile_reports(chain_results)
+            return results
+
+        if run_in_parallel:
+            if sample_sink is None and accumulate == "samples":
+                # the subprocesses write their samples into shared memory in place,
+                # so that collecting the results does not copy them
+                sample_sink = SharedMemorySink()
+        if sample_sink is not None and not self._allocate_sample_buffers(
+            sample_sink,
+            queries,
+            observations,
+            num_chains,
+            num_samples // thin + num_adaptive_samples // thin,
+            initialize_fn,
+            max_init_retries,
+            static_structure,
+        ):
+            sample_sink = None
+            if stopping_rule is not None:
+                raise TypeError(
+                    "The value returned by a queried function must be a tensor."
+                )
 
         single_chain_infer = partial(
             self._single_chain_infer,
@@ -187,11 +585,58 @@ class BaseInference(metaclass=ABCMeta):
             show_progress_bar,
             initialize_fn,
             max_init_retries,
+            static_structure=static_structure,
+            thin=thin,
+            accumulate=accumulate,
+            profile=profile,
         )
-        if not run_in_parallel:
-            chain_results = map(single_chain_infer, range(num_chains))
-        else:
-            ctx = mp.get_context(mp_context)
+        chain_results, num_samples_collected = self._run_chains(
+            single_chain_infer,
+            num_chains,
+            num_samples // thin,
+            num_adaptive_samples // thin,
+            run_in_parallel,
+            run_in_threads,
+            mp_context,
+            chain_executor,
+            sample_sink,
+            stopping_rule,
+            pool_adaptation,
+        )
+        return _collect_results(
+            chain_results,
+            queries,
+            observations,
+            num_adaptive_samples // thin,
+            num_samples_collected,
+            accumulate,
+            sample_sink,
+        )
+
+    def _run_chains(
+        self,
+        single_chain_infer: Callable,
+        num_chains: int,
+        num_samples: int,
+        num_adaptive_samples: int,
+        run_in_parallel: bool,
+        run_in_threads: bool,
+        mp_context: Optional[Literal["fork", "spawn", "forkserver"]],
+        chain_executor: Optional[ChainExecutor],
+        sample_sink: Optional[SampleSink],
+        stopping_rule: Optional[StoppingRule],
+        pool_adaptation: bool,
+    ) -> Tuple[List[Any], int]:
+        """Run ``single_chain_infer`` (a partial ``_single_chain_infer``) for every
+        chain, in threads, in processes, or one after another in the current thread.
+        Return the results of the chains and the number of (thinned, non-adaptive)
+        samples collected by each chain, which is ``num_samples`` unless the chains
+        stopped early. The sink is closed once all of the chains have finished."""
+        if pool_adaptation and not run_in_parallel:
+            # the chains exchange their adaptation statistics while they run, so
+            # they are interleaved in threads instead of running one after another
+            run_in_threads = True
+        if run_in_parallel or run_in_threads:
             # We'd like to explicitly set a different seed for each process to avoid
             # duplicating the same RNG state for all chains
             first_seed = torch.randint(self._MAX_SEED_VAL, ()).item()
@@ -199,33 +644,189 @@ class BaseInference(metaclass=ABCMeta):
                 (first_seed + 31 * chain_id) % self._MAX_SEED_VAL
                 for chain_id in range(num_chains)
             ]
-            # run single chain inference in a new thread in subprocesses to avoid
-            # forking corrupted internal states
-            # (https://github.com/pytorch/pytorch/issues/17199)
-            single_chain_infer = partial(_execute_in_new_thread, single_chain_infer)
-
-            with ctx.Pool(
-                processes=num_chains, initializer=tqdm.set_lock, initargs=(ctx.Lock(),)
-            ) as p:
-                chain_results = p.starmap(single_chain_infer, enumerate(seeds))
-
-        all_samples, all_log_liklihoods = zip(*chain_results)
-        # the hash of RVIdentifier can change when it is being sent to another process,
-        # so we have to rely on the order of the returned list to determine which samples
-        # correspond to which RVIdentifier
-        all_samples = [dict(zip(queries, samples)) for samples in all_samples]
-        # in python the order of keys in a dict is fixed, so we can rely on it
-        all_log_liklihoods = [
-            dict(zip(observations.keys(), log_likelihoods))
-            for log_likelihoods in all_log_liklihoods
+        try:
+            if run_in_threads:
+                return self._run_chains_in_threads(
+                    single_chain_infer,
+                    seeds,
+                    sample_sink,
+                    stopping_rule,
+                    pool_adaptation,
+                    num_adaptive_samples,
+                    num_samples,
+                )
+            if run_in_parallel:
+                return self._run_chains_in_processes(
+                    single_chain_infer,
+                    seeds,
+                    mp_context,
+                    chain_executor,
+                    sample_sink,
+                    stopping_rule,
+                    pool_adaptation,
+                    num_adaptive_samples,
+                    num_samples,
+                )
+            if stopping_rule is not None:
+                assert sample_sink is not None
+                return self._run_chains_in_lockstep(
+                    single_chain_infer,
+                    num_chains,
+                    sample_sink,
+                    stopping_rule,
+                    num_adaptive_samples,
+                    num_samples,
+                )
+            chain_results = [
+                single_chain_infer(chain_id, sample_sink=sample_sink)
+                for chain_id in range(num_chains)
+            ]
+            return chain_results, num_samples
+        finally:
+            if sample_sink is not None:
+                sample_sink.close()
+
+    def _run_chains_in_lockstep(
+        self,
+        single_chain_infer: partial,
+        num_chains: int,
+        sample_sink: SampleSink,
+        stopping_rule: StoppingRule,
+        num_adaptive_samples: int,
+        num_samples: int,
+    ) -> Tuple[List[Any], int]:
+        """Run the chains one after another in the current thread, one block of
+        samples at a time, until all of them stop (see ``_run_in_lockstep``). Return
+        the results of the chains and the number of samples collected by each chain.
+        """
+        # the chains are iterated with the same arguments as single_chain_infer
+        chains = [
+            self._iter_chain(
+                *single_chain_infer.args,
+                chain_id,
+                **single_chain_infer.keywords,
+                sample_sink=sample_sink,
+                block_size=stopping_rule.block_size,
+            )
+            for chain_id in range(num_chains)
         ]
+        return _run_in_lockstep(
+            chains,
+            partial(
+                stopping_rule.is_converged_on_buffers,
+                sample_sink.samples,
+                num_adaptive_samples,
+            ),
+            num_samples,
+        )
 
-        return MonteCarloSamples(
-            all_samples,
+    def _run_chains_in_threads(
+        self,
+        single_chain_infer: Callable,
+        seeds: List[int],
+        sample_sink: Optional[SampleSink],
+        stopping_rule: Optional[StoppingRule],
+        pool_adaptation: bool,
+        num_adaptive_samples: int,
+        num_samples: int,
+    ) -> Tuple[List[Any], int]:
+        """Run ``single_chain_infer`` for every chain in a thread of the current
+        process, where each chain draws from its own random number generators seeded
+        with the seeds in ``seeds``. Return the results of the chains and the number
+        of samples collected by each chain, which is ``num_samples`` unless the chains
+        stopped early."""
+        num_chains = len(seeds)
+        stopping_channel, adaptation_channel = _create_channels(
+            threading.Barrier,
+            dict,
+            num_chains,
+            stopping_rule,
+            pool_adaptation,
             num_adaptive_samples,
-            all_log_liklihoods,
-            observations,
         )
+        with ThreadPoolExecutor(max_workers=num_chains) as executor:
+            futures = [
+                executor.submit(
+                    _run_with_chain_rng,
+                    single_chain_infer,
+                    chain_id,
+                    seed,
+                    sample_sink=sample_sink,
+                    stopping_channel=stopping_channel,
+                    adaptation_channel=adaptation_channel,
+                )
+                for chain_id, seed in enumerate(seeds)
+            ]
+            chain_results = [future.result() for future in futures]
+        if stopping_channel is not None:
+            num_samples = stopping_channel.state.get("num_samples", num_samples)
+        return chain_results, num_samples
+
+    def _run_chains_in_processes(
+        self,
+        single_chain_infer: partial,
+        seeds: List[int],
+        mp_context: Optional[Literal["fork", "spawn", "forkserver"]],
+        chain_executor: Optional[ChainExecutor],
+        sample_sink: Optional[SampleSink],
+        stopping_rule: Optional[StoppingRule],
+        pool_adaptation: bool,
+        num_adaptive_samples: int,
+        num_samples: int,
+    ) -> Tuple[List[Any], int]:
+        """Run ``single_chain_infer`` for every chain (with the seeds in ``seeds``) in
+        the worker processes of ``chain_executor`` or in a new pool of processes.
+        Return the results of the chains and the number of samples collected by each
+        chain, which is ``num_samples`` unless the chains stopped early."""
+        num_chains = len(seeds)
+        with contextlib.ExitStack() as stack:
+            stopping_channel = adaptation_channel = None
+            if stopping_rule is not None or pool_adaptation:
+                # the chains share their decisions to stop and their adaptation
+                # statistics through a manager
+                manager = stack.enter_context(mp.get_context(mp_context).Manager())
+                stopping_channel, adaptation_channel = _create_channels(
+                    manager.Barrier,
+                    manager.dict,
+                    num_chains,
+                    stopping_rule,
+                    pool_adaptation,
+                    num_adaptive_samples,
+                )
+            if chain_executor is not None:
+                # the workers cache the inference bound to the queries, while the
+                # observations and the buffers are passed separately from the job,
+                # so that refitting the model to new data reuses the cached job
+                queries, *args = single_chain_infer.args
+                chain_results = chain_executor.run_chains(
+                    partial(single_chain_infer.func, queries),
+                    [(*args, chain_id, seed) for chain_id, seed in enumerate(seeds)],
+                    **single_chain_infer.keywords,
+                    sample_sink=sample_sink,
+                    stopping_channel=stopping_channel,
+                    adaptation_channel=adaptation_channel,
+                )
+            else:
+                single_chain_infer = partial(
+                    single_chain_infer,
+                    sample_sink=sample_sink,
+                    stopping_channel=stopping_channel,
+                    adaptation_channel=adaptation_channel,
+                )
+                ctx = mp.get_context(mp_context)
+                # run single chain inference in a new thread in subprocesses to avoid
+                # forking corrupted internal states
+                # (https://github.com/pytorch/pytorch/issues/17199)
+                single_chain_infer = partial(_execute_in_new_thread, single_chain_infer)
+                with ctx.Pool(
+                    processes=num_chains,
+                    initializer=tqdm.set_lock,
+                    initargs=(ctx.Lock(),),
+                ) as p:
+                    chain_results = p.starmap(single_chain_infer, enumerate(seeds))
+            if stopping_channel is not None:
+                num_samples = stopping_channel.state.get("num_samples", num_samples)
+        return chain_results, num_samples
 
     def sampler(
         self,
@@ -235,6 +836,10 @@ class BaseInference(metaclass=ABCMeta):
         num_adaptive_samples: Optional[int] = None,
         initialize_fn: InitializeFn = init_to_uniform,
         max_init_retries: int = 100,
+        static_structure: bool = False,
+        num_chains: Optional[int] = None,
+        thin: int = 1,
+        profiler: Optional[ProposerProfiler] = None,
     ) -> Sampler:
         """
         Returns a generator that returns a new world (represents a new state of the
@@ -253,6 +858,15 @@ class BaseInference(metaclass=ABCMeta):
                 the support of the distribution.
             max_init_retries: The number of attempts to make to initialize values for an
                 inference before throwing an error (default to 100).
+            static_structure: Whether the dependency structure of the model is fixed
+                (defaults to False). See ``World`` for details.
+            num_chains: If provided, the sampler will run ``num_chains`` chains at
+                once, where each world is a ``BatchedWorld`` that holds the values of
+                all chains along a leading batch dimension.
+            thin: Only return every ``thin``-th world (of the adaptation and of the
+                sampling phases), defaults to 1.
+            profiler: If provided, every proposal made by the sampler is recorded by
+                the profiler.
         """
         _verify_queries_and_observations(
             queries, observations, observations_must_be_rv=True
@@ -265,14 +879,325 @@ class BaseInference(metaclass=ABCMeta):
                     num_samples
                 )
 
-        world = World.initialize_world(
-            queries,
-            observations,
-            initialize_fn,
-            max_init_retries,
-        )
+        if num_chains is None:
+            world = World.initialize_world(
+                queries,
+                observations,
+                initialize_fn,
+                max_init_retries,
+                static_structure=static_structure,
+            )
+        else:
+            world = BatchedWorld.initialize_world(
+                queries,
+                observations,
+                initialize_fn,
+                max_init_retries,
+                static_structure=static_structure,
+                num_chains=num_chains,
+            )
         # start inference with a copy of self to ensure that multi-chain or multi
         # inference runs all start with the same pristine state
         kernel = copy.deepcopy(self)
-        sampler = Sampler(kernel, world, num_samples, num_adaptive_samples)
+        sampler = Sampler(
+            kernel, world, num_samples, num_adaptive_samples, thin, profiler
+        )
         return sampler
+
+
+def _to_monte_carlo_samples(
+    chain_results: Iterable[Tuple[List[torch.Tensor], List[torch.Tensor], Any]],
+    queries: List[RVIdentifier],
+    observations: RVDict,
+    num_adaptive_samples: int,
+) -> MonteCarloSamples:
+    all_samples, all_log_liklihoods, _ = zip(*chain_results)
+    # the hash of RVIdentifier can change when it is being sent to another process,
+    # so we have to rely on the order of the returned list to determine which samples
+    # correspond to which RVIdentifier
+    all_samples = [dict(zip(queries, samples)) for samples in all_samples]
+    # in python the order of keys in a dict is fixed, so we can rely on it
+    all_log_liklihoods = [
+        dict(zip(observations.keys(), log_likelihoods))
+        for log_likelihoods in all_log_liklihoods
+    ]
+
+    return MonteCarloSamples(
+        all_samples,
+        num_adaptive_samples,
+        all_log_liklihoods,
+        observations,
+    )
+
+
+def _check_infer_options(
+    num_samples: int,
+    num_chains: int,
+    run_in_parallel: bool,
+    batch_chains: bool,
+    sample_sink: Optional[SampleSink],
+    thin: int,
+    accumulate: Literal["samples", "moments"],
+    chain_executor: Optional[ChainExecutor],
+    stopping_rule: Optional[StoppingRule],
+    run_in_threads: bool,
+    pool_adaptation: bool,
+) -> None:
+    """Raises a ValueError if the options of ``BaseInference.infer`` conflict."""
+    if thin < 1:
+        raise ValueError(f"thin should be a positive integer, but got {thin}.")
+    if accumulate not in ("samples", "moments"):
+        raise ValueError(
+            f'accumulate should be "samples" or "moments", but got {accumulate}.'
+        )
+    if accumulate == "moments" and sample_sink is not None:
+        raise ValueError('A sample_sink cannot be used with accumulate="moments".')
+    if accumulate == "moments" and num_samples // thin < 1:
+        # the moments of no samples are undefined
+        raise ValueError(
+            'accumulate="moments" requires at least one sample to be kept, but got'
+            f" num_samples={num_samples} and thin={thin}."
+        )
+    if run_in_threads and (run_in_parallel or chain_executor is not None):
+        raise ValueError(
+            "run_in_threads cannot be used with run_in_parallel or a chain_executor."
+        )
+    if (
+        chain_executor is not None
+        and (stopping_rule is not None or pool_adaptation)
+        and chain_executor.num_workers < num_chains
+    ):
+        raise ValueError(
+            "A stopping_rule or pool_adaptation requires all chains to run at"
+            " the same time, but the chain_executor only has"
+            f" {chain_executor.num_workers} workers for {num_chains} chains."
+        )
+    if stopping_rule is not None and (batch_chains or accumulate == "moments"):
+        raise ValueError(
+            "A stopping_rule cannot be used with batch_chains or"
+            ' accumulate="moments".'
+        )
+    if batch_chains:
+        if run_in_parallel or run_in_threads or chain_executor is not None:
+            raise ValueError(
+                "batch_chains cannot be used with run_in_parallel,"
+                " run_in_threads, or a chain_executor."
+            )
+        if sample_sink is not None:
+            raise ValueError("batch_chains does not support a sample_sink.")
+
+
+def _collect_results(
+    chain_results: List[Tuple[List[Any], List[Any], Optional[ProposerProfileReport]]],
+    queries: List[RVIdentifier],
+    observations: RVDict,
+    num_adaptive_samples: int,
+    num_samples: int,
+    accumulate: Literal["samples", "moments"],
+    sample_sink: Optional[SampleSink],
+) -> Union[MonteCarloSamples, PosteriorMoments]:
+    """Combines the results of the chains (see ``BaseInference._single_chain_infer``)
+    into the result of ``BaseInference.infer``, where each chain collected
+    ``num_samples`` samples after the adaptive ones."""
+    if accumulate == "moments":
+        results = PosteriorMoments(
+            {
+                query: RunningMoments.stack(
+                    [moments[idx] for moments, _, _ in chain_results]
+                )
+                for idx, query in enumerate(queries)
+            },
+            num_adaptive_samples,
+        )
+    elif sample_sink is not None:
+        results = _sample_sink_to_monte_carlo_samples(
+            sample_sink,
+            chain_results,
+            queries,
+            observations,
+            num_adaptive_samples,
+            num_samples,
+        )
+    else:
+        results = _to_monte_carlo_samples(
+            chain_results, queries, observations, num_adaptive_samples
+        )
+    results.profile_report = _merge_profile_reports(chain_results)
+    return results
+
+
+def _sample_sink_to_monte_carlo_samples(
+    sample_sink: SampleSink,
+    chain_results: List[Tuple[List[Any], List[Any], Any]],
+    queries: List[RVIdentifier],
+    observations: RVDict,
+    num_adaptive_samples: int,
+    num_samples: int,
+) -> MonteCarloSamples:
+    """Returns the samples in the buffers of the sink (and the ones that did not fit
+    in the buffers, which are returned by the chains instead), where each chain
+    collected ``num_samples`` samples after the adaptive ones."""
+    # drop the unused tail of the buffers if the chains stopped early
+    num_kept = num_adaptive_samples + num_samples
+    sample_buffers = [buffer[:, :num_kept] for buffer in sample_sink.samples]
+    log_likelihood_buffers = [
+        buffer[:, :num_kept] for buffer in sample_sink.log_likelihoods
+    ]
+    if all(
+        val is None
+        for samples, log_likelihoods, _ in chain_results
+        for val in samples + log_likelihoods
+    ):
+        # all of the samples are in the buffers, which are used without copying
+        return MonteCarloSamples(
+            dict(zip(queries, sample_buffers)),
+            num_adaptive_samples,
+            dict(zip(observations.keys(), log_likelihood_buffers)),
+            observations,
+        )
+    return _to_monte_carlo_samples(
+        [
+            (
+                _fill_from_buffers(samples, sample_buffers, chain_id),
+                _fill_from_buffers(log_likelihoods, log_likelihood_buffers, chain_id),
+                report,
+            )
+            for chain_id, (samples, log_likelihoods, report) in enumerate(chain_results)
+        ],
+        queries,
+        observations,
+        num_adaptive_samples,
+    )
+
+
+def _merge_profile_reports(
+    chain_results: Iterable[Tuple[Any, Any, Optional[ProposerProfileReport]]]
+) -> Optional[ProposerProfileReport]:
+    reports = [report for _, _, report in chain_results if report is not None]
+    return ProposerProfileReport.merge(reports) if reports else None
+
+
+def _create_channels(
+    barrier_factory: Callable[[int], Any],
+    state_factory: Callable[[], Any],
+    num_chains: int,
+    stopping_rule: Optional[StoppingRule],
+    pool_adaptation: bool,
+    num_adaptive_samples: int,
+) -> Tuple[Optional[_StoppingChannel], Optional[AdaptationChannel]]:
+    """Create the channels through which the chains share their decisions to stop
+    (if ``stopping_rule`` is provided) and their adaptation statistics (if
+    ``pool_adaptation`` is True), from barriers and shared dicts created by the
+    factories (e.g. of the threading module or of a multiprocessing manager)."""
+    stopping_channel = None
+    if stopping_rule is not None:
+        stopping_channel = _StoppingChannel(
+            barrier_factory(num_chains),
+            state_factory(),
+            stopping_rule,
+            num_adaptive_samples,
+        )
+    adaptation_channel = None
+    if pool_adaptation:
+        adaptation_channel = AdaptationChannel(
+            barrier_factory(num_chains), state_factory()
+        )
+    return stopping_channel, adaptation_channel
+
+
+def _run_with_chain_rng(
+    single_chain_infer: Callable, chain_id: int, seed: int, **kwargs
+) -> Any:
+    """Run a chain in the current thread, where it draws from its own random number
+    generators seeded with ``seed`` (instead of re-seeding the global ones)."""
+    with ChainRNG(seed):
+        return single_chain_infer(chain_id, **kwargs)
+
+
+def _run_in_lockstep(
+    chains: List[Generator[int, Optional[bool], Any]],
+    should_stop: Callable[[int], bool],
+    num_samples: int,
+) -> Tuple[List[Any], int]:
+    """Run the chains (see ``BaseInference._iter_chain``) one block at a time, and
+    stop all of them once ``should_stop`` returns True for the number of samples
+    collected so far. Return the results of the chains and the number of samples
+    collected by each chain."""
+    results = [None] * len(chains)
+    stop = None
+    while True:
+        num_samples_collected = None
+        for chain_id, chain in enumerate(chains):
+            try:
+                num_samples_collected = chain.send(stop)
+            except StopIteration as e:
+                results[chain_id] = e.value
+        if num_samples_collected is None:
+            return results, num_samples
+        stop = should_stop(num_samples_collected)
+        if stop:
+            num_samples = num_samples_collected
+
+
+class _SampleCollector:
+    """Collects the values of a chain, either by writing them in place into
+    preallocated buffers at index ``chain_id``, or by appending them to lists that
+    are stacked at the end."""
+
+    def __init__(
+        self, num_values: int, chain_id: int, buffers: Optional[List[torch.Tensor]]
+    ) -> None:
+        self.chain_id = chain_id
+        self.buffers: List[Optional[torch.Tensor]] = (
+            list(buffers) if buffers else [None] * num_values
+        )
+        self.values: List[List[torch.Tensor]] = [[] for _ in range(num_values)]
+        self.num_written = [0] * num_values
+
+    def append(self, idx: int, value: torch.Tensor) -> None:
+        buffer = self.buffers[idx]
+        if buffer is not None:
+            step = self.num_written[idx]
+            if buffer.shape[2:] == value.shape and buffer.dtype == value.dtype:
+                buffer[self.chain_id, step].copy_(value.detach())
+                self.num_written[idx] += 1
+                return
+            # e.g. the shape of a query changes between iterations, so fall back to
+            # collecting the values in a list
+            self.values[idx].extend(buffer[self.chain_id, :step].clone())
+            self.buffers[idx] = None
+        self.values[idx].append(value)
+
+    def collect(self) -> List[Optional[torch.Tensor]]:
+        return [
+            None if buffer is not None else torch.stack(values)
+            for buffer, values in zip(self.buffers, self.values)
+        ]
+
+
+class _MomentCollector:
+    """Accumulates the running moments of the values of a chain, skipping the first
+    ``num_adaptive_samples`` values."""
+
+    def __init__(self, num_values: int, num_adaptive_samples: int) -> None:
+        self.moments = [RunningMoments() for _ in range(num_values)]
+        self.num_skipped = [0] * num_values
+        self.num_adaptive_samples = num_adaptive_samples
+
+    def append(self, idx: int, value: torch.Tensor) -> None:
+        if self.num_skipped[idx] < self.num_adaptive_samples:
+            self.num_skipped[idx] += 1
+        else:
+            self.moments[idx].update(value)
+
+    def collect(self) -> List[RunningMoments]:
+        return self.moments
+
+
+def _fill_from_buffers(
+    values: List[Optional[torch.Tensor]], buffers: List[torch.Tensor], chain_id: int
+) -> List[torch.Tensor]:
+    return [
+        buffer[chain_id] if value is None else value
+        for value, buffer in zip(values, buffers)
+    ]
@@ -0,0 +1,152 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+from __future__ import annotations
+
+import hashlib
+import importlib
+import pickle
+from collections import OrderedDict
+from functools import partial
+from types import TracebackType
+from typing import Any, Callable, Iterable, List, Optional, Tuple, Type
+
+from beanmachine.ppl.inference.utils import _execute_in_new_thread
+from torch import multiprocessing as mp
+from tqdm.auto import tqdm
+from typing_extensions import Literal
+
+
+# jobs (e.g. an inference method bound to a model and its queries) that have been
+# unpickled by the current worker process, keyed by the hash of their pickled bytes
+_JOB_CACHE: "OrderedDict[str, Callable]" = OrderedDict()
+_JOB_CACHE_SIZE = 8
+
+
+class _CacheMiss:
+    """Returned by a worker that was sent the key of a job it has not cached."""
+
+
+class ChainExecutor:
+    """
+    A long-lived pool of worker processes for running chains in parallel, which can
+    be passed to ``infer`` to reuse the same warm workers across many calls instead
+    of starting a new pool for each call. The workers import ``beanmachine`` when they
+    start, and cache the most recently used models (together with their queries), so
+    that a repeated call, e.g. with new observations, does not need to send and
+    unpickle them again.
+
+    Example::
+
+        with ChainExecutor(num_workers=4) as executor:
+            for data in dataset:
+                samples = bm.GlobalNoUTurnSampler().infer(
+                    queries, {obs(): data}, 1000, chain_executor=executor
+                )
+
+    Args:
+        num_workers: Number of worker processes.
+        mp_context: The multiprocessing context used to start the workers.
+        preload_modules: Modules to import in the workers when they start (e.g. the
+            modules that define the models). Defaults to ``["beanmachine.ppl"]``.
+        job_cache_size: Maximum number of models cached by each worker.
+    """
+
+    def __init__(
+        self,
+        num_workers: int,
+        mp_context: Optional[Literal["fork", "spawn", "forkserver"]] = None,
+        preload_modules: Iterable[str] = ("beanmachine.ppl",),
+        job_cache_size: int = 8,
+    ) -> None:
+        self.num_workers = num_workers
+        ctx = mp.get_context(mp_context)
+        self._pool = ctx.Pool(
+            processes=num_workers,
+            initializer=_initialize_worker,
+            initargs=(ctx.Lock(), list(preload_modules), job_cache_size),
+        )
+
+    def run_chains(
+        self, job: Callable, args_list: List[Tuple], **kwargs: Any
+    ) -> List[Any]:
+        """
+        Calls ``job(*args, **kwargs)`` in the workers for each ``args`` in
+        ``args_list`` and returns the results in order. Only the key of the job is
+        sent at first, and the pickled job is sent to the workers that have not
+        cached it yet, while the arguments are sent separately for each chain.
+        """
+        if self._pool is None:
+            raise ValueError("The ChainExecutor has been closed.")
+        payload = pickle.dumps(job)
+        key = hashlib.sha1(payload).hexdigest()
+        retries = {}
+
+        def resend_on_miss(chain: int, result: Any) -> None:
+            # called by the result handler of the pool as soon as a worker returns,
+            # so that the other chains (which may be waiting for this one at a
+            # barrier) do not wait for the results to be collected in order
+            if isinstance(result, _CacheMiss):
+                retries[chain] = self._pool.apply_async(
+                    _run_job, (key, payload, args_list[chain], kwargs)
+                )
+
+        pending = [
+            self._pool.apply_async(
+                _run_job,
+                (key, None, args, kwargs),
+                callback=partial(resend_on_miss, chain),
+            )
+            for chain, args in enumerate(args_list)
+        ]
+        results = []
+        for chain, result in enumerate(pending):
+            result = result.get()
+            if isinstance(result, _CacheMiss):
+                result = retries[chain].get()
+            results.append(result)
+        return results
+
+    def close(self) -> None:
+        """Shut down the worker processes."""
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+
+    def __enter__(self) -> ChainExecutor:
+        return self
+
+    def __exit__(
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc_val: Optional[BaseException],
+        exc_tb: Optional[TracebackType],
+    ) -> None:
+        self.close()
+
+
+def _initialize_worker(lock, preload_modules: List[str], job_cache_size: int) -> None:
+    global _JOB_CACHE_SIZE
+    tqdm.set_lock(lock)
+    for module in preload_modules:
+        importlib.import_module(module)
+    _JOB_CACHE_SIZE = job_cache_size
+
+
+def _run_job(key: str, payload: Optional[bytes], args: Tuple, kwargs: dict) -> Any:
+    job = _JOB_CACHE.get(key)
+    if job is None:
+        if payload is None:
+            return _CacheMiss()
+        job = pickle.loads(payload)
+        _JOB_CACHE[key] = job
+        while len(_JOB_CACHE) > _JOB_CACHE_SIZE:
+            _JOB_CACHE.popitem(last=False)
+    else:
+        _JOB_CACHE.move_to_end(key)
+    # run the job in a new thread to avoid forking corrupted internal states
+    # (https://github.com/pytorch/pytorch/issues/17199)
+    return _execute_in_new_thread(job, *args, **kwargs)
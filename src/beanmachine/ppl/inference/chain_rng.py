@@ -0,0 +1,143 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+from __future__ import annotations
+
+import random
+import threading
+from typing import Any, Callable, Dict, List, Optional
+
+import torch
+from torch.overrides import TorchFunctionMode
+
+
+# random functions (and tensor methods) that accept a ``generator`` keyword argument
+_GENERATOR_FUNCTIONS = {
+    torch.rand,
+    torch.randn,
+    torch.randint,
+    torch.randperm,
+    torch.normal,
+    torch.bernoulli,
+    torch.multinomial,
+    torch.poisson,
+    torch.binomial,
+    torch._standard_gamma,
+    torch._sample_dirichlet,
+    torch.Tensor.bernoulli,
+    torch.Tensor.bernoulli_,
+    torch.Tensor.cauchy_,
+    torch.Tensor.exponential_,
+    torch.Tensor.geometric_,
+    torch.Tensor.log_normal_,
+    torch.Tensor.multinomial,
+    torch.Tensor.normal_,
+    torch.Tensor.random_,
+    torch.Tensor.uniform_,
+}
+
+# the "*_like" random functions do not accept a generator, so they are replaced by
+# the equivalent functions that take the shape of the input
+_LIKE_FUNCTIONS: Dict[Callable, Callable] = {
+    torch.rand_like: torch.rand,
+    torch.randn_like: torch.randn,
+    torch.randint_like: torch.randint,
+}
+
+# the Python RNG of the chain that runs in the current thread
+_LOCAL = threading.local()
+
+
+class ChainRNG(TorchFunctionMode):
+    """
+    The random number generators of a single chain: a ``torch.Generator`` and a
+    ``random.Random``, which are both seeded with ``seed``. While the context is
+    active, the random torch functions called from the current thread (including
+    the ones that are called by ``Distribution.sample``) draw from the generator of
+    the chain instead of the global generator of torch, and the proposers are
+    shuffled with the ``random.Random`` of the chain (see ``shuffle``). Since the
+    context is thread-local, chains that run in different threads are independent
+    and reproducible.
+
+    Example::
+
+        with ChainRNG(seed=0):
+            x = torch.randn(3)  # does not advance the global RNG of torch
+
+    Args:
+        seed: The seed of the generators.
+    """
+
+    def __init__(self, seed: int) -> None:
+        super().__init__()
+        self.seed = seed
+        self.random = random.Random(seed)
+        # a generator for each device that the chain draws random numbers on
+        self._generators: Dict[torch.device, torch.Generator] = {}
+        self._prev_random: Optional[random.Random] = None
+
+    def generator(self, device: Any = None) -> torch.Generator:
+        """Returns the generator of the chain on ``device`` (defaults to CPU)."""
+        device = torch.device("cpu" if device is None else device)
+        if device.type == "cuda" and device.index is None:
+            device = torch.device("cuda", torch.cuda.current_device())
+        generator = self._generators.get(device)
+        if generator is None:
+            generator = torch.Generator(device).manual_seed(self.seed)
+            self._generators[device] = generator
+        return generator
+
+    def __enter__(self) -> ChainRNG:
+        self._prev_random = getattr(_LOCAL, "random", None)
+        _LOCAL.random = self.random
+        return super().__enter__()
+
+    def __exit__(self, *args) -> None:
+        _LOCAL.random = self._prev_random
+        super().__exit__(*args)
+
+    def __torch_function__(self, func, types, args=(), kwargs=None):
+        kwargs = kwargs or {}
+        if func in _LIKE_FUNCTIONS:
+            return self._call_like_function(func, *args, **kwargs)
+        if func in _GENERATOR_FUNCTIONS and kwargs.get("generator") is None:
+            device = kwargs.get("device")
+            if device is None:
+                device = next(
+                    (arg.device for arg in args if isinstance(arg, torch.Tensor)), None
+                )
+            kwargs["generator"] = self.generator(device)
+        return func(*args, **kwargs)
+
+    def _call_like_function(
+        self,
+        func: Callable,
+        input: torch.Tensor,
+        *args,
+        memory_format: Optional[torch.memory_format] = None,
+        **kwargs,
+    ) -> torch.Tensor:
+        kwargs.setdefault("dtype", input.dtype)
+        kwargs.setdefault("layout", input.layout)
+        kwargs.setdefault("device", input.device)
+        if func is torch.randint_like:
+            # randint_like(input, high) or randint_like(input, low, high)
+            args = args if len(args) == 2 else (0,) + args
+            args = args + (input.shape,)
+        else:
+            args = (input.shape,)
+        return _LIKE_FUNCTIONS[func](
+            *args, generator=self.generator(kwargs["device"]), **kwargs
+        )
+
+
+def shuffle(x: List) -> None:
+    """Shuffle ``x`` in place with the Python RNG of the chain that runs in the current
+    thread (see ``ChainRNG``), or with the global RNG of ``random`` otherwise."""
+    rng = getattr(_LOCAL, "random", None)
+    if rng is None:
+        random.shuffle(x)
+    else:
+        rng.shuffle(x)
@@ -3,13 +3,16 @@
 # This source code is licensed under the MIT license found in the
 # LICENSE file in the root directory of this source tree.
 
-from typing import List, Set
+import os
+from typing import List, Optional, Set, Union
 
 from beanmachine.ppl.inference.base_inference import BaseInference
 from beanmachine.ppl.inference.proposer.base_proposer import BaseProposer
 from beanmachine.ppl.inference.proposer.hmc_proposer import HMCProposer
+from beanmachine.ppl.inference.proposer.hmc_utils import HMCTuningState, TuningCache
 from beanmachine.ppl.model.rv_identifier import RVIdentifier
 from beanmachine.ppl.world import World
+from typing_extensions import Literal
 
 
 class GlobalHamiltonianMonteCarlo(BaseInference):
@@ -28,6 +31,33 @@ class GlobalHamiltonianMonteCarlo(BaseInference):
             to smaller step size. Defaults to 0.8.
         nnc_compile: (Experimental) If True, NNC compiler will be used to accelerate the
             inference (defaults to False).
+        mass_matrix_type (str): The structure of the adapted mass matrix, one of
+            "diagonal", "dense" (the full covariance of all of the target random
+            variables), or "low_rank" (diagonal plus the leading principal
+            components). Defaults to "diagonal".
+        mass_matrix_rank (int): Number of principal components of a "low_rank" mass
+            matrix, defaults to 10.
+        compile_potential (bool): If True, the potential energy and its gradient are
+            traced as a function of all of the target random variables and compiled
+            with ``torch.compile``. The compiled function is re-traced whenever the
+            dependency structure of the model changes. NNC is not used if this is
+            True. Defaults to False.
+        pool_adaptation (bool): If True, the chains pool their statistics for
+            adapting the step size and the mass matrix at the end of every
+            adaptation window, so that all chains share an estimate of the mass
+            matrix from the samples of all chains. The chains must run in lockstep:
+            they run in threads unless ``run_in_parallel`` or ``batch_chains`` is
+            used. Defaults to False.
+        tuning_state (HMCTuningState): The adapted step size and mass matrix of a
+            previous run of the same model (see ``export_tuning_state``), which the
+            adaptation is warm started from. The mass matrix is only re-estimated if
+            the adaptation is at least as long as the window that it was estimated
+            from, so that a short adaptation only fine-tunes the step size.
+            Defaults to None.
+        tuning_cache (str): A directory where the tuning states are cached, keyed by
+            the structure of the model and the target random variables. The tuning
+            state is loaded from the cache if ``tuning_state`` is None and saved into
+            the cache at the end of the adaptation. Defaults to None.
     """
 
     def __init__(
@@ -38,6 +68,12 @@ class GlobalHamiltonianMonteCarlo(BaseInference):
         adapt_mass_matrix: bool = True,
         target_accept_prob: float = 0.8,
         nnc_compile: bool = False,
+        mass_matrix_type: Literal["diagonal", "dense", "low_rank"] = "diagonal",
+        mass_matrix_rank: int = 10,
+        compile_potential: bool = False,
+        pool_adaptation: bool = False,
+        tuning_state: Optional[HMCTuningState] = None,
+        tuning_cache: Optional[Union[str, "os.PathLike[str]"]] = None,
     ):
         self.trajectory_length = trajectory_length
         self.initial_step_size = initial_step_size
@@ -45,6 +81,12 @@ class GlobalHamiltonianMonteCarlo(BaseInference):
         self.adapt_mass_matrix = adapt_mass_matrix
         self.target_accept_prob = target_accept_prob
         self.nnc_compile = nnc_compile
+        self.mass_matrix_type = mass_matrix_type
+        self.mass_matrix_rank = mass_matrix_rank
+        self.compile_potential = compile_potential
+        self.pool_adaptation = pool_adaptation
+        self.tuning_state = tuning_state
+        self.tuning_cache = None if tuning_cache is None else TuningCache(tuning_cache)
         self._proposer = None
 
     def _get_default_num_adaptive_samples(self, num_samples: int) -> int:
@@ -67,9 +109,24 @@ class GlobalHamiltonianMonteCarlo(BaseInference):
                 self.adapt_mass_matrix,
                 self.target_accept_prob,
                 self.nnc_compile,
+                self.mass_matrix_type,
+                self.mass_matrix_rank,
+                self.compile_potential,
+                self.pool_adaptation,
+                self._adaptation_channel,
+                self.tuning_state,
+                self.tuning_cache,
             )
         return [self._proposer]
 
+    def export_tuning_state(self) -> Optional[HMCTuningState]:
+        """Returns the current step size and mass matrix of the sampler (e.g. of
+        ``sampler.kernel`` after the adaptation), or None if the sampler has not been
+        initialized yet."""
+        if self._proposer is None:
+            return None
+        return self._proposer.tuning_state
+
 
 class SingleSiteHamiltonianMonteCarlo(BaseInference):
     """
@@ -8,6 +8,7 @@ from typing import Any, Dict, Iterator, List, Mapping, NamedTuple, Optional, Uni
 import arviz as az
 import torch
 import xarray as xr
+from beanmachine.ppl.inference.proposer_profiler import ProposerProfileReport
 from beanmachine.ppl.inference.utils import detach_samples, merge_dicts
 from beanmachine.ppl.model.rv_identifier import RVIdentifier
 
@@ -73,6 +74,8 @@ class MonteCarloSamples(Mapping[RVIdentifier, torch.Tensor]):
 
         # single_chain_view is only set when self.get_chain is called
         self.single_chain_view = False
+        # only set by infer(..., profile=True)
+        self.profile_report: Optional[ProposerProfileReport] = None
 
     @property
     def samples(self):
@@ -0,0 +1,127 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+from __future__ import annotations
+
+from typing import Dict, Iterator, List, Mapping, Optional
+
+import torch
+from beanmachine.ppl.inference.proposer_profiler import ProposerProfileReport
+from beanmachine.ppl.model.rv_identifier import RVIdentifier
+
+
+class RunningMoments:
+    """
+    Running mean and variance of a stream of tensors, computed with Welford's online
+    algorithm so that the memory usage does not depend on the number of values.
+    """
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.mean: Optional[torch.Tensor] = None
+        # sum of squared differences from the mean
+        self.m2: Optional[torch.Tensor] = None
+
+    def update(self, value: torch.Tensor) -> None:
+        value = value.detach()
+        if not value.is_floating_point():
+            value = value.to(torch.get_default_dtype())
+        self.count += 1
+        if self.mean is None or self.m2 is None:
+            self.mean = value.clone()
+            self.m2 = torch.zeros_like(value)
+            return
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+
+    @staticmethod
+    def stack(moments: List[RunningMoments]) -> RunningMoments:
+        """Stack the moments of streams with the same number of values (e.g. one
+        for each chain) along a new leading dimension."""
+        stacked = RunningMoments()
+        stacked.count = moments[0].count
+        if any(m.count != stacked.count for m in moments):
+            raise ValueError("Cannot stack moments of different number of values.")
+        if stacked.count > 0:
+            stacked.mean = torch.stack([m.mean for m in moments])
+            stacked.m2 = torch.stack([m.m2 for m in moments])
+        return stacked
+
+
+class PosteriorMoments(Mapping[RVIdentifier, torch.Tensor]):
+    """
+    A lightweight summary of the result of an inference, which holds the posterior
+    means and variances of the queries (for each chain) instead of their samples.
+    It is returned by ``infer(..., accumulate="moments")``. Indexing the summary with
+    a query returns its mean across all chains.
+
+    Args:
+        moments: The running moments of each query, with a leading chain dimension.
+        num_adaptive_samples: The number of adaptive samples, which are not included
+            in the moments.
+    """
+
+    def __init__(
+        self, moments: Dict[RVIdentifier, RunningMoments], num_adaptive_samples: int = 0
+    ) -> None:
+        self.moments = moments
+        self.num_adaptive_samples = num_adaptive_samples
+        # only set by infer(..., profile=True)
+        self.profile_report: Optional[ProposerProfileReport] = None
+
+    @property
+    def num_chains(self) -> int:
+        return next(iter(self.moments.values())).mean.shape[0]
+
+    @property
+    def num_samples(self) -> int:
+        """The number of samples per chain."""
+        return next(iter(self.moments.values())).count
+
+    def __getitem__(self, rv: RVIdentifier) -> torch.Tensor:
+        return self.mean(rv)
+
+    def __iter__(self) -> Iterator[RVIdentifier]:
+        return iter(self.moments)
+
+    def __len__(self) -> int:
+        return len(self.moments)
+
+    def mean(self, rv: RVIdentifier, chain: Optional[int] = None) -> torch.Tensor:
+        """
+        Returns the posterior mean of ``rv`` in the given chain, or across all chains
+        if ``chain`` is None.
+        """
+        moments = self.moments[rv]
+        if chain is not None:
+            return moments.mean[chain]
+        return moments.mean.mean(dim=0)
+
+    def variance(
+        self, rv: RVIdentifier, chain: Optional[int] = None, unbiased: bool = True
+    ) -> torch.Tensor:
+        """
+        Returns the posterior variance of ``rv`` in the given chain, or of the pooled
+        samples of all chains if ``chain`` is None.
+        """
+        moments = self.moments[rv]
+        num_samples = moments.count
+        if chain is not None:
+            m2 = moments.m2[chain]
+        else:
+            # combine the chains with the parallel algorithm of Chan et al., which
+            # simplifies since every chain has the same number of samples
+            mean = moments.mean.mean(dim=0)
+            spread = ((moments.mean - mean) ** 2).sum(dim=0)
+            m2 = moments.m2.sum(dim=0) + num_samples * spread
+            num_samples *= moments.mean.shape[0]
+        return m2 / (num_samples - 1 if unbiased else num_samples)
+
+    def std(
+        self, rv: RVIdentifier, chain: Optional[int] = None, unbiased: bool = True
+    ) -> torch.Tensor:
+        """Returns the posterior standard deviation of ``rv`` (see ``variance``)."""
+        return self.variance(rv, chain, unbiased).sqrt()
@@ -15,6 +15,12 @@ from beanmachine.ppl.world import World
 
 
 class BaseSingleSiteMHProposer(BaseProposer):
+    # If True, the local acceptance ratio (which only involves the Markov blanket of
+    # the target node) will be checked against the one computed from the full joint
+    # log prob of both worlds. This is useful for debugging models with dynamic
+    # control flow but brings back the O(N) cost per proposal.
+    validate_log_prob: bool = False
+
     def __init__(self, target_rv: RVIdentifier):
         self.node = target_rv
 
@@ -28,24 +34,59 @@ class BaseSingleSiteMHProposer(BaseProposer):
         Args:
             world: World to calculate proposal for.
         """
-        proposal_dist = forward_dist = self.get_proposal_distribution(world)
-        old_value = world[self.node]
-        proposed_value = proposal_dist.sample()
+        if self.node.plate_size is not None:
+            return self._propose_plate(world)
+        forward_dist = self.get_proposal_distribution(world)
+        proposed_value = forward_dist.sample()
         new_world = world.replace({self.node: proposed_value})
+        accept_log_prob = self._get_accept_log_prob(
+            world, new_world, forward_dist, proposed_value, self.validate_log_prob
+        )
+        return new_world, accept_log_prob
+
+    def _get_accept_log_prob(
+        self,
+        world: World,
+        new_world: World,
+        forward_dist: dist.Distribution,
+        proposed_value: torch.Tensor,
+        validate_log_prob: bool = False,
+    ) -> torch.Tensor:
+        """
+        Computes the MH acceptance log probability of moving self.node from its value
+        in ``world`` to ``proposed_value`` (sampled from ``forward_dist``) in
+        ``new_world``. ``new_world`` may also hold new values of other nodes, as long
+        as they are not in the Markov blanket of self.node.
+        """
+        old_value = world[self.node]
         backward_dist = self.get_proposal_distribution(new_world)
 
         # calculate MH acceptance probability
+        # Only the target node and its children can have their log prob changed by the
+        # proposal, so the rest of the terms in the joint cancel out in the MH ratio.
+        markov_blanket = {self.node}
+        markov_blanket |= world.get_variable(self.node).children
+        markov_blanket |= new_world.get_variable(self.node).children
+        # nodes that are instantiated by the new world (e.g. because of a change in
+        # control flow) only contribute to the new world
+        new_nodes = markov_blanket
+        if len(new_world) != len(world):
+            new_nodes = markov_blanket | (new_world.keys() - world.keys())
         # log P(x, y)
-        old_log_prob = world.log_prob()
+        old_log_prob = world.log_prob(markov_blanket)
         # log P(x', y)
-        new_log_prob = new_world.log_prob()
+        new_log_prob = new_world.log_prob(new_nodes)
+        if validate_log_prob:
+            self._validate_log_prob(world, new_world, new_log_prob - old_log_prob)
         # log g(x'|x)
-        forward_log_prob = forward_dist.log_prob(proposed_value).sum()
+        forward_log_prob = world.reduce_log_prob(forward_dist.log_prob(proposed_value))
         # log g(x|x')
         # because proposed_value is sampled from forward_dist, it is guaranteed to be
         # within the valid range. However, there's no guarantee that the old value
         # is in the support of backward_dist
-        backward_log_prob = safe_log_prob_sum(backward_dist, old_value)
+        backward_log_prob = safe_log_prob_sum(
+            backward_dist, old_value, world.reduce_log_prob
+        )
 
         # log [(P(x', y) * g(x|x')) / (P(x, y) * g(x'|x))]
         accept_log_prob = (
@@ -54,14 +95,93 @@ class BaseSingleSiteMHProposer(BaseProposer):
         # model size adjustment log (n/n')
         accept_log_prob += math.log(len(world)) - math.log(len(new_world))
 
-        if torch.isnan(accept_log_prob):
-            accept_log_prob = torch.tensor(
+        return torch.where(
+            torch.isnan(accept_log_prob),
+            torch.tensor(
                 float("-inf"),
                 device=accept_log_prob.device,
                 dtype=accept_log_prob.dtype,
+            ),
+            accept_log_prob,
+        )
+
+    def _propose_plate(self, world: World):
+        """
+        Update every site of the plate self.node with an independent MH step. Since
+        the sites are conditionally independent given the rest of the world, this is
+        equivalent to updating them one at a time, but all of the sites are proposed
+        and evaluated in a single batch. The returned world contains the accepted
+        sites and is always accepted.
+        """
+        plate_size = self.node.plate_size
+        forward_dist = self.get_proposal_distribution(world)
+        old_value = world[self.node]
+        proposed_value = forward_dist.sample()
+        new_world = world.replace({self.node: proposed_value})
+        backward_dist = self.get_proposal_distribution(new_world)
+        if len(new_world) != len(world):
+            raise ValueError(
+                f"Updating the sites of {self.node} should not change the set of"
+                " random variables in the world."
             )
 
-        return new_world, accept_log_prob
+        markov_blanket = {self.node}
+        markov_blanket |= world.get_variable(self.node).children
+        markov_blanket |= new_world.get_variable(self.node).children
+        accept_log_prob = (
+            new_world.plate_log_prob(self.node, markov_blanket)
+            + self._site_log_prob(backward_dist, old_value, plate_size)
+            - world.plate_log_prob(self.node, markov_blanket)
+            - self._site_log_prob(forward_dist, proposed_value, plate_size)
+        ).clamp(max=0.0)
+        # NaN is never accepted
+        accepted = torch.rand_like(accept_log_prob).log() < accept_log_prob
+        self._site_accept_prob = accept_log_prob.nan_to_num(float("-inf")).exp().mean()
+
+        num_accepted = accepted.sum().item()
+        if num_accepted == 0:
+            new_world = world
+        elif num_accepted < plate_size:
+            mask = accepted.reshape(accepted.shape + (1,) * (old_value.dim() - 1))
+            new_world = world.replace(
+                {self.node: torch.where(mask, proposed_value, old_value)}
+            )
+        return new_world, torch.zeros_like(accept_log_prob[0])
+
+    def _site_log_prob(
+        self, distribution: dist.Distribution, value: torch.Tensor, plate_size: int
+    ) -> torch.Tensor:
+        """Computes the log prob of each site of a plate under the given proposal
+        distribution, converting out of support exceptions to -Infinity."""
+        try:
+            log_prob = distribution.log_prob(value)
+        except (RuntimeError, ValueError) as e:
+            if not distribution.support.check(value).all():
+                return torch.full((plate_size,), float("-inf"), device=value.device)
+            raise e
+        if log_prob.shape[:1] != (plate_size,):
+            raise ValueError(
+                f"The proposal distribution of {type(self).__name__} does not factorize"
+                f" over the sites of {self.node}."
+            )
+        return log_prob.reshape(plate_size, -1).sum(-1)
+
+    def _validate_log_prob(
+        self, world: World, new_world: World, log_prob_diff: torch.Tensor
+    ) -> None:
+        """Check the local difference of log prob between the two worlds against the
+        difference of their full joint log prob."""
+        expected_diff = new_world.log_prob() - world.log_prob()
+        # summing over the whole world accumulates more rounding error, hence the
+        # relatively loose tolerance
+        if not torch.isclose(
+            log_prob_diff, expected_diff, rtol=1e-4, atol=1e-3, equal_nan=True
+        ).all():
+            raise RuntimeError(
+                f"Local log prob difference {log_prob_diff.tolist()} of {self.node}"
+                f" does not match the difference of the full joint"
+                f" {expected_diff.tolist()}."
+            )
 
     @abstractmethod
     def get_proposal_distribution(self, world: World) -> dist.Distribution:
@@ -0,0 +1,142 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import torch
+from beanmachine.ppl.inference.proposer.base_proposer import BaseProposer
+from beanmachine.ppl.inference.proposer.base_single_site_mh_proposer import (
+    BaseSingleSiteMHProposer,
+)
+from beanmachine.ppl.model.rv_identifier import RVIdentifier
+from beanmachine.ppl.world import World
+
+
+class ChromaticProposer(BaseProposer):
+    """
+    Updates a color class of nodes, i.e. nodes that are not in the Markov blankets
+    of each other, with an independent MH step for each node. Since the nodes are
+    conditionally independent given the rest of the world, this is equivalent to
+    updating them one at a time, but the proposed values of all of the nodes are
+    evaluated in a single world. The returned world contains the accepted values and
+    is always accepted.
+
+    Whether the nodes are conditionally independent can only be known for every
+    value of the world if its dependency structure is fixed, so the nodes are only
+    updated at once in a world created with ``static_structure=True``, and they are
+    updated one at a time otherwise (e.g. for a model with stochastic control flow).
+
+    Args:
+        proposers: The single site proposers of the nodes of a color class.
+    """
+
+    def __init__(self, proposers: List[BaseSingleSiteMHProposer]):
+        self.proposers = proposers
+        self._accept_log_probs: List[Optional[torch.Tensor]] = []
+        self._accepted: List[Optional[torch.Tensor]] = []
+
+    def propose(self, world: World) -> Tuple[World, torch.Tensor]:
+        if not world.static_structure:
+            # whether the proposal can be batched must not depend on the proposed
+            # values, since a proposal that is discarded based on its value would
+            # not satisfy detailed balance
+            return self._propose_sequentially(world)
+
+        forward_dists = [p.get_proposal_distribution(world) for p in self.proposers]
+        proposed_values = [d.sample() for d in forward_dists]
+        new_world = world.replace(
+            {p.node: value for p, value in zip(self.proposers, proposed_values)}
+        )
+
+        # the accepted nodes of a single chain, or the merged values of a batch of chains
+        accepted_nodes, updates = [], {}
+        self._accept_log_probs, self._accepted = [], []
+        for proposer, forward_dist, value in zip(
+            self.proposers, forward_dists, proposed_values
+        ):
+            accept_log_prob = proposer._get_accept_log_prob(
+                world, new_world, forward_dist, value
+            ).clamp(max=0.0)
+            accepted = torch.rand_like(accept_log_prob).log() < accept_log_prob
+            self._accept_log_probs.append(accept_log_prob)
+            self._accepted.append(accepted)
+            if accepted.dim() > 0:
+                # element-wise acceptance for a batch of chains
+                if accepted.any():
+                    old_value = world[proposer.node]
+                    mask = accepted.reshape(
+                        accepted.shape + (1,) * (old_value.dim() - accepted.dim())
+                    )
+                    updates[proposer.node] = torch.where(mask, value, old_value)
+            elif accepted:
+                accepted_nodes.append(proposer.node)
+
+        if updates:
+            new_world = world.replace(updates)
+        elif len(accepted_nodes) == 0:
+            new_world = world
+        elif len(accepted_nodes) < len(self.proposers):
+            new_world = world.merge_nodes(new_world, accepted_nodes)
+        return new_world, torch.zeros_like(self._accept_log_probs[0])
+
+    def _propose_sequentially(self, world: World) -> Tuple[World, torch.Tensor]:
+        self._accept_log_probs, self._accepted = [], []
+        for proposer in self.proposers:
+            new_world, accept_log_prob = proposer.propose(world)
+            accept_log_prob = accept_log_prob.clamp(max=0.0)
+            accepted = torch.rand_like(accept_log_prob).log() < accept_log_prob
+            self._accept_log_probs.append(accept_log_prob)
+            self._accepted.append(accepted)
+            if accepted.dim() > 0:
+                world = world.merge(new_world, accepted)
+            elif accepted:
+                world = new_world
+        return world, torch.zeros_like(self._accept_log_probs[0])
+
+    def do_adaptation(self, world: World, *args, **kwargs) -> None:
+        """Run `do_adaptation` for each proposer with its own acceptance."""
+        for proposer, accept_log_prob, accepted in zip(
+            self.proposers, self._accept_log_probs, self._accepted
+        ):
+            proposer.do_adaptation(
+                world=world, accept_log_prob=accept_log_prob, is_accepted=accepted
+            )
+
+    def finish_adaptation(self) -> None:
+        for proposer in self.proposers:
+            proposer.finish_adaptation()
+
+
+def color_nodes(
+    world: World, nodes: Iterable[RVIdentifier]
+) -> List[List[RVIdentifier]]:
+    """
+    Partitions ``nodes`` into color classes, such that no node is in the Markov
+    blanket (its parents, its children, and the other parents of its children) of
+    another node of the same class. The nodes are colored greedily, from the node
+    with the most neighbors to the one with the fewest.
+    """
+    nodes = set(nodes)
+    neighbors: Dict[RVIdentifier, Set[RVIdentifier]] = {}
+    for node in nodes:
+        var = world.get_variable(node)
+        blanket = set(var.parents) | var.children
+        for child in var.children:
+            blanket |= world.get_variable(child).parents
+        blanket.discard(node)
+        neighbors[node] = blanket & nodes
+
+    colors: Dict[RVIdentifier, int] = {}
+    color_classes: List[List[RVIdentifier]] = []
+    for node in sorted(nodes, key=lambda n: len(neighbors[n]), reverse=True):
+        neighbor_colors = {colors[n] for n in neighbors[node] if n in colors}
+        color = next(
+            c for c in range(len(color_classes) + 1) if c not in neighbor_colors
+        )
+        if color == len(color_classes):
+            color_classes.append([])
+        colors[node] = color
+        color_classes[color].append(node)
+    return color_classes
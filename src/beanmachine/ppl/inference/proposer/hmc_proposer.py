@@ -3,21 +3,36 @@
 # This source code is licensed under the MIT license found in the
 # LICENSE file in the root directory of this source tree.
 
+import copy
+import logging
 import math
+import time
 import warnings
+from functools import partial
 from typing import Callable, cast, Optional, Set, Tuple
 
 import torch
 from beanmachine.ppl.inference.proposer.base_proposer import BaseProposer
 from beanmachine.ppl.inference.proposer.hmc_utils import (
+    AdaptationChannel,
+    compile_value_and_grad,
+    DenseMassInv,
+    DictToVecTransform,
     DualAverageAdapter,
+    HMCTuningState,
+    mass_inv_matmul,
+    MassInv,
     MassMatrixAdapter,
     RealSpaceTransform,
+    TuningCache,
     WindowScheme,
 )
 from beanmachine.ppl.inference.proposer.nnc import nnc_jit
 from beanmachine.ppl.model.rv_identifier import RVIdentifier
-from beanmachine.ppl.world import RVDict, World
+from beanmachine.ppl.world import BatchedWorld, RVDict, World
+from typing_extensions import Literal
+
+logger = logging.getLogger(__name__)
 
 
 class HMCProposer(BaseProposer):
@@ -33,8 +48,33 @@ class HMCProposer(BaseProposer):
             Setting Path Lengths in Hamiltonian Monte Carlo" (2014).
             https://arxiv.org/abs/1111.4246
 
-    The current implementation does not use nor adapt a mass matrix -- which is
-    equivalent to setting the matrix M to I.
+    The mass matrix M starts as the identity and, if adapt_mass_matrix is True, is
+    adapted jointly for all of the target random variables during the adaptation
+    windows (see ``MassMatrixAdapter``). It can be diagonal, dense, or diagonal plus
+    low-rank.
+
+    The positions, momentums, and gradients of all of the target random variables
+    are packed into flat tensors with a fixed layout (see ``DictToVecTransform``),
+    so that the leapfrog steps only involve a few vector operations regardless of
+    the number of random variables.
+
+    If the world is a ``BatchedWorld``, the leapfrog steps are performed for all of
+    the chains at once and each chain is accepted or rejected independently. The
+    chains share the same step size (adapted to their average accept prob) and
+    number of steps.
+
+    If pool_adaptation is True, the chains pool their adaptation statistics: the
+    mass matrix is estimated from the positions of all chains at the end of every
+    adaptation window, the chains restart the step size adaptation from the same
+    step size after each window, and the final step size is the one of the averaged
+    dual averaging state of all chains. The chains of a ``BatchedWorld`` are pooled
+    along the chain dimension, while chains that run in different threads or
+    processes exchange their statistics through an ``AdaptationChannel``.
+
+    The adapted parameters can be exported as an ``HMCTuningState`` (see
+    ``tuning_state``) to warm start another run of the same model, either directly
+    or through a ``TuningCache``, which the proposer loads its initial tuning state
+    from and saves its adapted state into at the end of the adaptation.
 
     Args:
         initial_world: Initial world to propose from.
@@ -47,6 +87,28 @@ class HMCProposer(BaseProposer):
         target_accept_prob: Target accept prob, defaults to 0.8.
         nnc_compile: If True, NNC compiler will be used to accelerate the
             inference.
+        mass_matrix_type: The structure of the adapted mass matrix, one of
+            "diagonal", "dense", or "low_rank". Defaults to "diagonal".
+        mass_matrix_rank: Number of principal components of a "low_rank" mass
+            matrix, defaults to 10.
+        compile_potential: If True, the potential energy and its gradient are
+            traced into a single graph as a function of the flat positions and
+            compiled with ``torch.compile`` (see ``compile_value_and_grad``). The
+            compiled function is cached and only re-traced when the structure of the
+            world or the values of the other latent variables change, so the
+            computation of the model should not branch on the values of the target
+            random variables without changing the dependencies. NNC is not used
+            if this is True. Defaults to False.
+        pool_adaptation: Whether to pool the adaptation statistics across the
+            chains, defaults to False.
+        adaptation_channel: The channel through which the statistics are pooled
+            with the chains that run in other threads or processes, if
+            pool_adaptation is True.
+        tuning_state: If provided, the step size and the mass matrix start from the
+            state (instead of initial_step_size and the identity), which takes
+            precedence over the state in the tuning_cache.
+        tuning_cache: If provided, the tuning state is loaded from and saved into
+            the cache.
     """
 
     def __init__(
@@ -60,13 +122,31 @@ class HMCProposer(BaseProposer):
         adapt_mass_matrix: bool = True,
         target_accept_prob: float = 0.8,
         nnc_compile: bool = True,
+        mass_matrix_type: Literal["diagonal", "dense", "low_rank"] = "diagonal",
+        mass_matrix_rank: int = 10,
+        compile_potential: bool = False,
+        pool_adaptation: bool = False,
+        adaptation_channel: Optional[AdaptationChannel] = None,
+        tuning_state: Optional[HMCTuningState] = None,
+        tuning_cache: Optional[TuningCache] = None,
     ):
         self.world = initial_world
         self._target_rvs = target_rvs
+        self._compile_potential = compile_potential
+        self._compiled_potential_grads: Optional[Callable] = None
+        self._compiled_structure_version: Optional[int] = None
+        self._compiled_other_values: RVDict = {}
+        self._compiled_world: Optional[World] = None
         self._to_unconstrained = RealSpaceTransform(initial_world, target_rvs)
-        self._positions = self._to_unconstrained(
-            {node: initial_world[node] for node in self._target_rvs}
+        self._dict2vec = DictToVecTransform(
+            self._to_unconstrained(
+                {node: initial_world[node] for node in self._target_rvs}
+            ),
+            (initial_world.num_chains,)
+            if isinstance(initial_world, BatchedWorld)
+            else (),
         )
+        self._positions = self._get_positions(initial_world)
         # cache pe and pe_grad to prevent re-computation
         self._pe, self._pe_grad = self._potential_grads(self._positions)
         # initialize parameters
@@ -75,27 +155,51 @@ class HMCProposer(BaseProposer):
         self.adapt_step_size = adapt_step_size
         self.adapt_mass_matrix = adapt_mass_matrix
         # we need mass matrix adapter to sample momentums
-        self._mass_matrix_adapter = MassMatrixAdapter()
-        if self.adapt_step_size:
+        self._mass_matrix_adapter = MassMatrixAdapter(
+            mass_matrix_type, mass_matrix_rank
+        )
+        self._tuning_cache = tuning_cache
+        if tuning_cache is not None:
+            self._tuning_cache_key = tuning_cache.key(
+                initial_world,
+                target_rvs,
+                (type(self).__name__, mass_matrix_type, mass_matrix_rank),
+            )
+            if tuning_state is None:
+                tuning_state = tuning_cache.load(self._tuning_cache_key)
+        # number of samples that the current mass matrix was estimated from
+        self._mass_matrix_window_size = 0
+        if tuning_state is not None:
+            self._mass_matrix_adapter.set_mass_inv(
+                tuning_state.mass_inv, self._positions
+            )
+            self._mass_matrix_window_size = tuning_state.window_size
+            self.step_size = tuning_state.step_size.to(self._positions).clone()
+        elif self.adapt_step_size:
             self.step_size = self._find_reasonable_step_size(
                 torch.as_tensor(initial_step_size),
                 self._positions,
                 self._pe,
                 self._pe_grad,
             )
-            self._step_size_adapter = DualAverageAdapter(
-                self.step_size, target_accept_prob
-            )
         else:
             self.step_size = torch.as_tensor(initial_step_size)
+        if self.adapt_step_size:
+            self._step_size_adapter = DualAverageAdapter(
+                self.step_size, target_accept_prob, warm_start=tuning_state is not None
+            )
         if self.adapt_mass_matrix:
-            self._window_scheme = WindowScheme(num_adaptive_samples)
+            self._window_scheme = WindowScheme(
+                num_adaptive_samples, self._mass_matrix_window_size
+            )
         else:
             self._window_scheme = None
         # alpha will store the accept prob and will be used to adapt step size
         self._alpha = None
+        self.pool_adaptation = pool_adaptation
+        self._adaptation_channel = adaptation_channel if pool_adaptation else None
 
-        if nnc_compile:
+        if nnc_compile and not compile_potential:
             # pyre-ignore[8]
             self._leapfrog_step = nnc_jit(self._leapfrog_step)
 
@@ -104,43 +208,76 @@ class HMCProposer(BaseProposer):
         return self._mass_matrix_adapter.initialize_momentums
 
     @property
-    def _mass_inv(self) -> RVDict:
-        return self._mass_matrix_adapter.mass_inv
+    def _mass_inv(self) -> MassInv:
+        return cast(MassInv, self._mass_matrix_adapter.mass_inv)
+
+    def _get_positions(self, world: World) -> torch.Tensor:
+        """Returns the flattened unconstrained values of the target nodes in world"""
+        return self._dict2vec(
+            self._to_unconstrained({node: world[node] for node in self._target_rvs})
+        )
 
-    def _kinetic_energy(self, momentums: RVDict, mass_inv: RVDict) -> torch.Tensor:
+    def _to_constrained(self, positions: torch.Tensor) -> RVDict:
+        """Returns the values of the target nodes at the given (flat) positions"""
+        return self._to_unconstrained.inv(self._dict2vec.inv(positions))
+
+    def _kinetic_energy(
+        self, momentums: torch.Tensor, mass_inv: MassInv
+    ) -> torch.Tensor:
         """Returns the kinetic energy KE = 1/2 * p^T @ M^{-1} @ p (equation 2.6 in [1])"""
-        r = torch.cat([momentums[node] for node in mass_inv])
-        r_scale = torch.cat([mass_inv[node] * momentums[node] for node in mass_inv])
-        return torch.dot(r, r_scale) / 2
-
-    def _kinetic_grads(self, momentums: RVDict, mass_inv: RVDict) -> RVDict:
-        """Returns a dictionary of gradients of kinetic energy function with respect to
-        the momentum at each site, computed as M^{-1} @ p"""
-        grads = {}
-        for node, r in momentums.items():
-            grads[node] = mass_inv[node] * r
-        return grads
-
-    def _potential_energy(self, positions: RVDict) -> torch.Tensor:
+        if isinstance(mass_inv, DenseMassInv):
+            # KE = 1/2 * ||L^T @ p||^2 where M^{-1} = L @ L^T
+            vec = (mass_inv.scale_tril.mT @ momentums.unsqueeze(-1)).squeeze(-1)
+            return torch.sum(vec**2, dim=-1) / 2
+        if not isinstance(mass_inv, torch.Tensor):
+            return torch.sum(momentums * mass_inv_matmul(mass_inv, momentums), -1) / 2
+        if momentums.dim() > 1:
+            # the energies of different chains are summed separately
+            return torch.sum(mass_inv * momentums**2, dim=-1) / 2
+        return torch.dot(momentums, mass_inv * momentums) / 2
+
+    def _kinetic_grads(
+        self, momentums: torch.Tensor, mass_inv: MassInv
+    ) -> torch.Tensor:
+        """Returns the gradients of kinetic energy function with respect to the
+        momentums, computed as M^{-1} @ p"""
+        return mass_inv_matmul(mass_inv, momentums)
+
+    def _potential_energy(
+        self, positions: torch.Tensor, world: Optional[World] = None
+    ) -> torch.Tensor:
         """Returns the potential energy PE = - L(world) (the joint log likelihood of the
-        current values)"""
-        constrained_vals = self._to_unconstrained.inv(positions)
-        log_joint = self.world.replace(constrained_vals).log_prob()
+        current values), where world defaults to the current world"""
+        if world is None:
+            world = self.world
+        unconstrained_vals = self._dict2vec.inv(positions)
+        constrained_vals = self._to_unconstrained.inv(unconstrained_vals)
+        log_joint = world.replace(constrained_vals).log_prob()
         log_joint = log_joint - self._to_unconstrained.log_abs_det_jacobian(
-            constrained_vals, positions
+            constrained_vals, unconstrained_vals, world.reduce_log_prob
         )
         return -log_joint
 
-    def _potential_grads(self, positions: RVDict) -> Tuple[torch.Tensor, RVDict]:
-        """Returns potential energy as well as a dictionary of its gradient with
-        respect to the value at each site."""
-        nodes, values = zip(*positions.items())
-        for value in values:
-            value.requires_grad = True
+    def _potential_grads(
+        self, positions: torch.Tensor
+    ) -> Tuple[torch.Tensor, torch.Tensor]:
+        """Returns potential energy as well as its gradient with respect to the
+        positions."""
+        if self._compile_potential:
+            potential_grads = self._get_compiled_potential_grads(positions)
+            if potential_grads is not None:
+                try:
+                    return potential_grads(positions)
+                except RuntimeError:
+                    # e.g. Cholesky errors, which are handled below
+                    pass
+
+        positions.requires_grad = True
 
         try:
             pe = self._potential_energy(positions)
-            grads = torch.autograd.grad(pe, values)
+            # the energies of different chains (if any) are independent
+            (grads,) = torch.autograd.grad(pe.sum(), positions)
         # We return NaN on Cholesky factorization errors which can be gracefully
         # handled by NUTS/HMC.
         # TODO: Change to torch.linalg.LinAlgError when in release.
@@ -152,24 +289,71 @@ class HMCProposer(BaseProposer):
                     " If automatic recovery does not happen, plese file an issue"
                     " at https://github.com/facebookresearch/beanmachine/issues/."
                 )
-                grads = [torch.full_like(v, float("nan")) for v in values]
-                pe = torch.tensor(
-                    float("nan"), device=grads[0].device, dtype=grads[0].dtype
-                )
+                grads = torch.full_like(positions, float("nan"))
+                pe = torch.tensor(float("nan"), device=grads.device, dtype=grads.dtype)
             else:
                 raise e
 
-        grads = dict(zip(nodes, grads))
-
-        for value in values:
-            value.requires_grad = False
+        positions.requires_grad = False
         return pe.detach(), grads
 
+    def _get_compiled_potential_grads(
+        self, positions: torch.Tensor
+    ) -> Optional[Callable[[torch.Tensor], Tuple[torch.Tensor, torch.Tensor]]]:
+        """Returns the compiled potential energy and gradient function of the current
+        world, (re-)compiling it if the structure of the world or the values of the
+        latent nodes that are not proposed by this proposer have changed."""
+        if self._compiled_world is not self.world:
+            world = self.world
+            # values are replaced rather than modified in place, so an unchanged
+            # value is the same Tensor object
+            other_values = {
+                node: world[node] for node in world.latent_nodes - self._target_rvs
+            }
+            if (
+                world.structure_version != self._compiled_structure_version
+                or other_values.keys() != self._compiled_other_values.keys()
+                or any(
+                    val is not self._compiled_other_values[node]
+                    for node, val in other_values.items()
+                )
+            ):
+                self._compiled_potential_grads = None
+                self._compiled_structure_version = world.structure_version
+                self._compiled_other_values = other_values
+            self._compiled_world = world
+        if self._compiled_potential_grads is None:
+            start = time.perf_counter()
+            try:
+                # trace the joint log prob from scratch rather than its (value
+                # dependent) incremental update from the cached one
+                world = self.world.copy()
+                world._log_prob = None
+                self._compiled_potential_grads = compile_value_and_grad(
+                    partial(self._potential_energy, world=world), positions
+                )
+                # the first call triggers the compilation
+                self._compiled_potential_grads(positions)
+            except Exception as e:
+                warnings.warn(
+                    "Fails to compile the potential energy due to the following"
+                    f" error: {str(e)}\nFalling back to the uncompiled potential"
+                    " energy."
+                )
+                self._compile_potential = False
+                self._compiled_potential_grads = None
+                return None
+            logger.info(
+                f"Compiled the potential energy of {len(self._target_rvs)} random"
+                f" variables in {time.perf_counter() - start:.2f}s"
+            )
+        return self._compiled_potential_grads
+
     def _hamiltonian(
         self,
-        positions: RVDict,
-        momentums: RVDict,
-        mass_inv: RVDict,
+        positions: torch.Tensor,
+        momentums: torch.Tensor,
+        mass_inv: MassInv,
         pe: Optional[torch.Tensor] = None,
     ) -> torch.Tensor:
         """Returns the value of Hamiltonian equation (equatino 2.5 in [1]). This function
@@ -182,12 +366,12 @@ class HMCProposer(BaseProposer):
 
     def _leapfrog_step(
         self,
-        positions: RVDict,
-        momentums: RVDict,
+        positions: torch.Tensor,
+        momentums: torch.Tensor,
         step_size: torch.Tensor,
-        mass_inv: RVDict,
-        pe_grad: Optional[RVDict] = None,
-    ) -> Tuple[RVDict, RVDict, torch.Tensor, RVDict]:
+        mass_inv: MassInv,
+        pe_grad: Optional[torch.Tensor] = None,
+    ) -> Tuple[torch.Tensor, torch.Tensor, torch.Tensor, torch.Tensor]:
         """Performs a single leapfrog integration (alson known as the velocity Verlet
         method) as described in equation 2.28-2.30 in [1]. If the values of potential
         grads of the current world is provided, then we only needs to compute the
@@ -195,30 +379,24 @@ class HMCProposer(BaseProposer):
         if pe_grad is None:
             _, pe_grad = self._potential_grads(positions)
 
-        new_momentums = {}
-        for node, r in momentums.items():
-            new_momentums[node] = r - step_size * pe_grad[node].flatten() / 2
+        new_momentums = momentums - step_size * pe_grad / 2
         ke_grad = self._kinetic_grads(new_momentums, mass_inv)
-
-        new_positions = {}
-        for node, z in positions.items():
-            new_positions[node] = z + step_size * ke_grad[node].reshape(z.shape)
+        new_positions = positions + step_size * ke_grad
 
         pe, pe_grad = self._potential_grads(new_positions)
-        for node, r in new_momentums.items():
-            new_momentums[node] = r - step_size * pe_grad[node].flatten() / 2
+        new_momentums = new_momentums - step_size * pe_grad / 2
 
         return new_positions, new_momentums, pe, pe_grad
 
     def _leapfrog_updates(
         self,
-        positions: RVDict,
-        momentums: RVDict,
+        positions: torch.Tensor,
+        momentums: torch.Tensor,
         trajectory_length: float,
         step_size: torch.Tensor,
-        mass_inv: RVDict,
-        pe_grad: Optional[RVDict] = None,
-    ) -> Tuple[RVDict, RVDict, torch.Tensor, RVDict]:
+        mass_inv: MassInv,
+        pe_grad: Optional[torch.Tensor] = None,
+    ) -> Tuple[torch.Tensor, torch.Tensor, torch.Tensor, torch.Tensor]:
         """Run multiple iterations of leapfrog integration until the length of the
         trajectory is greater than the specified trajectory_length."""
         # we should run at least 1 step
@@ -228,14 +406,14 @@ class HMCProposer(BaseProposer):
                 positions, momentums, step_size, mass_inv, pe_grad
             )
         # pyre-ignore[61]: `pe` may not be initialized here.
-        return positions, momentums, pe, cast(RVDict, pe_grad)
+        return positions, momentums, pe, cast(torch.Tensor, pe_grad)
 
     def _find_reasonable_step_size(
         self,
         initial_step_size: torch.Tensor,
-        positions: RVDict,
+        positions: torch.Tensor,
         pe: torch.Tensor,
-        pe_grad: RVDict,
+        pe_grad: torch.Tensor,
     ) -> torch.Tensor:
         """A heuristic of finding a reasonable initial step size (epsilon) as introduced
         in Algorithm 4 of [2]."""
@@ -254,7 +432,9 @@ class HMCProposer(BaseProposer):
             new_positions, new_momentums, self._mass_inv, new_pe
         )
         # NaN will evaluate to False and set direction to -1
-        new_direction = direction = 1 if energy - new_energy > target else -1
+        new_direction = direction = (
+            1 if self._mean_log_accept_prob(energy - new_energy) > target else -1
+        )
         step_size_scale = 2**direction
         while new_direction == direction:
             step_size *= step_size_scale
@@ -277,16 +457,24 @@ class HMCProposer(BaseProposer):
             new_energy = self._hamiltonian(
                 new_positions, new_momentums, self._mass_inv, new_pe
             )
-            new_direction = 1 if energy - new_energy > target else -1
+            new_direction = (
+                1 if self._mean_log_accept_prob(energy - new_energy) > target else -1
+            )
         return step_size
 
+    def _mean_log_accept_prob(self, delta_energy: torch.Tensor) -> torch.Tensor:
+        """Returns the log of the average accept prob exp(delta_energy) across the
+        chains, or delta_energy itself if there is a single chain."""
+        if delta_energy.dim() == 0:
+            return delta_energy
+        delta_energy = torch.nan_to_num(delta_energy, float("-inf"))
+        return torch.logsumexp(delta_energy, 0) - math.log(delta_energy.numel())
+
     def propose(self, world: World) -> Tuple[World, torch.Tensor]:
         if world is not self.world:
             # re-compute cached values since world was modified by other sources
             self.world = world
-            self._positions = self._to_unconstrained(
-                {node: world[node] for node in self._target_rvs}
-            )
+            self._positions = self._get_positions(world)
             self._pe, self._pe_grad = self._potential_grads(self._positions)
         momentums = self._initialize_momentums(self._positions)
         current_energy = self._hamiltonian(
@@ -307,18 +495,40 @@ class HMCProposer(BaseProposer):
         delta_energy = new_energy - current_energy
         self._alpha = torch.clamp(torch.exp(-delta_energy), max=1.0)
         # accept/reject new world
-        if torch.bernoulli(self._alpha):
-            self.world = self.world.replace(self._to_unconstrained.inv(positions))
+        accepted = torch.bernoulli(self._alpha).bool()
+        if accepted.dim() > 0:
+            self._accept_chains(accepted, positions, pe, pe_grad)
+        elif accepted:
+            self.world = self.world.replace(self._to_constrained(positions))
             # update cache
             self._positions, self._pe, self._pe_grad = positions, pe, pe_grad
         return self.world, torch.zeros_like(self._alpha)
 
+    def _accept_chains(
+        self,
+        accepted: torch.Tensor,
+        positions: torch.Tensor,
+        pe: torch.Tensor,
+        pe_grad: torch.Tensor,
+    ) -> None:
+        """Update the chains where ``accepted`` is True to the new positions."""
+        if not accepted.any():
+            return
+        if not accepted.all():
+            mask = accepted.unsqueeze(-1)
+            positions = torch.where(mask, positions, self._positions)
+            pe_grad = torch.where(mask, pe_grad, self._pe_grad)
+            pe = torch.where(accepted, pe, self._pe)
+        self.world = self.world.replace(self._to_constrained(positions))
+        self._positions, self._pe, self._pe_grad = positions, pe, pe_grad
+
     def do_adaptation(self, *args, **kwargs) -> None:
         if self._alpha is None:
             return
 
         if self.adapt_step_size:
-            self.step_size = self._step_size_adapter.step(self._alpha)
+            # chains in a batch share the same step size
+            self.step_size = self._step_size_adapter.step(self._alpha.mean())
 
         if self.adapt_mass_matrix:
             window_scheme = self._window_scheme
@@ -327,6 +537,8 @@ class HMCProposer(BaseProposer):
                 self._mass_matrix_adapter.step(self._positions)
                 if window_scheme.is_end_window:
                     # update mass matrix at the end of a window
+                    if self.pool_adaptation:
+                        self._pool_mass_matrix_statistics()
                     self._mass_matrix_adapter.finalize()
 
                     if self.adapt_step_size:
@@ -336,10 +548,49 @@ class HMCProposer(BaseProposer):
                             self._pe,
                             self._pe_grad,
                         )
+                        if self._adaptation_channel is not None:
+                            # restart from the geometric mean of the step sizes
+                            step_sizes = self._adaptation_channel.exchange(
+                                self.step_size
+                            )
+                            self.step_size = torch.stack(step_sizes).log().mean().exp()
                         self._step_size_adapter = DualAverageAdapter(self.step_size)
             window_scheme.step()
         self._alpha = None
 
+    def _pool_mass_matrix_statistics(self) -> None:
+        """Pools the statistics of the current mass matrix adaptation window across
+        the chains."""
+        if self._adaptation_channel is not None:
+            # a shallow copy keeps the statistics that are posted, since the
+            # statistics of the adapter are replaced rather than modified
+            adapters = self._adaptation_channel.exchange(
+                copy.copy(self._mass_matrix_adapter)
+            )
+            self._mass_matrix_adapter.pool(adapters)
+        elif isinstance(self.world, BatchedWorld):
+            self._mass_matrix_adapter.pool_batch()
+
     def finish_adaptation(self) -> None:
         if self.adapt_step_size:
+            if self._adaptation_channel is not None:
+                adapters = self._adaptation_channel.exchange(
+                    copy.copy(self._step_size_adapter)
+                )
+                self._step_size_adapter.pool(adapters)
             self.step_size = self._step_size_adapter.finalize()
+        if self._tuning_cache is not None:
+            self._tuning_cache.save(self._tuning_cache_key, self.tuning_state)
+
+    @property
+    def tuning_state(self) -> HMCTuningState:
+        """The current step size and mass matrix, which can be used to warm start
+        the adaptation of another run of the same model."""
+        window_size = self._mass_matrix_window_size
+        if self._window_scheme is not None:
+            window_size = max(window_size, self._window_scheme.last_window_size)
+        mass_inv = self._mass_matrix_adapter.mass_inv
+        if mass_inv is None:
+            # the momentums have not been drawn yet
+            mass_inv = torch.ones_like(self._positions)
+        return HMCTuningState(self.step_size, mass_inv, window_size)
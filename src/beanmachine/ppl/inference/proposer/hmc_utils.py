@@ -3,15 +3,31 @@
 # This source code is licensed under the MIT license found in the
 # LICENSE file in the root directory of this source tree.
 
+import hashlib
 import math
+import os
+import threading
 import warnings
-from typing import cast, Dict, Set, Union
+from typing import (
+    Any,
+    Callable,
+    cast,
+    Dict,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+    Union,
+)
 
 import torch
 import torch.distributions as dist
 from beanmachine.ppl.model.rv_identifier import RVIdentifier
 from beanmachine.ppl.world import RVDict, World
 from beanmachine.ppl.world.utils import get_default_transforms
+from typing_extensions import Literal
 
 
 class WindowScheme:
@@ -19,13 +35,17 @@ class WindowScheme:
     Spliting adaptation iterations into a series of monotonically increasing windows,
     which can be used to learn the mass matrices in HMC.
 
+    If min_window_size is provided (e.g. when the mass matrix has already been
+    estimated from a window of that size in a previous run), the first window is at
+    least that large, and no window is created if it does not fit.
+
     Reference:
         [1] "HMC algorithm parameters" from Stan Reference Manual
             https://mc-stan.org/docs/2_26/reference-manual/hmc-algorithm-parameters.html#automatic-parameter-tuning
 
     """
 
-    def __init__(self, num_adaptive_samples: int):
+    def __init__(self, num_adaptive_samples: int, min_window_size: int = 0):
         # from Stan
         if num_adaptive_samples < 20:
             # do not create any window for adapting mass matrix
@@ -38,9 +58,21 @@ class WindowScheme:
         else:
             self._start_iter = 75
             self._end_iter = num_adaptive_samples - 50
-            self._window_size = 25
+            self._window_size = max(25, min_window_size)
+            if min_window_size and (
+                self._end_iter - self._start_iter < 2 * self._window_size
+            ):
+                # use a single window, as the next one would be smaller
+                self._window_size = self._end_iter - self._start_iter
+        if self._window_size < min_window_size or (
+            self._end_iter - self._start_iter < self._window_size
+        ):
+            self._start_iter = self._end_iter = num_adaptive_samples
+            self._window_size = 0
 
         self._iteration = 0
+        # size of the last window that has ended
+        self.last_window_size = 0
 
     @property
     def is_in_window(self):
@@ -52,6 +84,7 @@ class WindowScheme:
 
     def step(self):
         if self.is_end_window:
+            self.last_window_size = self._window_size
             # prepare for next window
             self._start_iter = self._iteration + 1
             if self._end_iter - self._start_iter < self._window_size * 4:
@@ -73,12 +106,24 @@ class DualAverageAdapter:
         [2] Matthew Hoffman and Andrew Gelman. "The No-U-Turn Sampler: Adaptively
             Setting Path Lengths in Hamiltonian Monte Carlo" (2014).
             https://arxiv.org/abs/1111.4246
+
+    Args:
+        initial_epsilon: The initial step size.
+        delta: The target mean accept probability, defaults to 0.8.
+        warm_start: If True, the initial step size is assumed to be tuned already
+            (e.g. imported from a previous run), so the step sizes are shrunk towards
+            it instead of towards 10 times of it. Defaults to False.
     """
 
-    def __init__(self, initial_epsilon: torch.Tensor, delta: float = 0.8):
+    def __init__(
+        self,
+        initial_epsilon: torch.Tensor,
+        delta: float = 0.8,
+        warm_start: bool = False,
+    ):
         self._log_avg_epsilon = torch.zeros_like(initial_epsilon)
         self._H = torch.zeros_like(initial_epsilon)
-        self._mu = torch.log(10 * initial_epsilon)
+        self._mu = torch.log(initial_epsilon if warm_start else 10 * initial_epsilon)
         self._t0 = 10
         self._delta = delta  # target mean accept prob
         self._gamma = 0.05
@@ -102,63 +147,244 @@ class DualAverageAdapter:
     def finalize(self) -> torch.Tensor:
         return torch.exp(self._log_avg_epsilon)
 
+    def pool(self, adapters: Sequence["DualAverageAdapter"]) -> None:
+        """Replaces the state of the adapter with the average state of ``adapters``
+        (e.g. of all chains, including this one), i.e. the average of the running
+        accept statistics H and the geometric mean of the (averaged) step sizes. The
+        adapters in ``adapters`` are not modified."""
+        self._H = torch.stack([adapter._H for adapter in adapters]).mean(0)
+        self._mu = torch.stack([adapter._mu for adapter in adapters]).mean(0)
+        self._log_avg_epsilon = torch.stack(
+            [adapter._log_avg_epsilon for adapter in adapters]
+        ).mean(0)
+
+
+class DenseMassInv(NamedTuple):
+    """
+    A dense inverse mass matrix M^{-1} = L @ L^T, represented by its Cholesky factor L
+    (with an optional leading chain dimension).
+    """
+
+    scale_tril: torch.Tensor
+
+
+class LowRankMassInv(NamedTuple):
+    """
+    A diagonal-plus-low-rank inverse mass matrix
+    M^{-1} = S @ (I + U @ diag(eigvals - 1) @ U^T) @ S, where S = diag(scale) holds
+    the marginal standard deviations and the orthonormal columns of U are principal
+    components of the standardized positions.
+    """
+
+    scale: torch.Tensor
+    eigvecs: torch.Tensor
+    eigvals: torch.Tensor
+
+
+# a diagonal inverse mass matrix is represented by a Tensor of its diagonal
+MassInv = Union[torch.Tensor, DenseMassInv, LowRankMassInv]
+
+
+def mass_inv_matmul(mass_inv: MassInv, momentums: torch.Tensor) -> torch.Tensor:
+    """Returns M^{-1} @ p for each (chain of) flat momentums p"""
+    if isinstance(mass_inv, DenseMassInv):
+        scale_tril = mass_inv.scale_tril
+        vec = (scale_tril.mT @ momentums.unsqueeze(-1)).squeeze(-1)
+        return (scale_tril @ vec.unsqueeze(-1)).squeeze(-1)
+    if isinstance(mass_inv, LowRankMassInv):
+        scaled = mass_inv.scale * momentums
+        proj = (scaled.unsqueeze(-2) @ mass_inv.eigvecs).squeeze(-2)
+        proj = proj * (mass_inv.eigvals - 1)
+        scaled = scaled + (proj.unsqueeze(-2) @ mass_inv.eigvecs.mT).squeeze(-2)
+        return mass_inv.scale * scaled
+    return mass_inv * momentums
+
 
 class MassMatrixAdapter:
     """
-    Adapts the mass matrix.
+    Adapts the mass matrix of the flattened positions of all of the random variables
+    (see ``DictToVecTransform``) jointly. The (inverse) mass matrix can be
+
+    * ``"diagonal"``: the marginal variances of the positions.
+    * ``"dense"``: the full covariance of the positions, which is represented by its
+      Cholesky factor to draw the momentums and compute the kinetic energy.
+    * ``"low_rank"``: the marginal variances plus the ``rank`` principal components
+      of the standardized positions whose variances deviate the most from 1. It
+      captures the strongest correlations in O(rank * d) time per leapfrog step,
+      where d is the number of positions.
 
     Reference:
         [1] "HMC algorithm parameters" from Stan Reference Manual
         https://mc-stan.org/docs/2_26/reference-manual/hmc-algorithm-parameters.html#euclidean-metric
-    """
-
-    def __init__(self):
-        self.mass_inv: RVDict = {}  # inverse mass matrices, aka the inverse "metric"
-        self.momentum_dists = {}  # distribution objects for generating momentums
 
-        self._adapters = {}
+    Args:
+        matrix_type: The structure of the mass matrix, defaults to "diagonal".
+        rank: The number of principal components of a "low_rank" mass matrix.
+    """
 
-    def initialize_momentums(self, positions: RVDict) -> RVDict:
+    def __init__(
+        self,
+        matrix_type: Literal["diagonal", "dense", "low_rank"] = "diagonal",
+        rank: int = 10,
+    ):
+        if matrix_type not in ("diagonal", "dense", "low_rank"):
+            raise ValueError(f"Unknown mass matrix type: {matrix_type}")
+        self.matrix_type = matrix_type
+        self.rank = rank
+        # inverse mass matrix, aka the inverse "metric"
+        self.mass_inv: Optional[MassInv] = None
+        # distribution object for generating momentums (diagonal mass matrix only)
+        self.momentum_dist: Optional[dist.Distribution] = None
+
+        self._adapter: Optional[WelfordCovariance] = None
+        # positions of the current window, for estimating the principal components
+        self._samples: List[torch.Tensor] = []
+
+    def initialize_momentums(self, positions: torch.Tensor) -> torch.Tensor:
         """
         Randomly draw momentum from MultivariateNormal(0, M). This momentum variable
-        is denoted as p in [1] and r in [2]. Additionally, for nodes that are seen
-        for the first time, this also initializes their (inverse) mass matrices to
-        the identity matrix.
+        is denoted as p in [1] and r in [2]. Additionally, if this is the first time
+        that momentums are drawn, this also initializes the (inverse) mass matrix
+        to the identity matrix.
 
         Args:
-            positions: RVDict corresponding to the positions of the energy function.
+            positions: Flat tensor of the positions of the energy function.
         """
-        momentums = {}
-        for node in positions:
-            # initialize M^{-1} for nodes that are seen for the first time
-            node_val = positions[node].flatten()
-            if node not in self.mass_inv:
-                self.mass_inv[node] = torch.ones_like(node_val)
-                self.momentum_dists[node] = dist.Normal(
-                    torch.zeros_like(node_val), torch.ones_like(node_val)
-                )
-            momentums[node] = self.momentum_dists[node].sample()
-        return momentums
-
-    def step(self, positions: RVDict):
-        for node, z in positions.items():
-            if node not in self._adapters:
-                self._adapters[node] = WelfordCovariance(diagonal=True)
-            self._adapters[node].step(z.flatten())
+        if self.mass_inv is None:
+            self.mass_inv = torch.ones_like(positions)
+            self.momentum_dist = dist.Normal(
+                torch.zeros_like(positions), torch.ones_like(positions)
+            )
+        mass_inv = self.mass_inv
+        if isinstance(mass_inv, DenseMassInv):
+            # p = L^{-T} @ z has a covariance of (L @ L^T)^{-1} = M
+            noise = torch.randn_like(positions).unsqueeze(-1)
+            return torch.linalg.solve_triangular(
+                mass_inv.scale_tril.mT, noise, upper=True
+            ).squeeze(-1)
+        if isinstance(mass_inv, LowRankMassInv):
+            # p = S^{-1} @ (I + U @ diag(eigvals^{-1/2} - 1) @ U^T) @ z
+            noise = torch.randn_like(positions)
+            proj = (noise.unsqueeze(-2) @ mass_inv.eigvecs).squeeze(-2)
+            proj = proj * (mass_inv.eigvals.rsqrt() - 1)
+            noise = noise + (proj.unsqueeze(-2) @ mass_inv.eigvecs.mT).squeeze(-2)
+            return noise / mass_inv.scale
+        assert self.momentum_dist is not None
+        return self.momentum_dist.sample()
+
+    def step(self, positions: torch.Tensor):
+        if self._adapter is None:
+            self._adapter = WelfordCovariance(diagonal=self.matrix_type != "dense")
+        self._adapter.step(positions)
+        if self.matrix_type == "low_rank":
+            self._samples.append(positions)
 
     def finalize(self) -> None:
-        for node, adapter in self._adapters.items():
+        if self._adapter is not None:
             try:
-                mass_inv = adapter.finalize()
-                self.momentum_dists[node] = dist.Normal(
-                    torch.zeros_like(mass_inv), torch.sqrt(mass_inv).reciprocal()
-                )
-                self.mass_inv[node] = mass_inv
+                covariance = self._adapter.finalize()
+                if self.matrix_type == "dense":
+                    self.mass_inv = DenseMassInv(torch.linalg.cholesky(covariance))
+                elif self.matrix_type == "low_rank":
+                    self.mass_inv = self._low_rank_mass_inv(covariance)
+                else:
+                    self._set_diagonal_mass_inv(covariance)
             except RuntimeError as e:
                 warnings.warn(str(e))
-                continue
-        # reset adapters to get ready for the next window
-        self._adapters = {}
+        # reset adapter to get ready for the next window
+        self._adapter = None
+        self._samples = []
+
+    def _set_diagonal_mass_inv(self, mass_inv: torch.Tensor) -> None:
+        self.momentum_dist = dist.Normal(
+            torch.zeros_like(mass_inv), torch.sqrt(mass_inv).reciprocal()
+        )
+        self.mass_inv = mass_inv
+
+    def set_mass_inv(self, mass_inv: MassInv, positions: torch.Tensor) -> None:
+        """
+        Sets the inverse mass matrix of the flat ``positions``, e.g. to warm start
+        from the mass matrix of a previous run (see ``HMCTuningState``). A diagonal
+        mass matrix is broadcast to the shape of the positions.
+        """
+        matrix_type = (
+            "dense"
+            if isinstance(mass_inv, DenseMassInv)
+            else "low_rank"
+            if isinstance(mass_inv, LowRankMassInv)
+            else "diagonal"
+        )
+        if matrix_type != self.matrix_type:
+            raise ValueError(
+                f"Expected a {self.matrix_type} mass matrix, but got a {matrix_type}"
+                " mass matrix."
+            )
+        size = (mass_inv if matrix_type == "diagonal" else mass_inv[0]).shape[-1:]
+        if size not in ((), (1,), positions.shape[-1:]):
+            raise ValueError(
+                f"The mass matrix is of size {size[0]}, but there are"
+                f" {positions.shape[-1]} positions."
+            )
+        if isinstance(mass_inv, torch.Tensor):
+            self._set_diagonal_mass_inv(
+                torch.broadcast_to(mass_inv.to(positions), positions.shape)
+            )
+        else:
+            self.mass_inv = mass_inv
+
+    def pool(self, adapters: Sequence["MassMatrixAdapter"]) -> None:
+        """Replaces the statistics of the current window with the pooled statistics
+        of ``adapters`` (e.g. of all chains, including this one), so that the next
+        call to ``finalize`` estimates the mass matrix from the positions of all of
+        them. The adapters in ``adapters`` are not modified."""
+        pooled = WelfordCovariance(diagonal=self.matrix_type != "dense")
+        samples = []
+        for adapter in adapters:
+            if adapter._adapter is not None:
+                pooled.merge(adapter._adapter)
+            samples.extend(adapter._samples)
+        self._adapter = pooled if pooled.count > 0 else None
+        self._samples = samples
+
+    def pool_batch(self) -> None:
+        """Pools the statistics of the current window across a batch of chains (the
+        leading dimension of the positions), so that every chain of the batch gets
+        the same mass matrix."""
+        if self._adapter is None:
+            return
+        self._adapter.pool_batch()
+        # every chain gets the positions of all of the chains
+        self._samples = [
+            sample.expand_as(positions)
+            for positions in self._samples
+            for sample in positions
+        ]
+
+    def _low_rank_mass_inv(self, variances: torch.Tensor) -> LowRankMassInv:
+        """Estimates the principal components of the positions of the current window
+        after standardizing them with the (regularized) marginal variances."""
+        scale = torch.sqrt(variances)
+        samples = torch.stack(self._samples, dim=-2)
+        count = samples.shape[-2]
+        samples = (samples - samples.mean(dim=-2, keepdim=True)) / scale.unsqueeze(-2)
+        _, singular_vals, eigvecs_t = torch.linalg.svd(
+            samples / math.sqrt(count - 1), full_matrices=False
+        )
+        # the centered samples span at most count - 1 dimensions
+        eigvals = singular_vals[..., : count - 1] ** 2
+        eigvecs = eigvecs_t[..., : count - 1, :].mT
+        # same regularization as WelfordCovariance: shrink the eigenvalues towards
+        # the ones of the diagonal mass matrix
+        eigvals = (count * eigvals + 5.0) / (count + 5.0)
+        # keep the components that deviate the most from the diagonal mass matrix,
+        # i.e. the narrowest as well as the widest directions
+        rank = min(self.rank, eigvals.shape[-1])
+        indices = torch.topk(eigvals.log().abs(), rank, dim=-1).indices
+        eigvals = torch.gather(eigvals, -1, indices)
+        eigvecs = torch.gather(
+            eigvecs, -1, indices.unsqueeze(-2).expand(eigvecs.shape[:-1] + (rank,))
+        )
+        return LowRankMassInv(scale, eigvecs, eigvals)
 
 
 class WelfordCovariance:
@@ -166,9 +392,14 @@ class WelfordCovariance:
     An implementation of Welford's online algorithm for estimating the (co)variance of
     samples.
 
+    The statistics of several estimators (e.g. of different chains) can be merged
+    with the parallel algorithm of Chan et al. [2].
+
     Reference:
         [1] "Algorithms for calculating variance" on Wikipedia
             https://en.wikipedia.org/wiki/Algorithms_for_calculating_variance#Welford's_online_algorithm
+        [2] Tony Chan, Gene Golub, and Randall LeVeque. "Updating Formulae and a
+            Pairwise Algorithm for Computing Sample Variances" (1979).
     """
 
     def __init__(self, diagonal: bool = True):
@@ -177,15 +408,55 @@ class WelfordCovariance:
         self._M2: Union[float, torch.Tensor] = 0.0
         self._diagonal = diagonal
 
+    @property
+    def count(self) -> int:
+        return self._count
+
+    def _outer(self, delta: torch.Tensor, delta2: torch.Tensor) -> torch.Tensor:
+        if self._diagonal:
+            return delta * delta2
+        # outer products (of each chain, if the samples are batched)
+        return delta.unsqueeze(-1) * delta2.unsqueeze(-2)
+
+    def merge(self, other: "WelfordCovariance") -> None:
+        """Merges the samples of ``other`` into this estimator, as if all of them had
+        been passed to ``step``. ``other`` is not modified."""
+        if other._count == 0:
+            return
+        count = self._count + other._count
+        delta = other._mean - self._mean
+        # the statistics are replaced rather than updated in place, so that they are
+        # never shared with other
+        self._mean = self._mean + delta * (other._count / count)
+        self._M2 = (
+            self._M2
+            + other._M2
+            + self._outer(delta, delta) * (self._count * other._count / count)
+        )
+        self._count = count
+
+    def pool_batch(self) -> None:
+        """Merges the statistics of a batch of chains (along the leading dimension of
+        the samples), so that the estimate of every chain is the (co)variance of the
+        samples of all chains."""
+        num_chains = len(self._mean)
+        mean = cast(torch.Tensor, self._mean)
+        pooled_mean = mean.mean(0)
+        delta = mean - pooled_mean
+        # the chains have the same number of samples
+        pooled_M2 = cast(torch.Tensor, self._M2).sum(0) + self._count * self._outer(
+            delta, delta
+        ).sum(0)
+        self._mean = pooled_mean.expand_as(mean).clone()
+        self._M2 = pooled_M2.expand_as(self._M2).clone()
+        self._count *= num_chains
+
     def step(self, sample: torch.Tensor) -> None:
         self._count += 1
         delta = sample - self._mean
         self._mean += delta / self._count
         delta2 = sample - self._mean
-        if self._diagonal:
-            self._M2 += delta * delta2
-        else:
-            self._M2 += torch.outer(delta, delta2)
+        self._M2 += self._outer(delta, delta2)
 
     def finalize(self, regularize: bool = True) -> torch.Tensor:
         if self._count < 2:
@@ -203,11 +474,155 @@ class WelfordCovariance:
         if self._diagonal:
             covariance += padding
         else:
-            covariance += padding * torch.eye(covariance.shape[0])
+            covariance += padding * torch.eye(covariance.shape[-1])
 
         return covariance
 
 
+class AdaptationChannel:
+    """
+    Exchanges the adaptation statistics of the proposers of chains that run in
+    different processes (or threads), so that every chain can pool the statistics of
+    all chains. Every chain posts its statistics, waits for the others at a barrier,
+    and reads the statistics of all chains. The chains must therefore exchange their
+    statistics at the same points of the adaptation.
+
+    Args:
+        barrier: A ``Barrier`` proxy (e.g. from a ``multiprocessing.Manager``, or a
+            ``threading.Barrier`` for threads) for all of the chains.
+        state: A shared ``dict`` proxy (or a ``dict`` for threads) to post the
+            statistics into.
+        chain_id: The index of the chain that uses the channel (see ``for_chain``).
+    """
+
+    def __init__(self, barrier: Any, state: Any, chain_id: int = 0) -> None:
+        self.barrier = barrier
+        self.state = state
+        self.chain_id = chain_id
+
+    def for_chain(self, chain_id: int) -> "AdaptationChannel":
+        """Returns the channel of the chain with index ``chain_id``."""
+        return AdaptationChannel(self.barrier, self.state, chain_id)
+
+    def exchange(self, value: Any) -> List[Any]:
+        """Posts ``value`` and returns the values posted by all of the chains, in the
+        order of the chains. ``value`` should not be modified afterwards, since it
+        may be shared with the other chains as is."""
+        self.state[self.chain_id] = value
+        self.barrier.wait()
+        values = [self.state[chain_id] for chain_id in range(self.barrier.parties)]
+        # make sure that every chain has read the values before they are replaced
+        self.barrier.wait()
+        return values
+
+    def abort(self) -> None:
+        """Release the other chains if the current chain fails."""
+        self.barrier.abort()
+
+
+class HMCTuningState(NamedTuple):
+    """
+    The adapted parameters of HMC or NUTS at the end of the adaptation, which can be
+    imported to warm start the adaptation of another run of the same model (e.g. on
+    updated data). A warm start begins with the imported step size (instead of
+    searching for a reasonable one) and mass matrix, and only re-estimates the mass
+    matrix if the adaptation has a window of at least ``window_size`` samples.
+    """
+
+    step_size: torch.Tensor
+    # inverse mass matrix of the flattened positions
+    mass_inv: MassInv
+    # number of samples of the window that the mass matrix was estimated from
+    window_size: int
+
+
+# the structured inverse mass matrices, keyed by the type tag that they are stored
+# with in a TuningCache
+_MASS_INV_TYPES = {"dense": DenseMassInv, "low_rank": LowRankMassInv}
+
+
+class TuningCache:
+    """
+    An on-disk cache of the tuning states of HMC and NUTS (see ``HMCTuningState``).
+    The states are keyed by the structure of the model, i.e. the names, shapes, and
+    dtypes of the target random variables (the queried random variables and their
+    latent ancestors) and the names of the observed random variables, but not by the
+    values of the observations, so that refitting a model to updated data warm starts
+    from the tuning state of the previous fit.
+
+    Args:
+        directory: The directory that the states are stored in, which is created if
+            it does not exist.
+    """
+
+    def __init__(self, directory: Union[str, "os.PathLike[str]"]) -> None:
+        self.directory = os.fspath(directory)
+
+    def key(self, world: World, target_rvs: Set[RVIdentifier], settings: Tuple) -> str:
+        """Returns the key of the tuning state of a sampler of ``target_rvs`` in
+        ``world``, where ``settings`` are the options of the sampler that the state
+        depends on (e.g. the type of the mass matrix)."""
+
+        def name(node: RVIdentifier) -> str:
+            function = node.function
+            return f"{function.__module__}.{function.__qualname__}{node.arguments!r}"
+
+        targets = sorted(
+            (name(node), tuple(world[node].shape), str(world[node].dtype))
+            for node in target_rvs
+        )
+        observations = sorted(name(node) for node in world.observations)
+        description = repr((targets, observations, settings))
+        return hashlib.sha1(description.encode()).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.pt")
+
+    def load(self, key: str) -> Optional[HMCTuningState]:
+        """Returns the tuning state with the given key, or None if there is none."""
+        path = self._path(key)
+        if not os.path.exists(path):
+            return None
+        try:
+            data = torch.load(path)
+            mass_inv_type, mass_inv = data["mass_inv_type"], data["mass_inv"]
+            if mass_inv_type == "diagonal":
+                (mass_inv,) = mass_inv
+            else:
+                mass_inv = _MASS_INV_TYPES[mass_inv_type](*mass_inv)
+            return HMCTuningState(data["step_size"], mass_inv, data["window_size"])
+        except Exception as e:
+            warnings.warn(f"Fails to load the tuning state from {path}: {str(e)}")
+            return None
+
+    def save(self, key: str, state: HMCTuningState) -> None:
+        """Stores the tuning state with the given key, replacing the previous one."""
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(key)
+        # write to a temporary file first, so that chains (or runs) that save at the
+        # same time do not corrupt the state that is being read
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        # the state is stored as plain tensors with a tag of the type of the mass
+        # matrix, so that it can be loaded with torch.load(weights_only=True)
+        if isinstance(state.mass_inv, torch.Tensor):
+            mass_inv_type, mass_inv = "diagonal", (state.mass_inv,)
+        else:
+            mass_inv_type = next(
+                tag
+                for tag, mass_inv_class in _MASS_INV_TYPES.items()
+                if isinstance(state.mass_inv, mass_inv_class)
+            )
+            mass_inv = tuple(state.mass_inv)
+        data = {
+            "step_size": state.step_size,
+            "mass_inv_type": mass_inv_type,
+            "mass_inv": mass_inv,
+            "window_size": state.window_size,
+        }
+        torch.save(data, tmp_path)
+        os.replace(tmp_path, path)
+
+
 class DictTransform:
     """
     A general class for applying a dictionary of Transforms to a dictionary of
@@ -229,19 +644,104 @@ class DictTransform:
         return {node: self.transforms[node].inv(val) for node, val in node_vals.items()}
 
     def log_abs_det_jacobian(
-        self, untransformed_vals: RVDict, transformed_vals: RVDict
+        self,
+        untransformed_vals: RVDict,
+        transformed_vals: RVDict,
+        reduce: Callable = torch.sum,
     ) -> torch.Tensor:
-        """Computes the sum of log det jacobian `log |dy/dx|` on the pairs of Tensors"""
+        """Computes the sum of log det jacobian `log |dy/dx|` on the pairs of Tensors.
+        The terms of each pair are summed up by ``reduce``."""
         jacobian = torch.tensor(0.0)
         for node in untransformed_vals:
-            jacobian = jacobian + (
-                self.transforms[node]
-                .log_abs_det_jacobian(untransformed_vals[node], transformed_vals[node])
-                .sum()
+            jacobian = jacobian + reduce(
+                self.transforms[node].log_abs_det_jacobian(
+                    untransformed_vals[node], transformed_vals[node]
+                )
             )
         return jacobian
 
 
+class DictToVecTransform:
+    """
+    Packs a dictionary of Tensors into a single Tensor whose last dimension is the
+    concatenation of the flattened values (and unpacks it back), so that vector
+    operations can be applied to all of the values at once. The layout (the slice
+    of each value) is computed once from an example dictionary.
+
+    Args:
+        example: Dict of Tensors with the shapes of the values to pack.
+        batch_shape: Leading dimensions of the values that are kept when packing
+            them, e.g. ``(num_chains,)`` for the values of a ``BatchedWorld``.
+    """
+
+    def __init__(self, example: RVDict, batch_shape: Tuple[int, ...] = ()):
+        self.batch_shape = torch.Size(batch_shape)
+        self._shapes: Dict[RVIdentifier, torch.Size] = {}
+        self._slices: Dict[RVIdentifier, slice] = {}
+        batch_numel = self.batch_shape.numel()
+        start = 0
+        for node, val in example.items():
+            end = start + val.numel() // batch_numel
+            self._shapes[node] = val.shape
+            self._slices[node] = slice(start, end)
+            start = end
+        self.size = start
+
+    def __call__(self, node_vals: RVDict) -> torch.Tensor:
+        """Pack the values of node_vals into a single Tensor"""
+        return torch.cat(
+            [
+                node_vals[node].reshape(self.batch_shape + (-1,))
+                for node in self._slices
+            ],
+            dim=-1,
+        )
+
+    def inv(self, vec: torch.Tensor) -> RVDict:
+        """Unpack the values of the nodes (as views) from vec"""
+        return {
+            node: vec[..., node_slice].reshape(self._shapes[node])
+            for node, node_slice in self._slices.items()
+        }
+
+
+def compile_value_and_grad(
+    fn: Callable[[torch.Tensor], torch.Tensor], example: torch.Tensor
+) -> Callable[[torch.Tensor], Tuple[torch.Tensor, torch.Tensor]]:
+    """
+    Traces fn at example into a single graph of the operations that compute its
+    value and the gradient of its sum with respect to the input (with ``torch.func``
+    and ``make_fx``), and compiles the graph with ``torch.compile``. The returned
+    function takes an input of the same shape as example and returns the value and
+    the gradient. Note that the Python control flow of fn is frozen at trace time.
+    This requires torch>=2.0.
+    """
+    # imported lazily since they are not available in older versions of torch
+    import torch.func
+    from torch.fx.experimental.proxy_tensor import make_fx
+
+    def value_and_sum(x: torch.Tensor) -> Tuple[torch.Tensor, torch.Tensor]:
+        value = fn(x)
+        return value.sum(), value
+
+    graph = make_fx(torch.func.grad(value_and_sum, has_aux=True))(example.detach())
+    # tensor constants (e.g. the parameters of distributions) are lifted by
+    # lift_fresh_copy when they are traced, which torch.compile cannot handle
+    for node in list(graph.graph.nodes):
+        if node.target is torch.ops.aten.lift_fresh_copy.default:
+            node.replace_all_uses_with(node.args[0])
+            graph.graph.erase_node(node)
+    graph.graph.eliminate_dead_code()
+    graph.recompile()
+    compiled = torch.compile(graph)
+
+    def compiled_value_and_grad(x: torch.Tensor) -> Tuple[torch.Tensor, torch.Tensor]:
+        grad, value = compiled(x)
+        return value, grad
+
+    return compiled_value_and_grad
+
+
 class RealSpaceTransform(DictTransform):
     """
     Transform a dictionary of Tensor values from a constrained space to the unconstrained
@@ -3,29 +3,36 @@
 # This source code is licensed under the MIT license found in the
 # LICENSE file in the root directory of this source tree.
 
-from typing import NamedTuple, Set, Tuple
+from typing import NamedTuple, Optional, Set, Tuple
 
 import torch
 from beanmachine.ppl.inference.proposer.hmc_proposer import HMCProposer
+from beanmachine.ppl.inference.proposer.hmc_utils import (
+    AdaptationChannel,
+    HMCTuningState,
+    MassInv,
+    TuningCache,
+)
 from beanmachine.ppl.inference.proposer.nnc import nnc_jit
 from beanmachine.ppl.model.rv_identifier import RVIdentifier
-from beanmachine.ppl.world import RVDict, World
+from beanmachine.ppl.world import BatchedWorld, World
+from typing_extensions import Literal
 
 
 class _TreeNode(NamedTuple):
-    positions: RVDict
-    momentums: RVDict
-    pe_grad: RVDict
+    positions: torch.Tensor
+    momentums: torch.Tensor
+    pe_grad: torch.Tensor
 
 
 class _Tree(NamedTuple):
     left: _TreeNode
     right: _TreeNode
-    proposal: RVDict
+    proposal: torch.Tensor
     pe: torch.Tensor
-    pe_grad: RVDict
+    pe_grad: torch.Tensor
     log_weight: torch.Tensor
-    sum_momentums: RVDict
+    sum_momentums: torch.Tensor
     sum_accept_prob: torch.Tensor
     num_proposals: torch.Tensor
     turned_or_diverged: torch.Tensor
@@ -36,16 +43,28 @@ class _TreeArgs(NamedTuple):
     direction: torch.Tensor
     step_size: torch.Tensor
     initial_energy: torch.Tensor
-    mass_inv: RVDict
+    mass_inv: MassInv
+
+
+def _leaf_idx_to_ckpt_idxs(leaf_idx: int) -> Tuple[int, int]:
+    """Returns the range of the checkpoints of the balanced subtrees that end at
+    leaf_idx (an odd index), or the checkpoint to store leaf_idx at (an even index),
+    in the iterative tree building algorithm."""
+    # the number of subtrees (of sizes 2, 4, ...) that are already complete
+    idx_max = bin(leaf_idx >> 1).count("1")
+    # the number of subtrees that end at leaf_idx, i.e. the number of trailing ones
+    num_subtrees = bin((~leaf_idx & (leaf_idx + 1)) - 1).count("1")
+    return idx_max - num_subtrees + 1, idx_max
 
 
 class NUTSProposer(HMCProposer):
     """
     The No-U-Turn Sampler (NUTS) as described in [1]. Unlike vanilla HMC, it does not
     require users to specify a trajectory length. The current implementation roughly
-    follows Algorithm 6 of [1]. If multinomial_sampling is True, then the next state
-    will be drawn from a multinomial distribution (weighted by acceptance probability,
-    as introduced in Appendix 2 of [2]) instead of drawn uniformly.
+    follows Algorithm 6 of [1], except that each subtree is built iteratively rather
+    than recursively (see ``_build_tree``). If multinomial_sampling is True, then the
+    next state will be drawn from a multinomial distribution (weighted by acceptance
+    probability, as introduced in Appendix 2 of [2]) instead of drawn uniformly.
 
     Reference:
         [1] Matthew Hoffman and Andrew Gelman. "The No-U-Turn Sampler: Adaptively
@@ -68,6 +87,20 @@ class NUTSProposer(HMCProposer):
         target_accept_prob: Target accept probability. Increasing this would lead to smaller step size. Defaults to 0.8.
         nnc_compile: If True, NNC compiler will be used to accelerate the
             inference.
+        mass_matrix_type: The structure of the adapted mass matrix, one of
+            "diagonal", "dense", or "low_rank". Defaults to "diagonal".
+        mass_matrix_rank: Number of principal components of a "low_rank" mass
+            matrix, defaults to 10.
+        compile_potential: If True, the potential energy and its gradient are
+            compiled with ``torch.compile`` (see ``HMCProposer``) and NNC is not
+            used. Defaults to False.
+        pool_adaptation: Whether to pool the adaptation statistics across the
+            chains (see ``HMCProposer``), defaults to False.
+        adaptation_channel: The channel through which the statistics are pooled
+            with the chains that run in other threads or processes.
+        tuning_state: The tuning state to warm start the adaptation from (see
+            ``HMCProposer``).
+        tuning_cache: The cache that the tuning state is loaded from and saved into.
     """
 
     def __init__(
@@ -83,7 +116,17 @@ class NUTSProposer(HMCProposer):
         multinomial_sampling: bool = True,
         target_accept_prob: float = 0.8,
         nnc_compile: bool = True,
+        mass_matrix_type: Literal["diagonal", "dense", "low_rank"] = "diagonal",
+        mass_matrix_rank: int = 10,
+        compile_potential: bool = False,
+        pool_adaptation: bool = False,
+        adaptation_channel: Optional[AdaptationChannel] = None,
+        tuning_state: Optional[HMCTuningState] = None,
+        tuning_cache: Optional[TuningCache] = None,
     ):
+        if isinstance(initial_world, BatchedWorld):
+            # the trees of different chains are built to different depths
+            raise NotImplementedError("NUTS does not support batched chains yet.")
         # note that trajectory_length is not used in NUTS
         super().__init__(
             initial_world,
@@ -95,30 +138,44 @@ class NUTSProposer(HMCProposer):
             adapt_mass_matrix=adapt_mass_matrix,
             target_accept_prob=target_accept_prob,
             nnc_compile=False,  # we will use NNC at NUTS level, not at HMC level
+            mass_matrix_type=mass_matrix_type,
+            mass_matrix_rank=mass_matrix_rank,
+            compile_potential=compile_potential,
+            pool_adaptation=pool_adaptation,
+            adaptation_channel=adaptation_channel,
+            tuning_state=tuning_state,
+            tuning_cache=tuning_cache,
         )
         self._max_tree_depth = max_tree_depth
         self._max_delta_energy = max_delta_energy
         self._multinomial_sampling = multinomial_sampling
-        if nnc_compile:
+        # buffers for the checkpoints of _build_tree: the momentums and the partial
+        # sums of momentums at the first leaf of each subtree that is being built,
+        # and the momentums at the leaf before it
+        ckpts_shape = (max(max_tree_depth, 1),) + self._positions.shape
+        self._momentum_ckpts = self._positions.new_empty(ckpts_shape)
+        self._sum_momentum_ckpts = self._positions.new_empty(ckpts_shape)
+        self._prev_momentum_ckpts = self._positions.new_empty(ckpts_shape)
+        if nnc_compile and not compile_potential:
             # pyre-ignore[8]
             self._build_tree_base_case = nnc_jit(self._build_tree_base_case)
 
     def _is_u_turning(
         self,
-        mass_inv: RVDict,
-        left_momentums: RVDict,
-        right_momentums: RVDict,
-        sum_momentums: RVDict,
+        mass_inv: MassInv,
+        left_momentums: torch.Tensor,
+        right_momentums: torch.Tensor,
+        sum_momentums: torch.Tensor,
     ) -> torch.Tensor:
         """The generalized U-turn condition, as described in [2] Appendix 4.2"""
-        left_r = torch.cat([left_momentums[node] for node in mass_inv])
-        right_r = torch.cat([right_momentums[node] for node in mass_inv])
-        rho = torch.cat([mass_inv[node] * sum_momentums[node] for node in mass_inv])
-        return (torch.dot(left_r, rho) <= 0) or (torch.dot(right_r, rho) <= 0)
+        rho = self._kinetic_grads(sum_momentums, mass_inv)
+        return (torch.dot(left_momentums, rho) <= 0) or (
+            torch.dot(right_momentums, rho) <= 0
+        )
 
     def _build_tree_base_case(self, root: _TreeNode, args: _TreeArgs) -> _Tree:
-        """Base case of the recursive tree building algorithm: take a single leapfrog
-        step in the specified direction and return a subtree."""
+        """Take a single leapfrog step in the specified direction and return a subtree
+        with a single leaf."""
         positions, momentums, pe, pe_grad = self._leapfrog_step(
             root.positions,
             root.momentums,
@@ -153,33 +210,133 @@ class NUTSProposer(HMCProposer):
         )
 
     def _build_tree(self, root: _TreeNode, tree_depth: int, args: _TreeArgs) -> _Tree:
-        """Build the binary tree by recursively build the left and right subtrees and
-        combine the two."""
-        if tree_depth == 0:
-            return self._build_tree_base_case(root, args)
-
-        # build the first half of the tree
-        sub_tree = self._build_tree(root, tree_depth - 1, args)
-        if sub_tree.turned_or_diverged:
-            return sub_tree
-
-        # build the other half of the tree
-        other_sub_tree = self._build_tree(
-            root=sub_tree.left if args.direction == -1 else sub_tree.right,
-            tree_depth=tree_depth - 1,
-            args=args,
-        )
+        """Build a subtree of 2^tree_depth leapfrog steps from root in the specified
+        direction. Rather than recursively building and combining the two halves of
+        the subtree, the leaves are built iteratively (as in Stan and NumPyro): the
+        next state is drawn from the leaves with uniform progressive sampling, and the
+        U-turn conditions of the balanced subtrees that end at each leaf are checked
+        against the momentums (and partial sums of momentums) that are checkpointed at
+        their first leaves, so that only O(tree_depth) leaves need to be kept."""
+        tree = self._build_tree_base_case(root, args)
+        if tree_depth == 0 or tree.turned_or_diverged:
+            return tree
+
+        first_leaf = last_leaf = tree.left
+        proposal, pe, pe_grad = tree.proposal, tree.pe, tree.pe_grad
+        log_weight = tree.log_weight
+        sum_momentums = tree.sum_momentums
+        sum_accept_prob = tree.sum_accept_prob
+        turned_or_diverged = tree.turned_or_diverged
+        self._momentum_ckpts[0] = first_leaf.momentums
+        self._sum_momentum_ckpts[0] = sum_momentums
+        num_leaves = 1
+        while num_leaves < 2**tree_depth:
+            leaf = self._build_tree_base_case(last_leaf, args)
+            prev_momentums = last_leaf.momentums
+            last_leaf = leaf.left
+            new_log_weight = torch.logaddexp(log_weight, leaf.log_weight)
+            sum_momentums = sum_momentums + leaf.sum_momentums
+            sum_accept_prob = sum_accept_prob + leaf.sum_accept_prob
+            leaf_idx = num_leaves
+            num_leaves += 1
+            if leaf.turned_or_diverged:
+                turned_or_diverged = leaf.turned_or_diverged
+                log_weight = new_log_weight
+                break
 
-        return self._combine_tree(
-            sub_tree, other_sub_tree, args.direction, args.mass_inv, biased=False
+            # uniform progressive sampling (Appendix 3.1 of [2])
+            log_leaf_prob = leaf.log_weight - new_log_weight
+            if torch.rand_like(log_leaf_prob).log() < log_leaf_prob:
+                proposal, pe, pe_grad = leaf.proposal, leaf.pe, leaf.pe_grad
+            log_weight = new_log_weight
+
+            idx_min, idx_max = _leaf_idx_to_ckpt_idxs(leaf_idx)
+            if leaf_idx % 2 == 0:
+                # the leaf is the first leaf of the subtrees that end at leaf_idx + 1
+                self._momentum_ckpts[idx_max] = last_leaf.momentums
+                self._sum_momentum_ckpts[idx_max] = sum_momentums
+                self._prev_momentum_ckpts[idx_max] = prev_momentums
+            else:
+                turned_or_diverged = self._is_iterative_u_turning(
+                    args.mass_inv, last_leaf.momentums, sum_momentums, idx_min, idx_max
+                )
+                if turned_or_diverged:
+                    break
+
+        if args.direction == -1:
+            left, right = last_leaf, first_leaf
+        else:
+            left, right = first_leaf, last_leaf
+        return _Tree(
+            left=left,
+            right=right,
+            proposal=proposal,
+            pe=pe,
+            pe_grad=pe_grad,
+            log_weight=log_weight,
+            sum_momentums=sum_momentums,
+            sum_accept_prob=sum_accept_prob,
+            num_proposals=torch.tensor(num_leaves),
+            turned_or_diverged=turned_or_diverged,
         )
 
+    def _is_iterative_u_turning(
+        self,
+        mass_inv: MassInv,
+        momentums: torch.Tensor,
+        sum_momentums: torch.Tensor,
+        idx_min: int,
+        idx_max: int,
+    ) -> torch.Tensor:
+        """Check the U-turn conditions of the balanced subtrees that end at the current
+        leaf (whose momentums are given), from the smallest to the largest one. The
+        subtree that starts at the i-th checkpoint has the subtree that starts at the
+        (i + 1)-th checkpoint as its second half."""
+        momentum_ckpts = self._momentum_ckpts
+        sum_momentum_ckpts = self._sum_momentum_ckpts
+        for i in range(idx_max, idx_min - 1, -1):
+            subtree_sum_momentums = (
+                sum_momentums - sum_momentum_ckpts[i] + momentum_ckpts[i]
+            )
+            if self._is_u_turning(
+                mass_inv, momentum_ckpts[i], momentums, subtree_sum_momentums
+            ):
+                return torch.tensor(True)
+            if i == idx_max:
+                # the halves of the smallest subtree are single leaves
+                continue
+            # More robust U-turn condition (see _combine_tree): each half extended by
+            # the adjacent leaf of the other half
+            first_half_last_momentums = self._prev_momentum_ckpts[i + 1]
+            second_half_first_momentums = momentum_ckpts[i + 1]
+            extended_sum_momentums = (
+                sum_momentum_ckpts[i + 1] - sum_momentum_ckpts[i] + momentum_ckpts[i]
+            )
+            if self._is_u_turning(
+                mass_inv,
+                momentum_ckpts[i],
+                second_half_first_momentums,
+                extended_sum_momentums,
+            ):
+                return torch.tensor(True)
+            extended_sum_momentums = (
+                sum_momentums
+                - sum_momentum_ckpts[i + 1]
+                + second_half_first_momentums
+                + first_half_last_momentums
+            )
+            if self._is_u_turning(
+                mass_inv, first_half_last_momentums, momentums, extended_sum_momentums
+            ):
+                return torch.tensor(True)
+        return torch.tensor(False)
+
     def _combine_tree(
         self,
         old_tree: _Tree,
         new_tree: _Tree,
         direction: torch.Tensor,
-        mass_inv: RVDict,
+        mass_inv: MassInv,
         biased: bool,
     ) -> _Tree:
         """Combine the old tree and the new tree into a single (large) tree. The new
@@ -215,10 +372,7 @@ class NUTSProposer(HMCProposer):
         else:
             left_tree, right_tree = old_tree, new_tree
 
-        sum_momentums = {
-            node: left_tree.sum_momentums[node] + right_tree.sum_momentums[node]
-            for node in left_tree.sum_momentums
-        }
+        sum_momentums = left_tree.sum_momentums + right_tree.sum_momentums
         turned_or_diverged = new_tree.turned_or_diverged or self._is_u_turning(
             mass_inv,
             left_tree.left.momentums,
@@ -228,10 +382,7 @@ class NUTSProposer(HMCProposer):
         # More robust U-turn condition
         # https://discourse.mc-stan.org/t/nuts-misses-u-turns-runs-in-circles-until-max-treedepth/9727
         if not turned_or_diverged and right_tree.num_proposals > 1:
-            extended_sum_momentums = {
-                node: left_tree.sum_momentums[node] + right_tree.left.momentums[node]
-                for node in sum_momentums
-            }
+            extended_sum_momentums = left_tree.sum_momentums + right_tree.left.momentums
             turned_or_diverged = self._is_u_turning(
                 mass_inv,
                 left_tree.left.momentums,
@@ -239,10 +390,9 @@ class NUTSProposer(HMCProposer):
                 extended_sum_momentums,
             )
         if not turned_or_diverged and left_tree.num_proposals > 1:
-            extended_sum_momentums = {
-                node: right_tree.sum_momentums[node] + left_tree.right.momentums[node]
-                for node in sum_momentums
-            }
+            extended_sum_momentums = (
+                right_tree.sum_momentums + left_tree.right.momentums
+            )
             turned_or_diverged = self._is_u_turning(
                 mass_inv,
                 left_tree.right.momentums,
@@ -267,9 +417,7 @@ class NUTSProposer(HMCProposer):
         if world is not self.world:
             # re-compute cached values since world was modified by other sources
             self.world = world
-            self._positions = self._to_unconstrained(
-                {node: world[node] for node in self._target_rvs}
-            )
+            self._positions = self._get_positions(world)
             self._pe, self._pe_grad = self._potential_grads(self._positions)
 
         momentums = self._initialize_momentums(self._positions)
@@ -317,7 +465,7 @@ class NUTSProposer(HMCProposer):
                 break
 
         if tree.proposal is not self._positions:
-            self.world = self.world.replace(self._to_unconstrained.inv(tree.proposal))
+            self.world = self.world.replace(self._to_constrained(tree.proposal))
             self._positions, self._pe, self._pe_grad = (
                 tree.proposal,
                 tree.pe,
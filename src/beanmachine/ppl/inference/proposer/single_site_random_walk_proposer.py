@@ -28,6 +28,10 @@ class SingleSiteRandomWalkProposer(SingleSiteAncestralProposer):
             return
         accept_prob = accept_log_prob.exp()
         val_shape = world[self.node].shape
+        if self.node.plate_size is not None:
+            # the sites of a plate are updated independently and share a step size
+            accept_prob = self._site_accept_prob
+            val_shape = val_shape[1:]
         if len(val_shape) == 0 or val_shape[0] == 1:
             target_acc_rate = self.target_acc_rate[False]
             c = torch.reciprocal(target_acc_rate)
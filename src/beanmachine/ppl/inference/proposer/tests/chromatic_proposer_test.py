@@ -0,0 +1,141 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+import beanmachine.ppl as bm
+import pytest
+import torch
+import torch.distributions as dist
+from beanmachine.ppl.inference.proposer.chromatic_proposer import (
+    ChromaticProposer,
+    color_nodes,
+)
+from beanmachine.ppl.world import World
+
+
+class ChainModel:
+    @bm.random_variable
+    def x(self, i):
+        if i == 0:
+            return dist.Normal(0.0, 1.0)
+        return dist.Normal(self.x(i - 1), 1.0)
+
+    @bm.random_variable
+    def y(self):
+        # x(3) and x(4) are co-parents of y
+        return dist.Normal(self.x(3) + self.x(4), 1.0)
+
+
+class IndependentModel:
+    @bm.random_variable
+    def x(self, i):
+        return dist.Normal(0.0, 1.0)
+
+    @bm.random_variable
+    def y(self, i):
+        return dist.Normal(self.x(i), 1.0)
+
+
+class SwitchModel:
+    @bm.random_variable
+    def z(self):
+        return dist.Bernoulli(0.5)
+
+    @bm.random_variable
+    def a(self):
+        return dist.Normal(0.0, 1.0)
+
+    @bm.random_variable
+    def b(self):
+        return dist.Normal(0.0, 1.0)
+
+    @bm.random_variable
+    def c(self):
+        return dist.Normal(0.0, 1.0)
+
+    @bm.random_variable
+    def y(self):
+        if self.z():
+            return dist.Normal(self.a(), 1.0)
+        return dist.Normal(self.b(), 1.0)
+
+
+def test_color_nodes():
+    model = ChainModel()
+    world = World.initialize_world([model.x(4)], {model.y(): torch.tensor(1.0)})
+    color_classes = color_nodes(world, world.latent_nodes)
+    assert sorted(len(c) for c in color_classes) == [2, 3]
+    for color_class in color_classes:
+        indices = sorted(node.arguments[-1] for node in color_class)
+        assert all(j - i > 1 for i, j in zip(indices, indices[1:]))
+        # the co-parents of y have different colors
+        assert {model.x(3), model.x(4)} - set(color_class)
+
+
+@pytest.mark.parametrize("batch_chains", [False, True])
+def test_chromatic_inference(batch_chains):
+    model = IndependentModel()
+    queries = [model.x(i) for i in range(5)]
+    observations = {model.y(i): torch.tensor(1.0) for i in range(5)}
+    mh = bm.SingleSiteAncestralMetropolisHastings(chromatic=True)
+    world = World.initialize_world(queries, observations)
+    (proposer,) = mh.get_proposers(world, world.latent_nodes, 0)
+    assert isinstance(proposer, ChromaticProposer)
+    assert len(proposer.proposers) == 5
+
+    samples = mh.infer(
+        queries,
+        observations,
+        num_samples=500,
+        num_chains=2,
+        show_progress_bar=False,
+        batch_chains=batch_chains,
+        static_structure=True,
+    )
+    # the posterior of each x(i) is Normal(0.5, sqrt(0.5))
+    means = torch.stack([samples[q] for q in queries]).mean()
+    assert means.item() == pytest.approx(0.5, abs=0.1)
+
+
+def test_chromatic_inference_with_changing_structure():
+    model = SwitchModel()
+    mh = bm.SingleSiteAncestralMetropolisHastings(chromatic=True)
+    samples = mh.infer(
+        [model.z(), model.c()],
+        {model.y(): torch.tensor(3.0)},
+        num_samples=20,
+        num_chains=1,
+        show_progress_bar=False,
+    )
+    assert samples[model.z()].shape == (1, 20)
+    assert samples[model.c()].shape == (1, 20)
+
+
+@pytest.mark.parametrize("static_structure", [False, True])
+def test_chromatic_proposer_batches_static_structure_only(
+    monkeypatch, static_structure
+):
+    model = IndependentModel()
+    queries = [model.x(i) for i in range(3)]
+    observations = {model.y(i): torch.tensor(1.0) for i in range(3)}
+    world = World.initialize_world(
+        queries, observations, static_structure=static_structure
+    )
+    mh = bm.SingleSiteAncestralMetropolisHastings(chromatic=True)
+    (proposer,) = mh.get_proposers(world, world.latent_nodes, 0)
+    num_sequential = 0
+    propose_sequentially = proposer._propose_sequentially
+
+    def counting_propose_sequentially(world):
+        nonlocal num_sequential
+        num_sequential += 1
+        return propose_sequentially(world)
+
+    monkeypatch.setattr(
+        proposer, "_propose_sequentially", counting_propose_sequentially
+    )
+    for _ in range(5):
+        world, _ = proposer.propose(world)
+    # batching is decided from the structure of the world, never from the values
+    assert num_sequential == (0 if static_structure else 5)
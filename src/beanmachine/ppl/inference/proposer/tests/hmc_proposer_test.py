@@ -3,11 +3,14 @@
 # This source code is licensed under the MIT license found in the
 # LICENSE file in the root directory of this source tree.
 
+from unittest.mock import patch
+
 import beanmachine.ppl as bm
 import pytest
 import torch
 import torch.distributions as dist
 from beanmachine.ppl.inference.proposer.hmc_proposer import HMCProposer
+from beanmachine.ppl.inference.proposer.hmc_utils import HMCTuningState, TuningCache
 from beanmachine.ppl.world import World
 
 
@@ -41,10 +44,8 @@ def test_potential_grads(hmc):
     pe, pe_grad = hmc._potential_grads(hmc._positions)
     assert isinstance(pe, torch.Tensor)
     assert pe.numel() == 1
-    for node, z in hmc._positions.items():
-        assert node in pe_grad
-        assert isinstance(pe_grad[node], torch.Tensor)
-        assert pe_grad[node].shape == z.shape
+    assert isinstance(pe_grad, torch.Tensor)
+    assert pe_grad.shape == hmc._positions.shape
 
 
 def test_kinetic_grads(hmc):
@@ -53,10 +54,8 @@ def test_kinetic_grads(hmc):
     assert isinstance(ke, torch.Tensor)
     assert ke.numel() == 1
     ke_grad = hmc._kinetic_grads(momentums, hmc._mass_inv)
-    for node, z in hmc._positions.items():
-        assert node in ke_grad
-        assert isinstance(ke_grad[node], torch.Tensor)
-        assert len(ke_grad[node]) == z.numel()
+    assert isinstance(ke_grad, torch.Tensor)
+    assert ke_grad.shape == hmc._positions.shape
 
 
 def test_leapfrog_step(hmc):
@@ -65,8 +64,31 @@ def test_leapfrog_step(hmc):
     new_positions, new_momentums, pe, pe_grad = hmc._leapfrog_step(
         hmc._positions, momentums, step_size, hmc._mass_inv
     )
-    assert momentums == new_momentums
-    assert new_positions == hmc._positions
+    assert torch.equal(momentums, new_momentums)
+    assert torch.equal(new_positions, hmc._positions)
+
+
+@bm.random_variable
+def scale():
+    return dist.HalfNormal(torch.ones(2, 3))
+
+
+@bm.random_variable
+def loc():
+    return dist.Normal(torch.zeros(4), scale().sum())
+
+
+def test_flat_positions():
+    world = World()
+    world.call(loc())
+    hmc = HMCProposer(
+        world, world.latent_nodes, 10, trajectory_length=1.0, nnc_compile=False
+    )
+    # the positions of all of the nodes are packed into a single vector
+    assert hmc._positions.shape == (10,)
+    values = hmc._to_constrained(hmc._positions)
+    for node in world.latent_nodes:
+        assert torch.allclose(values[node], world[node])
 
 
 @pytest.mark.parametrize(
@@ -88,3 +110,114 @@ def test_step_size_exception(algorithm):
             num_samples=20,
             num_chains=1,
         )
+
+
+@pytest.mark.parametrize("mass_matrix_type", ["dense", "low_rank"])
+def test_correlated_mass_matrix(world, mass_matrix_type):
+    hmc = HMCProposer(
+        world,
+        world.latent_nodes,
+        100,
+        trajectory_length=1.0,
+        nnc_compile=False,
+        mass_matrix_type=mass_matrix_type,
+        mass_matrix_rank=1,
+    )
+    momentums = hmc._initialize_momentums(hmc._positions)
+    for _ in range(100):
+        world, _ = hmc.propose(world)
+        hmc.do_adaptation()
+    assert not isinstance(hmc._mass_inv, torch.Tensor)
+    ke = hmc._kinetic_energy(momentums, hmc._mass_inv)
+    ke_grad = hmc._kinetic_grads(momentums, hmc._mass_inv)
+    assert torch.allclose(ke, torch.dot(momentums, ke_grad) / 2)
+
+
+def test_compiled_potential_grads(world):
+    # the joint log prob of the world is cached
+    world.log_prob()
+    hmc = HMCProposer(
+        world,
+        {foo()},
+        10,
+        trajectory_length=1.0,
+        nnc_compile=False,
+        compile_potential=True,
+    )
+    compiled_fn = hmc._compiled_potential_grads
+    # compilation did not fall back to the uncompiled potential energy
+    assert hmc._compile_potential and compiled_fn is not None
+    positions = hmc._positions + 0.1
+    pe, pe_grad = hmc._potential_grads(positions)
+    hmc._compile_potential = False
+    expected_pe, expected_grad = hmc._potential_grads(positions)
+    assert torch.allclose(pe, expected_pe)
+    assert torch.allclose(pe_grad, expected_grad)
+
+    hmc._compile_potential = True
+    # the compiled function is reused while the structure and the values of the
+    # other latent variables are unchanged
+    world = world.replace({foo(): torch.tensor(0.3)})
+    hmc.propose(world)
+    assert hmc._compiled_potential_grads is compiled_fn
+    # bar is not proposed by hmc, so changing its value invalidates the function
+    hmc.propose(hmc.world.replace({bar(): torch.tensor(2.0)}))
+    assert hmc._compiled_potential_grads is not compiled_fn
+    _, new_grad = hmc._potential_grads(positions)
+    assert not torch.allclose(new_grad, pe_grad)
+    hmc._compile_potential = False
+    assert torch.allclose(new_grad, hmc._potential_grads(positions)[1])
+
+
+def test_warm_start_tuning_state(world):
+    state = HMCTuningState(torch.tensor(0.3), torch.tensor([0.5, 2.0]), 50)
+    with patch.object(HMCProposer, "_find_reasonable_step_size") as find_step_size:
+        hmc = HMCProposer(
+            world,
+            world.latent_nodes,
+            20,
+            trajectory_length=1.0,
+            nnc_compile=False,
+            tuning_state=state,
+        )
+    # the search for a reasonable step size is skipped
+    find_step_size.assert_not_called()
+    assert torch.isclose(hmc.step_size, state.step_size)
+    assert torch.allclose(hmc._mass_inv, state.mass_inv)
+    for _ in range(20):
+        world, _ = hmc.propose(world)
+        hmc.do_adaptation()
+    hmc.finish_adaptation()
+    # the adaptation is shorter than the window of the imported mass matrix
+    assert torch.allclose(hmc._mass_inv, state.mass_inv)
+    assert hmc.tuning_state.window_size == 50
+
+
+def test_tuning_cache(world, tmp_path):
+    cache = TuningCache(tmp_path)
+    hmc = HMCProposer(
+        world,
+        world.latent_nodes,
+        100,
+        trajectory_length=1.0,
+        nnc_compile=False,
+        tuning_cache=cache,
+    )
+    for _ in range(100):
+        world, _ = hmc.propose(world)
+        hmc.do_adaptation()
+    hmc.finish_adaptation()
+    state = hmc.tuning_state
+    assert state.window_size > 0
+
+    # the tuning state is loaded from the cache
+    hmc = HMCProposer(
+        world,
+        world.latent_nodes,
+        100,
+        trajectory_length=1.0,
+        nnc_compile=False,
+        tuning_cache=cache,
+    )
+    assert torch.isclose(hmc.step_size, state.step_size)
+    assert torch.allclose(hmc._mass_inv, state.mass_inv)
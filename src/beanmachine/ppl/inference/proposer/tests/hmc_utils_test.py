@@ -4,6 +4,7 @@
 # LICENSE file in the root directory of this source tree.
 
 import warnings
+from functools import partial
 
 import beanmachine.ppl as bm
 import numpy as np
@@ -11,9 +12,15 @@ import pytest
 import torch
 import torch.distributions as dist
 from beanmachine.ppl.inference.proposer.hmc_utils import (
+    DenseMassInv,
+    DictToVecTransform,
     DualAverageAdapter,
+    HMCTuningState,
+    LowRankMassInv,
+    mass_inv_matmul,
     MassMatrixAdapter,
     RealSpaceTransform,
+    TuningCache,
     WelfordCovariance,
     WindowScheme,
 )
@@ -95,22 +102,45 @@ def test_large_window_scheme(num_adaptive_samples):
         assert win2 == win1 * 2
 
 
+@pytest.mark.parametrize("min_window_size", [25, 50, 100, 1000])
+def test_window_scheme_with_min_window_size(min_window_size):
+    num_adaptive_samples = 300
+    scheme = WindowScheme(num_adaptive_samples, min_window_size)
+    window_sizes = []
+    for _ in range(num_adaptive_samples):
+        if scheme.is_in_window and scheme.is_end_window:
+            window_sizes.append(scheme._window_size)
+        scheme.step()
+    if min_window_size > num_adaptive_samples:
+        # no window is created if the minimum window does not fit
+        assert not window_sizes
+    else:
+        assert min(window_sizes) >= min_window_size
+        assert scheme.last_window_size == window_sizes[-1]
+
+
+def test_dual_average_adapter_warm_start():
+    adapter = DualAverageAdapter(torch.tensor(0.1), warm_start=True)
+    epsilon = adapter.step(torch.tensor(0.8))
+    # the step size stays at the warm step size if the target is met
+    assert torch.isclose(epsilon, torch.tensor(0.1))
+
+
 def test_mass_matrix_adapter():
     model = SampleModel()
     world = World()
     world.call(model.bar())
     positions = RealSpaceTransform(world, world.latent_nodes)(dict(world))
+    positions = DictToVecTransform(positions)(positions)
     mass_matrix_adapter = MassMatrixAdapter()
     momentums = mass_matrix_adapter.initialize_momentums(positions)
-    for node, z in positions.items():
-        assert node in momentums
-        assert isinstance(momentums[node], torch.Tensor)
-        assert len(momentums[node]) == z.numel()
-        # after seeing the nodes for the first time, the adapter should've initialized
-        # the mass matrix and the distribution to generate momentum
-        assert node in mass_matrix_adapter.mass_inv
-        assert node in mass_matrix_adapter.momentum_dists
-    mass_inv_old = mass_matrix_adapter.mass_inv.copy()
+    assert isinstance(momentums, torch.Tensor)
+    assert momentums.shape == positions.shape
+    # after drawing momentums for the first time, the adapter should've initialized
+    # the mass matrix and the distribution to generate momentum
+    assert mass_matrix_adapter.mass_inv is not None
+    assert mass_matrix_adapter.momentum_dist is not None
+    mass_inv_old = mass_matrix_adapter.mass_inv.clone()
     mass_matrix_adapter.step(positions)
 
     with warnings.catch_warnings():
@@ -118,8 +148,141 @@ def test_mass_matrix_adapter():
         mass_matrix_adapter.finalize()
 
     # mass matrix adapter has seen less than 2 samples, so mass_inv is not updated
-    for node in mass_inv_old:
-        assert torch.allclose(mass_inv_old[node], mass_matrix_adapter.mass_inv[node])
+    assert torch.allclose(mass_inv_old, mass_matrix_adapter.mass_inv)
+
+
+@pytest.mark.parametrize("matrix_type", ["dense", "low_rank"])
+def test_correlated_mass_matrix_adapter(matrix_type):
+    torch.manual_seed(0)
+    covariance = torch.tensor([[4.0, 1.9, 0.0], [1.9, 1.0, 0.0], [0.0, 0.0, 0.25]])
+    samples = dist.MultivariateNormal(torch.zeros(3), covariance).sample((5000,))
+    mass_matrix_adapter = MassMatrixAdapter(matrix_type, rank=2)
+    # the mass matrix is initialized to the identity
+    assert mass_matrix_adapter.initialize_momentums(samples[0]).shape == (3,)
+    assert torch.equal(mass_matrix_adapter.mass_inv, torch.ones(3))
+    for sample in samples:
+        mass_matrix_adapter.step(sample)
+    mass_matrix_adapter.finalize()
+
+    mass_inv = mass_matrix_adapter.mass_inv
+    expected_type = DenseMassInv if matrix_type == "dense" else LowRankMassInv
+    assert isinstance(mass_inv, expected_type)
+    # M^{-1} approximates the covariance of the positions
+    actual = torch.stack([mass_inv_matmul(mass_inv, e) for e in torch.eye(3)])
+    assert torch.allclose(actual, covariance, atol=0.15)
+    # the momentums are drawn from Normal(0, M)
+    momentums = torch.stack(
+        [mass_matrix_adapter.initialize_momentums(samples[0]) for _ in range(5000)]
+    )
+    assert torch.allclose(
+        torch.cov(momentums.T), torch.linalg.inv(actual), rtol=0.1, atol=0.3
+    )
+
+
+def test_batched_dense_mass_matrix_adapter():
+    samples = torch.randn(20, 4, 3)
+    mass_matrix_adapter = MassMatrixAdapter("dense")
+    for sample in samples:
+        mass_matrix_adapter.step(sample)
+    mass_matrix_adapter.finalize()
+    # each chain has its own mass matrix
+    mass_inv = mass_matrix_adapter.mass_inv
+    assert mass_inv.scale_tril.shape == (4, 3, 3)
+    assert mass_matrix_adapter.initialize_momentums(samples[0]).shape == (4, 3)
+    assert mass_inv_matmul(mass_inv, samples[0]).shape == (4, 3)
+
+    with pytest.raises(ValueError):
+        MassMatrixAdapter("full")
+
+
+def test_set_mass_inv():
+    positions = torch.zeros(3)
+    adapter = MassMatrixAdapter()
+    # a diagonal mass matrix is broadcast to the positions
+    adapter.set_mass_inv(torch.tensor(2.0), positions)
+    assert torch.allclose(adapter.mass_inv, torch.full((3,), 2.0))
+    momentums = adapter.initialize_momentums(positions)
+    assert momentums.shape == positions.shape
+
+    dense_adapter = MassMatrixAdapter("dense")
+    scale_tril = torch.eye(3) * 2
+    dense_adapter.set_mass_inv(DenseMassInv(scale_tril), positions)
+    assert torch.equal(dense_adapter.mass_inv.scale_tril, scale_tril)
+    with pytest.raises(ValueError):
+        dense_adapter.set_mass_inv(torch.ones(3), positions)
+    with pytest.raises(ValueError):
+        dense_adapter.set_mass_inv(DenseMassInv(torch.eye(2)), positions)
+
+
+def test_tuning_cache(tmp_path):
+    world = World()
+    world.call(SampleModel().bar())
+    cache = TuningCache(tmp_path / "cache")
+    key = cache.key(world, world.latent_nodes, ("diagonal",))
+    assert cache.load(key) is None
+    state = HMCTuningState(torch.tensor(0.5), torch.tensor([2.0]), 25)
+    cache.save(key, state)
+    loaded = cache.load(key)
+    assert torch.equal(loaded.step_size, state.step_size)
+    assert torch.equal(loaded.mass_inv, state.mass_inv)
+    assert loaded.window_size == state.window_size
+
+    # the values of the observations are not a part of the key
+    model = SampleModel()
+    world1 = World({model.bar(): torch.tensor(1.0)})
+    world1.call(model.bar())
+    world2 = World({model.bar(): torch.tensor(2.0)})
+    world2.call(model.bar())
+    key1 = cache.key(world1, world1.latent_nodes, ("diagonal",))
+    assert key1 == cache.key(world2, world2.latent_nodes, ("diagonal",))
+    assert key1 != key
+    assert key1 != cache.key(world1, world1.latent_nodes, ("dense",))
+
+
+@pytest.mark.parametrize(
+    "mass_inv",
+    [
+        DenseMassInv(torch.tensor([[1.0, 0.0], [0.5, 2.0]])),
+        LowRankMassInv(
+            torch.tensor([1.0, 2.0]), torch.eye(2)[:, :1], torch.tensor([3.0])
+        ),
+    ],
+)
+def test_tuning_cache_structured_mass_inv(tmp_path, monkeypatch, mass_inv):
+    cache = TuningCache(tmp_path)
+    state = HMCTuningState(torch.tensor(0.5), mass_inv, 25)
+    cache.save("key", state)
+    # the state can be loaded without unpickling arbitrary classes, which is the
+    # default of torch.load in recent versions of torch
+    monkeypatch.setattr(torch, "load", partial(torch.load, weights_only=True))
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        # raised by the weights only unpickler of some versions of torch
+        warnings.filterwarnings("ignore", message="TypedStorage is deprecated")
+        loaded = cache.load("key")
+    assert type(loaded.mass_inv) is type(mass_inv)
+    for loaded_tensor, tensor in zip(loaded.mass_inv, mass_inv):
+        assert torch.equal(loaded_tensor, tensor)
+    assert torch.equal(loaded.step_size, state.step_size)
+    assert loaded.window_size == state.window_size
+
+
+def test_dict_to_vec_transform():
+    values = {"a": torch.randn(3, 2), "b": torch.randn(3), "c": torch.randn(3, 4, 5)}
+    transform = DictToVecTransform(values)
+    vec = transform(values)
+    assert vec.shape == (6 + 3 + 60,)
+    assert transform.size == vec.numel()
+    for key, val in transform.inv(vec).items():
+        assert torch.equal(val, values[key])
+
+    # the leading (chain) dimension is kept
+    transform = DictToVecTransform(values, batch_shape=(3,))
+    vec = transform(values)
+    assert vec.shape == (3, 2 + 1 + 20)
+    assert torch.equal(vec[1, 2], values["b"][1])
+    for key, val in transform.inv(vec).items():
+        assert torch.equal(val, values[key])
 
 
 def test_diagonal_welford_covariance():
@@ -150,6 +313,84 @@ def test_dense_welford_covariance():
     assert (torch.argsort(regularized_cov) == torch.argsort(estimated_cov)).all()
 
 
+@pytest.mark.parametrize("diagonal", [True, False])
+def test_merge_welford_covariance(diagonal):
+    samples = torch.randn(30, 3) * torch.tensor([1.0, 2.0, 3.0]) + torch.arange(3.0)
+    expected = WelfordCovariance(diagonal)
+    for sample in samples:
+        expected.step(sample)
+    merged = WelfordCovariance(diagonal)
+    for chunk in samples.split([5, 15, 10]):
+        welford = WelfordCovariance(diagonal)
+        for sample in chunk:
+            welford.step(sample)
+        merged.merge(welford)
+    assert merged.count == 30
+    assert torch.allclose(
+        merged.finalize(regularize=False), expected.finalize(regularize=False)
+    )
+
+    # the chains of a batch are pooled along the leading dimension
+    batched = WelfordCovariance(diagonal)
+    for sample in samples.reshape(3, 10, 3).transpose(0, 1):
+        batched.step(sample)
+    batched.pool_batch()
+    assert batched.count == 30
+    covariance = batched.finalize(regularize=False)
+    assert covariance.shape[0] == 3
+    for chain_covariance in covariance:
+        assert torch.allclose(chain_covariance, expected.finalize(regularize=False))
+
+
+@pytest.mark.parametrize("matrix_type", ["diagonal", "dense", "low_rank"])
+def test_pool_mass_matrix_adapter(matrix_type):
+    samples = torch.randn(3, 20, 4) * torch.tensor([0.1, 1.0, 2.0, 5.0])
+    expected = MassMatrixAdapter(matrix_type, rank=2)
+    for sample in samples.flatten(end_dim=1):
+        expected.step(sample)
+    adapters = []
+    for chain_samples in samples:
+        adapter = MassMatrixAdapter(matrix_type, rank=2)
+        for sample in chain_samples:
+            adapter.step(sample)
+        adapters.append(adapter)
+    adapters[0].pool(adapters)
+    adapters[0].finalize()
+    expected.finalize()
+
+    def components(mass_inv):
+        return mass_inv if isinstance(mass_inv, tuple) else (mass_inv,)
+
+    pooled = components(adapters[0].mass_inv)
+    for actual, expected in zip(pooled, components(expected.mass_inv)):
+        # the eigenvectors are only unique up to their signs
+        assert torch.allclose(actual.abs(), expected.abs(), atol=1e-5)
+    # the other adapters are not modified
+    assert adapters[1]._adapter.count == 20
+
+    batched = MassMatrixAdapter(matrix_type, rank=2)
+    for sample in samples.transpose(0, 1):
+        batched.step(sample)
+    batched.pool_batch()
+    batched.finalize()
+    for actual, expected in zip(components(batched.mass_inv), pooled):
+        assert actual.shape == (3,) + expected.shape
+        for chain_actual in actual:
+            assert torch.allclose(chain_actual.abs(), expected.abs(), atol=1e-5)
+
+
+def test_pool_dual_average_adapter():
+    adapters = [DualAverageAdapter(torch.tensor(step)) for step in [0.1, 1.0]]
+    for adapter, prob in zip(adapters, [0.9, 0.3]):
+        for _ in range(10):
+            adapter.step(torch.tensor(prob))
+    step_sizes = torch.stack([adapter.finalize() for adapter in adapters])
+    pooled = DualAverageAdapter(torch.tensor(1.0))
+    pooled.pool(adapters)
+    assert torch.allclose(pooled.finalize(), step_sizes.log().mean().exp())
+    assert torch.allclose(pooled._H, (adapters[0]._H + adapters[1]._H) / 2)
+
+
 def test_welford_exception():
     welford = WelfordCovariance()
     welford.step(torch.rand(5))
@@ -3,6 +3,8 @@
 # This source code is licensed under the MIT license found in the
 # LICENSE file in the root directory of this source tree.
 
+import itertools
+
 import beanmachine.ppl as bm
 import pytest
 import torch
@@ -88,3 +90,62 @@ def test_build_tree(tree_node, tree_args, nuts):
     assert isinstance(tree, _Tree)
     assert tree.turned_or_diverged or (tree.left is not tree.right)
     assert tree.turned_or_diverged or tree.num_proposals == 2**tree_depth
+
+
+def _build_tree_recursively(nuts, root, tree_depth, args):
+    # reference implementation of the recursive tree building algorithm
+    if tree_depth == 0:
+        return nuts._build_tree_base_case(root, args)
+    sub_tree = _build_tree_recursively(nuts, root, tree_depth - 1, args)
+    if sub_tree.turned_or_diverged:
+        return sub_tree
+    other_sub_tree = _build_tree_recursively(
+        nuts,
+        sub_tree.left if args.direction == -1 else sub_tree.right,
+        tree_depth - 1,
+        args,
+    )
+    return nuts._combine_tree(
+        sub_tree, other_sub_tree, args.direction, args.mass_inv, biased=False
+    )
+
+
+@bm.random_variable
+def baz():
+    return dist.Normal(torch.zeros(3), torch.tensor([1.0, 2.0, 5.0]))
+
+
+@pytest.mark.parametrize("direction", [1, -1])
+def test_iterative_build_tree(direction):
+    torch.manual_seed(0)
+    world = World()
+    world.call(baz())
+    nuts = NUTSProposer(world, world.latent_nodes, 10, nnc_compile=False)
+    num_turned = 0
+    for _, step_size in itertools.product(range(25), [0.2, 0.7, 1.5, 3.0]):
+        root = _TreeNode(
+            nuts._positions, nuts._initialize_momentums(nuts._positions), nuts._pe_grad
+        )
+        initial_energy = nuts._hamiltonian(
+            nuts._positions, root.momentums, nuts._mass_inv, nuts._pe
+        )
+        args = _TreeArgs(
+            log_slice=-initial_energy,
+            direction=torch.tensor(direction),
+            step_size=torch.tensor(step_size),
+            initial_energy=initial_energy,
+            mass_inv=nuts._mass_inv,
+        )
+        for tree_depth in range(6):
+            tree = nuts._build_tree(root, tree_depth, args)
+            expected = _build_tree_recursively(nuts, root, tree_depth, args)
+            assert bool(tree.turned_or_diverged) == bool(expected.turned_or_diverged)
+            assert tree.num_proposals == expected.num_proposals
+            for field in ["log_weight", "sum_momentums", "sum_accept_prob"]:
+                actual, expected_val = getattr(tree, field), getattr(expected, field)
+                assert torch.allclose(actual, expected_val, atol=1e-4)
+            assert torch.allclose(tree.left.positions, expected.left.positions)
+            assert torch.allclose(tree.right.positions, expected.right.positions)
+            num_turned += bool(tree.turned_or_diverged)
+    # the U-turn conditions of the subtrees are exercised
+    assert 0 < num_turned < 25 * 4 * 6
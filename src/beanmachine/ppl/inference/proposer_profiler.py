@@ -0,0 +1,158 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+from __future__ import annotations
+
+import dataclasses
+from typing import Dict, Iterable, Optional, Set, Tuple
+
+import torch
+from beanmachine.ppl.inference.proposer.base_proposer import BaseProposer
+from beanmachine.ppl.inference.proposer.base_single_site_mh_proposer import (
+    BaseSingleSiteMHProposer,
+)
+from beanmachine.ppl.inference.proposer.chromatic_proposer import ChromaticProposer
+from beanmachine.ppl.inference.proposer.hmc_proposer import HMCProposer
+from beanmachine.ppl.inference.proposer.sequential_proposer import SequentialProposer
+from beanmachine.ppl.model.rv_identifier import RVIdentifier
+
+
+@dataclasses.dataclass
+class ProposerStats:
+    """
+    The aggregated records of the proposals of a proposer type for an RV family. The
+    times are in nanoseconds.
+    """
+
+    num_proposals: int = 0
+    # for a batch of chains, the fraction of the chains that accepted the proposal
+    num_accepted: float = 0.0
+    # proposals that raised an exception (including the ones that were skipped)
+    num_errors: int = 0
+    propose_time: int = 0
+    num_adaptations: int = 0
+    adaptation_time: int = 0
+
+    @property
+    def acceptance_rate(self) -> float:
+        num_completed = self.num_proposals - self.num_errors
+        return self.num_accepted / num_completed if num_completed > 0 else 0.0
+
+    @property
+    def total_time(self) -> int:
+        return self.propose_time + self.adaptation_time
+
+    def merge(self, other: ProposerStats) -> ProposerStats:
+        return ProposerStats(
+            *(
+                getattr(self, field.name) + getattr(other, field.name)
+                for field in dataclasses.fields(self)
+            )
+        )
+
+
+class ProposerProfileReport:
+    """
+    A report of the time spent by each proposer of an inference, which is returned
+    as the ``profile_report`` of the result of ``infer(..., profile=True)``. The
+    statistics are keyed by the RV family (the name of the random variable function,
+    or the names of all of the families updated together by a proposer) and the
+    name of the proposer type.
+    """
+
+    stats: Dict[Tuple[str, str], ProposerStats]
+
+    def __init__(
+        self, stats: Optional[Dict[Tuple[str, str], ProposerStats]] = None
+    ) -> None:
+        self.stats = {} if stats is None else stats
+
+    @property
+    def total_time(self) -> int:
+        return sum(stats.total_time for stats in self.stats.values())
+
+    @staticmethod
+    def merge(reports: Iterable[ProposerProfileReport]) -> ProposerProfileReport:
+        """Combine the reports of multiple chains."""
+        merged = {}
+        for report in reports:
+            for key, stats in report.stats.items():
+                merged[key] = merged[key].merge(stats) if key in merged else stats
+        return ProposerProfileReport(merged)
+
+    def __str__(self) -> str:
+        s = ""
+        for (family, proposer), stats in self.stats.items():
+            s += (
+                f"{family} [{proposer}]:({stats.num_proposals})"
+                f" propose {stats.propose_time // 1000000} ms,"
+                f" adaptation {stats.adaptation_time // 1000000} ms,"
+                f" acceptance rate {stats.acceptance_rate:.3f},"
+                f" errors {stats.num_errors}\n"
+            )
+        s += "Total time: " + str(self.total_time // 1000000) + " ms\n"
+        return s
+
+
+class ProposerProfiler:
+    """
+    Records the latency of ``propose`` and ``do_adaptation``, the acceptance, and
+    the exceptions of every proposal made by a ``Sampler``, and aggregates the
+    records by RV family and proposer type.
+    """
+
+    def __init__(self) -> None:
+        self.stats: Dict[Tuple[str, str], ProposerStats] = {}
+        # proposers are usually reused across iterations, so their keys are cached
+        self._keys: Dict[BaseProposer, Tuple[str, str]] = {}
+
+    def record_proposal(
+        self,
+        proposer: BaseProposer,
+        propose_time: int,
+        accepted: Optional[torch.Tensor] = None,
+    ) -> None:
+        """Record a proposal, where ``accepted`` is None if it raised an
+        exception."""
+        stats = self._get_stats(proposer)
+        stats.num_proposals += 1
+        stats.propose_time += propose_time
+        if accepted is None:
+            stats.num_errors += 1
+        else:
+            stats.num_accepted += accepted.float().mean().item()
+
+    def record_adaptation(self, proposer: BaseProposer, adaptation_time: int) -> None:
+        stats = self._get_stats(proposer)
+        stats.num_adaptations += 1
+        stats.adaptation_time += adaptation_time
+
+    def to_report(self) -> ProposerProfileReport:
+        return ProposerProfileReport(dict(self.stats))
+
+    def _get_stats(self, proposer: BaseProposer) -> ProposerStats:
+        key = self._keys.get(proposer)
+        if key is None:
+            families = sorted({_get_family(rv) for rv in _get_target_rvs(proposer)})
+            key = (", ".join(families) or "?", type(proposer).__name__)
+            self._keys[proposer] = key
+        stats = self.stats.get(key)
+        if stats is None:
+            stats = self.stats[key] = ProposerStats()
+        return stats
+
+
+def _get_family(rv: RVIdentifier) -> str:
+    return rv.function.__qualname__
+
+
+def _get_target_rvs(proposer: BaseProposer) -> Set[RVIdentifier]:
+    if isinstance(proposer, BaseSingleSiteMHProposer):
+        return {proposer.node}
+    if isinstance(proposer, HMCProposer):
+        return set(proposer._target_rvs)
+    if isinstance(proposer, (SequentialProposer, ChromaticProposer)):
+        return set().union(*(_get_target_rvs(p) for p in proposer.proposers))
+    return set()
@@ -0,0 +1,217 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+import os
+import threading
+from abc import ABCMeta, abstractmethod
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import torch
+
+
+# shape and dtype of the value of a query or the log likelihood of an observation
+ValueSpec = Tuple[torch.Size, torch.dtype]
+
+
+class SampleSink(metaclass=ABCMeta):
+    """
+    Storage that the samples and log likelihoods of all chains are written into while
+    inference is running. Before the chains start, a buffer of shape
+    ``(num_chains, num_samples, *value_shape)`` is allocated for every query and every
+    observation's log likelihood, and each chain writes its draws in place into its
+    own slice of the buffers. Sinks can be pickled so that they can be shared with
+    chains running in other processes.
+    """
+
+    def __init__(self) -> None:
+        self.samples: List[torch.Tensor] = []
+        self.log_likelihoods: List[torch.Tensor] = []
+
+    def allocate(
+        self,
+        sample_specs: List[ValueSpec],
+        log_likelihood_specs: List[ValueSpec],
+        num_chains: int,
+        num_samples: int,
+    ) -> None:
+        """Allocate the buffers for the queries and the observations (in order)."""
+        self.samples = [
+            self._create_buffer(
+                f"sample_{idx}", (num_chains, num_samples) + shape, dtype
+            )
+            for idx, (shape, dtype) in enumerate(sample_specs)
+        ]
+        self.log_likelihoods = [
+            self._create_buffer(
+                f"log_likelihood_{idx}", (num_chains, num_samples) + shape, dtype
+            )
+            for idx, (shape, dtype) in enumerate(log_likelihood_specs)
+        ]
+
+    @abstractmethod
+    def _create_buffer(
+        self, name: str, shape: Tuple[int, ...], dtype: torch.dtype
+    ) -> torch.Tensor:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        """Called once all of the chains have finished (or failed)."""
+        pass
+
+
+class SharedMemorySink(SampleSink):
+    """
+    Keeps the samples in shared memory, so that chains running in subprocesses can
+    write into them without sending the samples back to the parent process. This is
+    the default sink when the chains are run in parallel.
+    """
+
+    def _create_buffer(
+        self, name: str, shape: Tuple[int, ...], dtype: torch.dtype
+    ) -> torch.Tensor:
+        return torch.empty(shape, dtype=dtype).share_memory_()
+
+
+class NpyFileSink(SampleSink):
+    """
+    Streams the samples into memory-mapped ``.npy`` files under ``directory``
+    (``sample_{i}.npy`` for the i-th query and ``log_likelihood_{i}.npy`` for the
+    i-th observation), so that the samples do not need to be held in memory and the
+    draws collected so far are preserved if the inference crashes (the remaining
+    entries of the files are zeros). Writing a sample only copies it into the page
+    cache, while a background thread flushes the files to disk every
+    ``flush_interval`` seconds so that the sampler never waits on the disk. The
+    ``MonteCarloSamples`` returned by the inference reads from the same files,
+    which are only paged into memory when they are accessed.
+
+    Args:
+        directory: The directory to write the files into, which is created if it
+            does not exist.
+        flush_interval: The number of seconds between flushes of the files to disk.
+    """
+
+    def __init__(self, directory: str, flush_interval: float = 1.0) -> None:
+        super().__init__()
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self._arrays: Dict[str, np.memmap] = {}
+        # names of the files to re-open on the first access to the buffers
+        self._names_to_open: Optional[List[str]] = None
+        self._stop_event: Optional[threading.Event] = None
+        self._writer: Optional[threading.Thread] = None
+
+    @property
+    def samples(self) -> List[torch.Tensor]:
+        self._open_files()
+        return self._samples
+
+    @samples.setter
+    def samples(self, samples: List[torch.Tensor]) -> None:
+        self._samples = samples
+
+    @property
+    def log_likelihoods(self) -> List[torch.Tensor]:
+        self._open_files()
+        return self._log_likelihoods
+
+    @log_likelihoods.setter
+    def log_likelihoods(self, log_likelihoods: List[torch.Tensor]) -> None:
+        self._log_likelihoods = log_likelihoods
+
+    def allocate(
+        self,
+        sample_specs: List[ValueSpec],
+        log_likelihood_specs: List[ValueSpec],
+        num_chains: int,
+        num_samples: int,
+    ) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        super().allocate(sample_specs, log_likelihood_specs, num_chains, num_samples)
+        self._stop_event = threading.Event()
+        self._writer = threading.Thread(target=self._flush_periodically, daemon=True)
+        self._writer.start()
+
+    def _create_buffer(
+        self, name: str, shape: Tuple[int, ...], dtype: torch.dtype
+    ) -> torch.Tensor:
+        np_dtype = torch.empty((), dtype=dtype).numpy().dtype
+        # the shape is written into the header of the file, which numpy can only
+        # parse if it is a tuple of ints (rather than e.g. a torch.Size)
+        array = np.lib.format.open_memmap(
+            self._path(name),
+            mode="w+",
+            dtype=np_dtype,
+            shape=tuple(int(size) for size in shape),
+        )
+        self._arrays[name] = array
+        return torch.from_numpy(array)
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, f"{name}.npy")
+
+    def _flush_periodically(self) -> None:
+        assert self._stop_event is not None
+        while not self._stop_event.wait(self.flush_interval):
+            self.flush()
+
+    def flush(self) -> None:
+        """Write the samples collected so far to disk."""
+        for array in self._arrays.values():
+            array.flush()
+
+    def close(self) -> None:
+        if self._writer is not None:
+            assert self._stop_event is not None
+            self._stop_event.set()
+            self._writer.join()
+            self._writer = None
+        self.flush()
+
+    def __getstate__(self) -> Dict[str, Any]:
+        # the files are re-opened by the process that receives the sink, which then
+        # writes into the same files as the current process
+        self._open_files()
+        state = self.__dict__.copy()
+        state["_names_to_open"] = list(self._arrays)
+        for key in (
+            "_arrays",
+            "_samples",
+            "_log_likelihoods",
+            "_stop_event",
+            "_writer",
+        ):
+            del state[key]
+        return state
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__dict__.update(state)
+        self._arrays = {}
+        self._samples = []
+        self._log_likelihoods = []
+        self._stop_event = None
+        self._writer = None
+
+    def _open_files(self) -> None:
+        # the files are opened lazily rather than while unpickling, since an error
+        # in unpickling the arguments of a job kills the worker process of a pool
+        # without reporting the error to the parent, which then waits forever
+        names = self._names_to_open
+        if names is None:
+            return
+        self._arrays = {
+            name: np.load(self._path(name), mmap_mode="r+") for name in names
+        }
+        self._names_to_open = None
+        self._samples = [
+            torch.from_numpy(array)
+            for name, array in self._arrays.items()
+            if name.startswith("sample_")
+        ]
+        self._log_likelihoods = [
+            torch.from_numpy(array)
+            for name, array in self._arrays.items()
+            if name.startswith("log_likelihood_")
+        ]
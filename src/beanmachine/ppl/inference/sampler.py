@@ -5,16 +5,20 @@
 
 from __future__ import annotations
 
-import random
+import math
+import time
 import warnings
 from types import TracebackType
-from typing import Generator, NoReturn, Optional, Type, TYPE_CHECKING
+from typing import Generator, List, NoReturn, Optional, Tuple, Type, TYPE_CHECKING
 
 import torch
+from beanmachine.ppl.inference.chain_rng import shuffle
 
 
 if TYPE_CHECKING:
     from beanmachine.ppl.inference.base_inference import BaseInference
+    from beanmachine.ppl.inference.proposer.base_proposer import BaseProposer
+    from beanmachine.ppl.inference.proposer_profiler import ProposerProfiler
 
 from beanmachine.ppl.world import World
 
@@ -25,12 +29,19 @@ class Sampler(Generator[World, Optional[World], None]):
     It is used to generate Monte Carlo samples during MCMC inference.
     At each iteration, the proposer(s) proposer a values for the random variables, which
     are then accepted according to the MH ratio. The next world is then returned.
+    If the world is a ``BatchedWorld``, the proposals are accepted or rejected
+    independently for each chain.
 
     Args:
         kernel (BaseInference): Inference class to get proposers from.
         initial_world (World): Optional initial world to initialize from.
         num_samples (int, Optional): Number of samples. If none is specified, num_samples = inf.
         num_adaptive_samples (int, Optional): Number of adaptive samples, defaults to 0.
+        thin (int): Only return every ``thin``-th world of the adaptation and the
+            sampling phases, so that ``num_samples // thin`` (and
+            ``num_adaptive_samples // thin``) worlds are returned. Defaults to 1.
+        profiler (ProposerProfiler, Optional): If provided, every proposal is recorded
+            by the profiler.
     """
 
     def __init__(
@@ -39,7 +50,11 @@ class Sampler(Generator[World, Optional[World], None]):
         initial_world: World,
         num_samples: Optional[int] = None,
         num_adaptive_samples: int = 0,
+        thin: int = 1,
+        profiler: Optional[ProposerProfiler] = None,
     ):
+        if thin < 1:
+            raise ValueError(f"thin should be a positive integer, but got {thin}.")
         self.kernel = kernel
         self.world = initial_world
         self._num_samples_remaining = (
@@ -47,6 +62,15 @@ class Sampler(Generator[World, Optional[World], None]):
         )
         self._num_samples_remaining += num_adaptive_samples
         self._num_adaptive_sample_remaining = num_adaptive_samples
+        self._thin = thin
+        self.profiler = profiler
+        # number of iterations since the start of the current (adaptation or
+        # sampling) phase
+        self._num_iterations_in_phase = 0
+        # the proposers of the latent nodes of a world with the given structure
+        # version, which are reused as long as the structure doesn't change
+        self._proposers: Optional[List[BaseProposer]] = None
+        self._proposers_structure_version: Optional[int] = None
 
     def send(self, world: Optional[World] = None) -> World:
         """
@@ -55,6 +79,8 @@ class Sampler(Generator[World, Optional[World], None]):
         2. For each proposer, propose a world and accept/reject it based on MH ratio.
         3. Run adaptation method if applicable.
         4. Update the new current world as `self.world`.
+        If ``thin`` is greater than 1, iterations are repeated until the next world
+        to keep.
 
         Args:
             world: Optional World to use to propose. If none is provided, `self.world` is used.
@@ -62,21 +88,29 @@ class Sampler(Generator[World, Optional[World], None]):
         if world is None:
             world = self.world
 
-        if self._num_samples_remaining <= 0:
-            raise StopIteration
-
-        proposers = self.kernel.get_proposers(
-            world, world.latent_nodes, self._num_adaptive_sample_remaining
-        )
-        random.shuffle(proposers)
+        while True:
+            if self._num_samples_remaining <= 0:
+                raise StopIteration
+            is_adapting = self._num_adaptive_sample_remaining > 0
+            world = self._step(world)
+            self._num_iterations_in_phase += 1
+            keep = self._num_iterations_in_phase % self._thin == 0
+            if is_adapting and self._num_adaptive_sample_remaining == 0:
+                # the leftover iterations of the adaptation phase are dropped
+                self._num_iterations_in_phase = 0
+            if keep:
+                return world
+
+    def _step(self, world: World) -> World:
+        """Run a single iteration of inference starting from ``world``."""
+        proposers = self._get_proposers(world)
+        shuffle(proposers)
 
         for proposer in proposers:
             try:
-                new_world, accept_log_prob = proposer.propose(world)
-                accept_log_prob = accept_log_prob.clamp(max=0.0)
-                accepted = torch.rand_like(accept_log_prob).log() < accept_log_prob
-                if accepted:
-                    world = new_world
+                world, accept_log_prob, is_accepted = self._profiled_propose(
+                    proposer, world
+                )
             except RuntimeError as e:
                 if "singular U" in str(e) or "input is not positive-definite" in str(e):
                     # since it's normal to run into cholesky error during GP, instead of
@@ -88,10 +122,10 @@ class Sampler(Generator[World, Optional[World], None]):
                     raise e
 
             if self._num_adaptive_sample_remaining > 0:
-                proposer.do_adaptation(
-                    world=world, accept_log_prob=accept_log_prob, is_accepted=accepted
+                self._profiled_adapt(
+                    proposer, world, accept_log_prob, is_accepted.any()
                 )
-                if self._num_samples_remaining == 1:
+                if self._num_adaptive_sample_remaining == 1:
                     # we just reach the end of adaptation period
                     proposer.finish_adaptation()
 
@@ -103,6 +137,79 @@ class Sampler(Generator[World, Optional[World], None]):
         self._num_samples_remaining -= 1
         return self.world
 
+    def _propose(
+        self, proposer: BaseProposer, world: World
+    ) -> Tuple[World, torch.Tensor, torch.Tensor]:
+        """Propose a new world with ``proposer`` and accept or reject it. Return the
+        resulting world, the log of the acceptance probability (averaged across the
+        chains of a ``BatchedWorld``) and whether the proposal was accepted (for each
+        chain of a ``BatchedWorld``)."""
+        new_world, accept_log_prob = proposer.propose(world)
+        accept_log_prob = accept_log_prob.clamp(max=0.0)
+        accepted = torch.rand_like(accept_log_prob).log() < accept_log_prob
+        if accepted.dim() > 0:
+            # element-wise acceptance for a batch of chains
+            world = world.merge(new_world, accepted)
+            # adapt to the average accept prob across the chains
+            accept_log_prob = torch.logsumexp(
+                accept_log_prob.nan_to_num(float("-inf")), 0
+            ) - math.log(accept_log_prob.numel())
+        elif accepted:
+            world = new_world
+        return world, accept_log_prob, accepted
+
+    def _profiled_propose(
+        self, proposer: BaseProposer, world: World
+    ) -> Tuple[World, torch.Tensor, torch.Tensor]:
+        """Same as ``_propose``, but the duration and the outcome of the proposal are
+        recorded by the profiler (if any), including proposals that raise."""
+        if self.profiler is None:
+            return self._propose(proposer, world)
+        start = time.perf_counter_ns()
+        try:
+            world, accept_log_prob, is_accepted = self._propose(proposer, world)
+        except Exception:
+            self.profiler.record_proposal(proposer, time.perf_counter_ns() - start)
+            raise
+        self.profiler.record_proposal(
+            proposer, time.perf_counter_ns() - start, is_accepted
+        )
+        return world, accept_log_prob, is_accepted
+
+    def _profiled_adapt(
+        self,
+        proposer: BaseProposer,
+        world: World,
+        accept_log_prob: torch.Tensor,
+        is_accepted: torch.Tensor,
+    ) -> None:
+        """Run the adaptation of ``proposer``, whose duration is recorded by the
+        profiler (if any)."""
+        if self.profiler is None:
+            proposer.do_adaptation(
+                world=world, accept_log_prob=accept_log_prob, is_accepted=is_accepted
+            )
+            return
+        start = time.perf_counter_ns()
+        proposer.do_adaptation(
+            world=world, accept_log_prob=accept_log_prob, is_accepted=is_accepted
+        )
+        self.profiler.record_adaptation(proposer, time.perf_counter_ns() - start)
+
+    def _get_proposers(self, world: World) -> List[BaseProposer]:
+        """Returns a new list of the proposers of the latent nodes of ``world``. The
+        proposers are only requested from the kernel when the structure of the world
+        differs from the one of the previous iteration."""
+        if (
+            self._proposers is None
+            or self._proposers_structure_version != world.structure_version
+        ):
+            self._proposers = self.kernel.get_proposers(
+                world, world.latent_nodes, self._num_adaptive_sample_remaining
+            )
+            self._proposers_structure_version = world.structure_version
+        return list(self._proposers)
+
     def throw(
         self,
         typ: Type[BaseException],
@@ -10,5 +10,5 @@ from beanmachine.ppl.inference.single_site_inference import SingleSiteInference
 
 
 class SingleSiteAncestralMetropolisHastings(SingleSiteInference):
-    def __init__(self):
-        super().__init__(SingleSiteAncestralProposer)
+    def __init__(self, chromatic: bool = False):
+        super().__init__(SingleSiteAncestralProposer, chromatic)
@@ -10,6 +10,10 @@ from beanmachine.ppl.inference.proposer.base_proposer import BaseProposer
 from beanmachine.ppl.inference.proposer.base_single_site_mh_proposer import (
     BaseSingleSiteMHProposer,
 )
+from beanmachine.ppl.inference.proposer.chromatic_proposer import (
+    ChromaticProposer,
+    color_nodes,
+)
 from beanmachine.ppl.model.rv_identifier import RVIdentifier
 from beanmachine.ppl.world import World
 
@@ -20,10 +24,22 @@ class SingleSiteInference(BaseInference):
 
     Args:
         proposer_class: Class of proposer to initialize with
+        chromatic: If True, the nodes are partitioned into color classes of nodes
+            that are conditionally independent given the rest of the world (see
+            ``ChromaticProposer``), and all of the nodes of a class are updated at
+            once if the inference is run with ``static_structure=True`` (and one at
+            a time otherwise). The classes are updated in a random order in each
+            iteration.
     """
 
-    def __init__(self, proposer_class: Type[BaseSingleSiteMHProposer], **kwargs):
+    def __init__(
+        self,
+        proposer_class: Type[BaseSingleSiteMHProposer],
+        chromatic: bool = False,
+        **kwargs,
+    ):
         self.proposer_class = proposer_class
+        self.chromatic = chromatic
         self.inference_args = kwargs
         self._proposers = {}
 
@@ -32,12 +48,27 @@ class SingleSiteInference(BaseInference):
         world: World,
         target_rvs: Set[RVIdentifier],
         num_adaptive_sample: int,
+    ) -> List[BaseProposer]:
+        if self.chromatic:
+            return self._get_chromatic_proposers(world, target_rvs)
+        return [self._get_proposer(node) for node in target_rvs]
+
+    def _get_proposer(self, node: RVIdentifier) -> BaseSingleSiteMHProposer:
+        if node not in self._proposers:
+            self._proposers[node] = self.proposer_class(  # pyre-ignore [45]
+                node, **self.inference_args
+            )
+        return self._proposers[node]
+
+    def _get_chromatic_proposers(
+        self, world: World, target_rvs: Set[RVIdentifier]
     ) -> List[BaseProposer]:
         proposers = []
-        for node in target_rvs:
-            if node not in self._proposers:
-                self._proposers[node] = self.proposer_class(  # pyre-ignore [45]
-                    node, **self.inference_args
-                )
-            proposers.append(self._proposers[node])
+        # the sites of a plate are already updated at once
+        plates = {node for node in target_rvs if node.plate_size is not None}
+        proposers.extend(self._get_proposer(node) for node in plates)
+        for color_class in color_nodes(world, target_rvs - plates):
+            proposers.append(
+                ChromaticProposer([self._get_proposer(node) for node in color_class])
+            )
         return proposers
@@ -15,5 +15,5 @@ class SingleSiteUniformMetropolisHastings(SingleSiteInference):
     from a uniform distribution (uniform Categorical for discrete variables).
     """
 
-    def __init__(self):
-        super().__init__(SingleSiteUniformProposer)
+    def __init__(self, chromatic: bool = False):
+        super().__init__(SingleSiteUniformProposer, chromatic)
@@ -0,0 +1,113 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+import dataclasses
+from typing import Any, List, Optional
+
+import torch
+from beanmachine.ppl.diagnostics.common_statistics import (
+    effective_sample_size,
+    split_r_hat,
+)
+
+
+@dataclasses.dataclass
+class StoppingRule:
+    """
+    A rule for stopping multi-chain inference early once the chains have converged.
+    When passed to ``infer``, ``num_samples`` becomes the maximum number of samples:
+    the chains sample in blocks of ``block_size`` samples (after adaptation), and
+    after each block the diagnostics of the samples of all chains collected so far
+    are checked. All of the chains stop once every element of every query has a
+    split R-hat of at most ``max_split_r_hat`` and an effective sample size of at
+    least ``min_ess``. Subclasses can override ``is_converged`` to implement other
+    criteria.
+
+    Args:
+        max_split_r_hat: The maximum split R-hat of every query, or None to skip the
+            check.
+        min_ess: The minimum effective sample size (across all chains) of every
+            query, or None to skip the check.
+        block_size: The number of samples (per chain) between checks.
+    """
+
+    max_split_r_hat: Optional[float] = 1.01
+    min_ess: Optional[float] = 400.0
+    block_size: int = 100
+
+    def is_converged(self, samples: List[torch.Tensor]) -> bool:
+        """
+        Args:
+            samples: The samples of each query so far, of shape
+                ``(num_chains, num_samples, *query_shape)``.
+        """
+        for query_samples in samples:
+            if self.max_split_r_hat is not None:
+                r_hat = split_r_hat(query_samples)
+                if r_hat is None or not bool((r_hat <= self.max_split_r_hat).all()):
+                    return False
+            if self.min_ess is not None:
+                ess = effective_sample_size(query_samples)
+                if not bool((ess >= self.min_ess).all()):
+                    return False
+        return True
+
+    def is_converged_on_buffers(
+        self, buffers: List[torch.Tensor], num_adaptive_samples: int, num_samples: int
+    ) -> bool:
+        """Check the samples collected so far in the sample buffers of all chains
+        (see ``SampleSink``), skipping the adaptive samples."""
+        start = num_adaptive_samples
+        return self.is_converged(
+            [buffer[:, start : start + num_samples] for buffer in buffers]
+        )
+
+
+class _StoppingChannel:
+    """
+    Coordinates the decision to stop between chains that run in different processes
+    (or threads). After each block, every chain waits for the others at a barrier,
+    then the first chain checks the stopping rule on the (shared) sample buffers of
+    all chains and shares the decision with the rest of the chains.
+
+    Args:
+        barrier: A ``Barrier`` proxy (e.g. from a ``multiprocessing.Manager``, or a
+            ``threading.Barrier`` for threads) for all of the chains.
+        state: A shared ``dict`` proxy (or a ``dict`` for threads) to share the
+            decision through.
+        stopping_rule: The stopping rule.
+        num_adaptive_samples: The number of (kept) adaptive samples at the start of
+            the sample buffers, which are excluded from the diagnostics.
+    """
+
+    def __init__(
+        self,
+        barrier: Any,
+        state: Any,
+        stopping_rule: StoppingRule,
+        num_adaptive_samples: int,
+    ) -> None:
+        self.barrier = barrier
+        self.state = state
+        self.stopping_rule = stopping_rule
+        self.num_adaptive_samples = num_adaptive_samples
+
+    def should_stop(
+        self, chain_id: int, num_samples: int, samples: List[torch.Tensor]
+    ) -> bool:
+        self.barrier.wait()
+        if chain_id == 0:
+            stop = self.stopping_rule.is_converged_on_buffers(
+                samples, self.num_adaptive_samples, num_samples
+            )
+            self.state["stop"] = stop
+            if stop:
+                self.state["num_samples"] = num_samples
+        self.barrier.wait()
+        return self.state["stop"]
+
+    def abort(self) -> None:
+        """Release the other chains if the current chain fails."""
+        self.barrier.abort()
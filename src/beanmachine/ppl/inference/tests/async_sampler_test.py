@@ -0,0 +1,118 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import beanmachine.ppl as bm
+import pytest
+import torch
+import torch.distributions as dist
+from beanmachine.ppl.inference import AsyncSampler
+
+
+class SampleModel:
+    @bm.random_variable
+    def foo(self):
+        return dist.Normal(0.0, 1.0)
+
+    @bm.random_variable
+    def bar(self):
+        return dist.Normal(self.foo(), 1.0)
+
+
+def _count_iterations(sampler):
+    num_iterations = [0]
+    send = sampler.send
+
+    def counting_send(world=None):
+        num_iterations[0] += 1
+        return send(world)
+
+    sampler.send = counting_send
+    return num_iterations
+
+
+@pytest.mark.parametrize("max_prefetch", [0, 2])
+def test_async_sampler(max_prefetch):
+    model = SampleModel()
+    mh = bm.SingleSiteAncestralMetropolisHastings()
+    sampler = mh.sampler([model.foo()], {model.bar(): torch.tensor(0.5)}, 10, 0)
+
+    async def collect():
+        async with AsyncSampler(sampler, max_prefetch=max_prefetch) as async_sampler:
+            return [world async for world in async_sampler]
+
+    worlds = asyncio.run(collect())
+    assert len(worlds) == 10
+    for world in worlds:
+        assert model.foo() in world
+
+
+def test_concurrent_async_samplers():
+    model = SampleModel()
+    mh = bm.SingleSiteAncestralMetropolisHastings()
+
+    async def collect(obs):
+        sampler = mh.sampler([model.foo()], {model.bar(): torch.tensor(obs)}, 50, 0)
+        return [world[model.foo()] async for world in AsyncSampler(sampler, executor)]
+
+    async def main():
+        return await asyncio.gather(collect(-10.0), collect(10.0))
+
+    with ThreadPoolExecutor(2) as executor:
+        low, high = asyncio.run(main())
+    assert len(low) == len(high) == 50
+    assert torch.stack(low[25:]).mean() < 0 < torch.stack(high[25:]).mean()
+
+
+def test_async_sampler_backpressure():
+    model = SampleModel()
+    sampler = bm.SingleSiteAncestralMetropolisHastings().sampler([model.foo()], {})
+    num_iterations = _count_iterations(sampler)
+
+    async def consume_slowly():
+        async with AsyncSampler(sampler, max_prefetch=3) as async_sampler:
+            await async_sampler.__anext__()
+            await asyncio.sleep(0.5)
+
+    asyncio.run(consume_slowly())
+    # one consumed world and at most 3 prefetched ones
+    assert num_iterations[0] <= 4
+
+
+def test_async_sampler_cancellation():
+    model = SampleModel()
+    sampler = bm.SingleSiteAncestralMetropolisHastings().sampler([model.foo()], {})
+    num_iterations = _count_iterations(sampler)
+
+    async def consume():
+        async_sampler = AsyncSampler(sampler)
+        worlds = []
+        async for world in async_sampler:
+            worlds.append(world)
+            if len(worlds) == 3:
+                async_sampler.cancel()
+        return worlds
+
+    assert len(asyncio.run(consume())) == 3
+    assert num_iterations[0] == 3
+
+    async def cancel_task():
+        async_sampler = AsyncSampler(sampler)
+        task = asyncio.create_task(async_sampler.__anext__())
+        await asyncio.sleep(0)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        # the interrupted iteration is not lost
+        await async_sampler.__anext__()
+        await async_sampler.aclose()
+        with pytest.raises(StopAsyncIteration):
+            await async_sampler.__anext__()
+
+    num_iterations[0] = 0
+    asyncio.run(cancel_task())
+    assert num_iterations[0] == 1
@@ -0,0 +1,91 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+import pickle
+import sys
+
+import beanmachine.ppl as bm
+import pytest
+import torch
+import torch.distributions as dist
+from beanmachine.ppl.inference import chain_executor
+from beanmachine.ppl.inference.chain_executor import ChainExecutor
+
+
+class SampleModel:
+    @bm.random_variable
+    def foo(self):
+        return dist.Normal(0.0, 1.0)
+
+    @bm.random_variable
+    def bar(self):
+        return dist.Normal(self.foo(), 1.0)
+
+
+def _job_cache_size(_):
+    return len(chain_executor._JOB_CACHE)
+
+
+@pytest.mark.skipif(
+    sys.platform.startswith("win"),
+    reason="Windows does not support fork-based multiprocessing.",
+)
+def test_chain_executor():
+    model = SampleModel()
+    mh = bm.SingleSiteAncestralMetropolisHastings()
+    with ChainExecutor(num_workers=2, mp_context="fork") as executor:
+        pool = executor._pool
+        for obs in [0.5, 1.0, 0.5]:
+            samples = mh.infer(
+                [model.foo()],
+                {model.bar(): torch.tensor(obs)},
+                num_samples=20,
+                num_chains=3,
+                show_progress_bar=False,
+                chain_executor=executor,
+            )
+            assert samples[model.foo()].shape == (3, 20)
+            assert not torch.equal(
+                samples.get_chain(0)[model.foo()], samples.get_chain(1)[model.foo()]
+            )
+        # the same workers are reused across calls, and the model is cached once
+        # regardless of the observations
+        assert executor._pool is pool
+        assert max(executor._pool.map(_job_cache_size, range(4))) == 1
+
+        # the samples match the ones of chains run in a new pool with the same seed
+        kwargs = {"num_samples": 20, "num_chains": 2, "show_progress_bar": False}
+        torch.manual_seed(42)
+        samples = mh.infer([model.foo()], {}, chain_executor=executor, **kwargs)
+        torch.manual_seed(42)
+        expected = mh.infer(
+            [model.foo()], {}, run_in_parallel=True, mp_context="fork", **kwargs
+        )
+        assert torch.equal(samples[model.foo()], expected[model.foo()])
+
+    with pytest.raises(ValueError, match="closed"):
+        executor.run_chains(print, [()])
+    with pytest.raises(ValueError, match="chain_executor"):
+        mh.infer([model.foo()], {}, 10, chain_executor=executor, batch_chains=True)
+
+
+def test_job_cache(monkeypatch):
+    num_loads = 0
+    loads = pickle.loads
+
+    def counting_loads(payload):
+        nonlocal num_loads
+        num_loads += 1
+        return loads(payload)
+
+    monkeypatch.setattr(chain_executor.pickle, "loads", counting_loads)
+    monkeypatch.setattr(chain_executor, "_JOB_CACHE", chain_executor.OrderedDict())
+    payload = pickle.dumps(max)
+    miss = chain_executor._run_job("max", None, (1, 3), {})
+    assert isinstance(miss, chain_executor._CacheMiss)
+    assert chain_executor._run_job("max", payload, (1, 3), {}) == 3
+    for _ in range(2):
+        assert chain_executor._run_job("max", None, (1, 3), {}) == 3
+    assert num_loads == 1
@@ -0,0 +1,107 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+import threading
+
+import beanmachine.ppl as bm
+import pytest
+import torch
+import torch.distributions as dist
+from beanmachine.ppl.inference.chain_rng import ChainRNG, shuffle
+from beanmachine.ppl.inference.stopping_rule import StoppingRule
+
+
+class SampleModel:
+    @bm.random_variable
+    def foo(self):
+        return dist.Normal(0.0, 1.0)
+
+    @bm.random_variable
+    def bar(self):
+        return dist.Normal(self.foo(), 1.0)
+
+
+def draw():
+    values = [
+        torch.rand(()),
+        torch.rand_like(torch.zeros(2)),
+        torch.randint_like(torch.zeros(2), 3, 10),
+        dist.Normal(0.0, 1.0).sample(),
+        dist.Gamma(2.0, 1.0).sample(),
+        dist.Exponential(1.0).sample(),
+        dist.Categorical(torch.ones(4)).sample((3,)),
+    ]
+    indices = list(range(10))
+    shuffle(indices)
+    return values, indices
+
+
+def test_chain_rng():
+    torch.manual_seed(0)
+    rng_state = torch.get_rng_state()
+    with ChainRNG(seed=42):
+        values, indices = draw()
+    # the global RNG is left untouched
+    assert torch.equal(torch.get_rng_state(), rng_state)
+    assert values[2].shape == (2,) and ((values[2] >= 3) & (values[2] < 10)).all()
+
+    with ChainRNG(seed=42):
+        expected_values, expected_indices = draw()
+    assert all(torch.equal(v1, v2) for v1, v2 in zip(values, expected_values))
+    assert indices == expected_indices
+    with ChainRNG(seed=0):
+        other_values, _ = draw()
+    assert not torch.equal(values[0], other_values[0])
+
+
+def test_chain_rng_in_threads():
+    with ChainRNG(seed=42):
+        expected_values, expected_indices = draw()
+
+    results = {}
+
+    def run(thread_id):
+        with ChainRNG(seed=42):
+            results[thread_id] = draw()
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    for values, indices in results.values():
+        assert all(torch.equal(v1, v2) for v1, v2 in zip(values, expected_values))
+        assert indices == expected_indices
+
+
+def test_run_in_threads():
+    model = SampleModel()
+    mh = bm.SingleSiteAncestralMetropolisHastings()
+    kwargs = {"num_samples": 50, "num_chains": 3, "show_progress_bar": False}
+    observations = {model.bar(): torch.tensor(0.5)}
+    torch.manual_seed(42)
+    samples = mh.infer([model.foo()], observations, run_in_threads=True, **kwargs)
+    assert samples[model.foo()].shape == (3, 50)
+    assert not torch.equal(
+        samples.get_chain(0)[model.foo()], samples.get_chain(1)[model.foo()]
+    )
+    # the chains are reproducible regardless of how the threads are scheduled
+    torch.manual_seed(42)
+    expected = mh.infer([model.foo()], observations, run_in_threads=True, **kwargs)
+    assert torch.equal(samples[model.foo()], expected[model.foo()])
+
+    samples = mh.infer(
+        [model.foo()],
+        observations,
+        run_in_threads=True,
+        stopping_rule=StoppingRule(block_size=10),
+        **kwargs,
+    )
+    assert samples[model.foo()].shape[1] % 10 == 0
+
+    with pytest.raises(ValueError):
+        mh.infer([model.foo()], {}, run_in_threads=True, batch_chains=True, **kwargs)
+    with pytest.raises(ValueError):
+        mh.infer([model.foo()], {}, run_in_threads=True, run_in_parallel=True, **kwargs)
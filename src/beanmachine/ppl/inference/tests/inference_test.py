@@ -5,13 +5,16 @@
 
 import math
 import sys
+from unittest.mock import patch
 
 import beanmachine.ppl as bm
 import pytest
 import torch
 import torch.distributions as dist
 from beanmachine.ppl.inference.proposer.base_proposer import BaseProposer
-from beanmachine.ppl.world import init_from_prior, World
+from beanmachine.ppl.inference.proposer.hmc_proposer import HMCProposer
+from beanmachine.ppl.inference.sample_sink import SharedMemorySink
+from beanmachine.ppl.world import init_from_prior, init_to_uniform, World
 
 
 class SampleModel:
@@ -66,12 +69,61 @@ def test_inference(multiprocess):
     assert isinstance(samples[model.foo()], torch.Tensor)
     assert samples[model.foo()].shape == (num_chains, num_samples)
     assert samples.get_num_samples(include_adapt_steps=True) == num_samples * 2
+    # samples of parallel chains are collected in shared memory without copying
+    assert samples[model.foo()].is_shared() == multiprocess
     # make sure that the RNG state for each chain is different
     assert not torch.equal(
         samples.get_chain(0)[model.foo()], samples.get_chain(1)[model.foo()]
     )
 
 
+def test_single_chain_infer_with_sample_sink():
+    model = SampleModel()
+    mh = bm.SingleSiteAncestralMetropolisHastings()
+    queries = [model.foo(), model.baz()]
+    observations = {model.bar(): torch.tensor(0.5)}
+    sink = SharedMemorySink()
+    # the buffer of baz has a mismatched shape, so its samples are returned instead
+    sink.allocate(
+        [(torch.Size([]), torch.float), (torch.Size([3]), torch.float)],
+        [(torch.Size([]), torch.float)],
+        num_chains=2,
+        num_samples=10,
+    )
+    samples, log_likelihoods, _ = mh._single_chain_infer(
+        queries,
+        observations,
+        10,
+        0,
+        False,
+        init_to_uniform,
+        100,
+        chain_id=1,
+        sample_sink=sink,
+    )
+    assert samples[0] is None and log_likelihoods[0] is None
+    assert samples[1].shape == (10,)
+    assert torch.all(sink.log_likelihoods[0][1] < 0.0)
+
+
+def test_infer_with_sample_sink_is_reproducible():
+    model = SampleModel()
+    all_samples = []
+    for sample_sink in [None, SharedMemorySink()]:
+        torch.manual_seed(0)
+        samples = bm.SingleSiteAncestralMetropolisHastings().infer(
+            [model.foo()],
+            {model.bar(): torch.tensor(0.5)},
+            num_samples=10,
+            num_chains=2,
+            show_progress_bar=False,
+            sample_sink=sample_sink,
+        )
+        all_samples.append(samples[model.foo()])
+    # allocating the buffers of the sink does not change the chains
+    assert torch.equal(all_samples[0], all_samples[1])
+
+
 def test_get_proposers():
     world = World()
     model = SampleModel()
@@ -153,3 +205,142 @@ def test_inference_with_double_dtype(algorithm):
         num_chains=1,
     )
     assert samples[model.foo()].dtype == bar_val.dtype
+
+
+def test_infer_with_static_structure():
+    model = SampleModel()
+    mh = bm.SingleSiteAncestralMetropolisHastings()
+    samples = mh.infer(
+        [model.foo()],
+        {model.bar(): torch.tensor(0.0)},
+        num_samples=10,
+        num_chains=1,
+        static_structure=True,
+    )
+    assert samples[model.foo()].shape == (1, 10)
+
+
+@pytest.mark.parametrize(
+    "algorithm",
+    [
+        bm.SingleSiteAncestralMetropolisHastings(),
+        bm.SingleSiteRandomWalk(),
+        bm.GlobalHamiltonianMonteCarlo(1.0),
+    ],
+)
+def test_infer_with_batch_chains(algorithm):
+    model = SampleModel()
+    samples = algorithm.infer(
+        [model.foo(), model.baz()],
+        {model.bar(): torch.tensor(0.5)},
+        num_samples=20,
+        num_chains=3,
+        batch_chains=True,
+    )
+    assert samples[model.foo()].shape == (3, 20)
+    assert samples[model.baz()].shape == (3, 20)
+    assert samples.get_log_likelihoods(model.bar()).shape == (3, 20)
+    # the chains should be independent
+    assert not torch.equal(samples[model.foo()][0], samples[model.foo()][1])
+
+
+def test_infer_with_batch_chains_unbatched_query():
+    @bm.functional
+    def constant():
+        return torch.arange(3.0)
+
+    model = SampleModel()
+    samples = bm.SingleSiteAncestralMetropolisHastings().infer(
+        [model.foo(), constant()],
+        {model.bar(): torch.tensor(0.5)},
+        num_samples=5,
+        num_chains=3,
+        batch_chains=True,
+    )
+    # the value of constant is shared by the chains, even though its size is the
+    # same as the number of chains
+    assert samples[constant()].shape == (3, 5, 3)
+    assert torch.equal(samples[constant()][1, 2], torch.arange(3.0))
+
+
+@pytest.mark.parametrize("batch_chains", [False, True])
+def test_infer_with_pool_adaptation(batch_chains):
+    model = SampleModel()
+    adapted = []
+    finish_adaptation = HMCProposer.finish_adaptation
+
+    def record_adaptation(self):
+        finish_adaptation(self)
+        adapted.append((self.step_size, self._mass_inv))
+
+    with patch.object(HMCProposer, "finish_adaptation", record_adaptation):
+        samples = bm.GlobalHamiltonianMonteCarlo(1.0, pool_adaptation=True).infer(
+            [model.foo()],
+            {model.bar(): torch.tensor(0.5)},
+            num_samples=10,
+            num_adaptive_samples=50,
+            num_chains=3,
+            show_progress_bar=False,
+            batch_chains=batch_chains,
+        )
+    assert samples[model.foo()].shape == (3, 10)
+    # every chain ends up with the same step size and mass matrix
+    if batch_chains:
+        ((_, mass_inv),) = adapted
+        assert torch.all(mass_inv == mass_inv[0])
+    else:
+        assert len(adapted) == 3
+        for step_size, mass_inv in adapted[1:]:
+            assert torch.equal(step_size, adapted[0][0])
+            assert torch.equal(mass_inv, adapted[0][1])
+        assert not torch.equal(mass_inv, torch.ones_like(mass_inv))
+
+
+def test_infer_with_tuning_cache(tmp_path):
+    model = SampleModel()
+    for observation, num_adaptive_samples in [(0.5, 50), (1.0, 20)]:
+        nuts = bm.GlobalNoUTurnSampler(nnc_compile=False, tuning_cache=tmp_path)
+        with patch.object(
+            HMCProposer,
+            "_find_reasonable_step_size",
+            autospec=True,
+            side_effect=HMCProposer._find_reasonable_step_size,
+        ) as find_step_size:
+            samples = nuts.infer(
+                [model.foo()],
+                {model.bar(): torch.tensor(observation)},
+                num_samples=10,
+                num_adaptive_samples=num_adaptive_samples,
+                num_chains=1,
+                show_progress_bar=False,
+            )
+        assert samples[model.foo()].shape == (1, 10)
+        # the second run (on an updated observation) is warm started from the
+        # tuning state that the first run saved into the cache, and its adaptation
+        # is too short to re-estimate the mass matrix
+        assert find_step_size.called == (observation == 0.5)
+        assert len(list(tmp_path.iterdir())) == 1
+
+
+def test_infer_with_pool_adaptation_in_parallel():
+    if sys.platform.startswith("win"):
+        pytest.skip("Windows does not support fork-based multiprocessing.")
+    model = SampleModel()
+    nuts = bm.GlobalNoUTurnSampler(pool_adaptation=True, nnc_compile=False)
+    all_samples = []
+    for run_in_parallel in [False, True]:
+        torch.manual_seed(0)
+        samples = nuts.infer(
+            [model.foo()],
+            {model.bar(): torch.tensor(0.5)},
+            num_samples=10,
+            num_adaptive_samples=50,
+            num_chains=2,
+            show_progress_bar=False,
+            run_in_parallel=run_in_parallel,
+            mp_context="fork",
+        )
+        all_samples.append(samples[model.foo()])
+    # the chains are seeded in the same way and pool the same statistics whether
+    # they run in threads or in processes
+    assert torch.equal(all_samples[0], all_samples[1])
@@ -0,0 +1,101 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+import beanmachine.ppl as bm
+import pytest
+import torch
+import torch.distributions as dist
+from beanmachine.ppl.inference import PosteriorMoments
+from beanmachine.ppl.inference.posterior_moments import RunningMoments
+
+
+class SampleModel:
+    @bm.random_variable
+    def foo(self):
+        return dist.Normal(torch.zeros(2), 1.0)
+
+    @bm.random_variable
+    def bar(self):
+        return dist.Normal(self.foo().sum(-1), 1.0)
+
+    @bm.random_variable
+    def baz(self):
+        return dist.Bernoulli(0.3)
+
+
+def test_running_moments():
+    values = torch.randn(3, 50, 4)
+    per_chain = []
+    for chain in range(3):
+        running = RunningMoments()
+        for value in values[chain]:
+            running.update(value)
+        per_chain.append(running)
+    moments = PosteriorMoments({"x": RunningMoments.stack(per_chain)})
+    assert moments.num_chains == 3 and moments.num_samples == 50
+    assert torch.allclose(moments.mean("x", chain=1), values[1].mean(0), atol=1e-6)
+    assert torch.allclose(moments.variance("x", chain=1), values[1].var(0), atol=1e-5)
+    pooled = values.reshape(-1, 4)
+    assert torch.allclose(moments["x"], pooled.mean(0), atol=1e-6)
+    assert torch.allclose(moments.variance("x"), pooled.var(0), atol=1e-5)
+    assert torch.allclose(
+        moments.std("x", unbiased=False), pooled.std(0, unbiased=False), atol=1e-5
+    )
+
+
+@pytest.mark.parametrize("batch_chains", [False, True])
+def test_infer_moments(batch_chains):
+    model = SampleModel()
+    queries = [model.foo(), model.baz()]
+    kwargs = dict(
+        num_samples=40,
+        num_adaptive_samples=10,
+        num_chains=2,
+        show_progress_bar=False,
+        thin=2,
+        batch_chains=batch_chains,
+    )
+    mh = bm.SingleSiteAncestralMetropolisHastings()
+    observations = {model.bar(): torch.tensor(0.5)}
+    moments = mh.infer(queries, observations, accumulate="moments", **kwargs)
+    assert isinstance(moments, PosteriorMoments)
+    assert moments.num_chains == 2
+    assert moments.num_samples == 20
+    assert moments.num_adaptive_samples == 5
+    assert moments[model.foo()].shape == (2,)
+    assert moments.variance(model.foo(), chain=0).shape == (2,)
+    # integer valued queries are averaged as floats
+    assert moments[model.baz()].is_floating_point()
+
+    # the moments agree with the ones of the samples from the same seed
+    bm.seed(0)
+    moments = mh.infer(queries, observations, accumulate="moments", **kwargs)
+    bm.seed(0)
+    samples = mh.infer(queries, observations, **kwargs)
+    assert samples[model.foo()].shape == (2, 20, 2)
+    assert torch.allclose(
+        moments.mean(model.foo(), chain=1), samples[model.foo()][1].mean(0), atol=1e-5
+    )
+    assert torch.allclose(
+        moments.variance(model.foo()),
+        samples[model.foo()].reshape(-1, 2).var(0),
+        atol=1e-5,
+    )
+
+
+@pytest.mark.parametrize("num_samples, thin", [(0, 1), (3, 4)])
+def test_infer_moments_without_samples(num_samples, thin):
+    model = SampleModel()
+    with pytest.raises(ValueError, match="at least one sample"):
+        bm.SingleSiteAncestralMetropolisHastings().infer(
+            [model.foo()],
+            {model.bar(): torch.tensor(0.5)},
+            num_samples=num_samples,
+            num_adaptive_samples=10,
+            num_chains=2,
+            show_progress_bar=False,
+            thin=thin,
+            accumulate="moments",
+        )
@@ -0,0 +1,103 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+import beanmachine.ppl as bm
+import pytest
+import torch
+import torch.distributions as dist
+from beanmachine.ppl.inference.proposer.single_site_ancestral_proposer import (
+    SingleSiteAncestralProposer,
+)
+from beanmachine.ppl.inference.proposer_profiler import (
+    ProposerProfiler,
+    ProposerProfileReport,
+)
+
+
+class SampleModel:
+    @bm.random_variable
+    def foo(self):
+        return dist.Normal(0.0, 1.0)
+
+    @bm.random_variable
+    def baz(self, i):
+        return dist.Normal(self.foo(), 1.0)
+
+    @bm.random_variable
+    def bar(self):
+        return dist.Normal(self.baz(0) + self.baz(1), 1.0)
+
+
+@pytest.mark.parametrize(
+    "infer_kwargs",
+    [{}, {"batch_chains": True}, {"run_in_parallel": True, "mp_context": "fork"}],
+)
+def test_infer_with_profile(infer_kwargs):
+    model = SampleModel()
+    samples = bm.SingleSiteRandomWalk().infer(
+        [model.foo()],
+        {model.bar(): torch.tensor(0.5)},
+        num_samples=20,
+        num_chains=2,
+        num_adaptive_samples=10,
+        show_progress_bar=False,
+        profile=True,
+        **infer_kwargs,
+    )
+    report = samples.profile_report
+    assert set(report.stats) == {
+        ("SampleModel.foo", "SingleSiteRandomWalkProposer"),
+        ("SampleModel.baz", "SingleSiteRandomWalkProposer"),
+    }
+    foo_stats = report.stats[("SampleModel.foo", "SingleSiteRandomWalkProposer")]
+    baz_stats = report.stats[("SampleModel.baz", "SingleSiteRandomWalkProposer")]
+    num_iterations = 1 if infer_kwargs.get("batch_chains") else 2
+    assert foo_stats.num_proposals == 30 * num_iterations
+    assert baz_stats.num_proposals == 2 * 30 * num_iterations
+    assert foo_stats.num_adaptations == 10 * num_iterations
+    assert 0.0 < foo_stats.acceptance_rate <= 1.0
+    assert foo_stats.propose_time > 0 and foo_stats.num_errors == 0
+    assert "SampleModel.foo [SingleSiteRandomWalkProposer]:(" in str(report)
+
+
+def test_profile_of_global_proposer():
+    model = SampleModel()
+    hmc = bm.GlobalHamiltonianMonteCarlo(0.5, nnc_compile=False)
+    samples = hmc.infer(
+        [model.foo()],
+        {model.bar(): torch.tensor(0.5)},
+        num_samples=10,
+        num_chains=1,
+        show_progress_bar=False,
+        profile=True,
+        accumulate="moments",
+    )
+    ((family, proposer),) = samples.profile_report.stats
+    assert family == "SampleModel.baz, SampleModel.foo"
+    assert proposer == "HMCProposer"
+
+
+def test_infer_without_profile():
+    model = SampleModel()
+    samples = bm.SingleSiteAncestralMetropolisHastings().infer(
+        [model.foo()], {}, num_samples=10, num_chains=1, show_progress_bar=False
+    )
+    assert samples.profile_report is None
+
+
+def test_merge_reports():
+    model = SampleModel()
+    proposer = SingleSiteAncestralProposer(model.foo())
+    profilers = [ProposerProfiler(), ProposerProfiler()]
+    profilers[0].record_proposal(proposer, 100, torch.tensor(True))
+    profilers[0].record_proposal(proposer, 200)
+    profilers[1].record_proposal(proposer, 300, torch.tensor([True, False]))
+    profilers[1].record_adaptation(proposer, 50)
+    report = ProposerProfileReport.merge(p.to_report() for p in profilers)
+    stats = report.stats[("SampleModel.foo", "SingleSiteAncestralProposer")]
+    assert stats.num_proposals == 3 and stats.num_errors == 1
+    assert stats.acceptance_rate == pytest.approx(0.75)
+    assert stats.propose_time == 600 and stats.adaptation_time == 50
+    assert report.total_time == 650
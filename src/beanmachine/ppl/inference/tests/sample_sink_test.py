@@ -0,0 +1,81 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+import pickle
+import sys
+
+import beanmachine.ppl as bm
+import numpy as np
+import pytest
+import torch
+import torch.distributions as dist
+from beanmachine.ppl.inference import NpyFileSink
+
+
+class SampleModel:
+    @bm.random_variable
+    def foo(self):
+        return dist.Normal(torch.zeros(2), 1.0)
+
+    @bm.random_variable
+    def bar(self):
+        return dist.Normal(self.foo().sum(), 1.0)
+
+
+@pytest.mark.parametrize("multiprocess", [False, True])
+def test_npy_file_sink(tmp_path, multiprocess):
+    if multiprocess and sys.platform.startswith("win"):
+        pytest.skip("Windows does not support fork-based multiprocessing.")
+    model = SampleModel()
+    sink = NpyFileSink(str(tmp_path), flush_interval=0.01)
+    samples = bm.SingleSiteAncestralMetropolisHastings().infer(
+        [model.foo()],
+        {model.bar(): torch.tensor(0.5)},
+        num_samples=20,
+        num_adaptive_samples=5,
+        num_chains=2,
+        show_progress_bar=False,
+        run_in_parallel=multiprocess,
+        mp_context="fork",
+        sample_sink=sink,
+    )
+    assert samples[model.foo()].shape == (2, 20, 2)
+    assert not torch.equal(
+        samples.get_chain(0)[model.foo()], samples.get_chain(1)[model.foo()]
+    )
+    # the samples are read from the files
+    on_disk = np.load(tmp_path / "sample_0.npy")
+    assert on_disk.shape == (2, 25, 2)
+    assert np.array_equal(on_disk[:, 5:], samples[model.foo()].numpy())
+    log_likelihoods = np.load(tmp_path / "log_likelihood_0.npy")
+    assert np.all(log_likelihoods < 0.0)
+
+
+def test_npy_file_sink_pickle(tmp_path):
+    sink = NpyFileSink(str(tmp_path))
+    sink.allocate([(torch.Size([3]), torch.float64)], [], 2, 4)
+    sink_copy = pickle.loads(pickle.dumps(sink))
+    sink_copy.samples[0][1, 2] = torch.ones(3, dtype=torch.float64)
+    sink_copy.close()
+    sink.close()
+    assert torch.equal(sink.samples[0][1, 2], torch.ones(3, dtype=torch.float64))
+    assert sink.samples[0].dtype == torch.float64
+    assert sink.log_likelihoods == sink_copy.log_likelihoods == []
+
+
+def test_npy_file_sink_reopen_error(tmp_path):
+    sink = NpyFileSink(str(tmp_path))
+    sink.allocate([(torch.Size([3]), torch.float64)], [], 2, 4)
+    sink.close()
+    # the shape in the header of the file is a tuple of ints
+    header = (tmp_path / "sample_0.npy").read_bytes()[:128]
+    assert b"'shape': (2, 4, 3)" in header
+    data = pickle.dumps(sink)
+    (tmp_path / "sample_0.npy").unlink()
+    # the files are only re-opened when the buffers are accessed, so that the error
+    # is raised by the chain rather than while unpickling its arguments
+    sink_copy = pickle.loads(data)
+    with pytest.raises(FileNotFoundError):
+        sink_copy.samples
@@ -4,8 +4,11 @@
 # LICENSE file in the root directory of this source tree.
 
 import beanmachine.ppl as bm
+import pytest
 import torch
 import torch.distributions as dist
+from beanmachine.ppl.inference.base_inference import BaseInference
+from beanmachine.ppl.inference.proposer.base_proposer import BaseProposer
 
 
 class SampleModel:
@@ -18,6 +21,53 @@ class SampleModel:
         return dist.Normal(self.foo(), 1.0)
 
 
+class SwitchModel:
+    @bm.random_variable
+    def foo(self):
+        return dist.Bernoulli(0.5)
+
+    @bm.random_variable
+    def bar(self, i):
+        return dist.Normal(0.0, 1.0)
+
+    @bm.random_variable
+    def baz(self):
+        return dist.Normal(self.bar(int(self.foo())), 1.0)
+
+
+class CountingMetropolisHastings(bm.SingleSiteAncestralMetropolisHastings):
+    def __init__(self):
+        super().__init__()
+        self.num_calls = 0
+
+    def get_proposers(self, world, target_rvs, num_adaptive_sample):
+        self.num_calls += 1
+        return super().get_proposers(world, target_rvs, num_adaptive_sample)
+
+
+class AdaptationRecordingProposer(BaseProposer):
+    def __init__(self):
+        self.num_adaptations = 0
+        self.finished_at = []
+
+    def propose(self, world):
+        return world, torch.tensor(0.0)
+
+    def do_adaptation(self, *args, **kwargs):
+        self.num_adaptations += 1
+
+    def finish_adaptation(self):
+        self.finished_at.append(self.num_adaptations)
+
+
+class AdaptationRecordingInference(BaseInference):
+    def __init__(self):
+        self.proposer = AdaptationRecordingProposer()
+
+    def get_proposers(self, world, target_rvs, num_adaptive_sample):
+        return [self.proposer]
+
+
 def test_sampler():
     model = SampleModel()
     nuts = bm.GlobalNoUTurnSampler()
@@ -48,3 +98,50 @@ def test_two_samplers():
         world = nuts_sampler.send(world)
     assert model.foo() in world
     assert model.bar() in world
+
+
+def test_thinned_sampler():
+    model = SampleModel()
+    mh = bm.SingleSiteAncestralMetropolisHastings()
+    queries = [model.foo()]
+    observations = {model.bar(): torch.tensor(0.5)}
+    sampler = mh.sampler(
+        queries, observations, num_samples=10, num_adaptive_samples=5, thin=3
+    )
+    worlds = list(sampler)
+    # 5 // 3 adaptive samples and 10 // 3 samples
+    assert len(worlds) == 1 + 3
+    assert sampler._num_samples_remaining == 0
+
+
+def test_sampler_reuses_proposers():
+    model = SampleModel()
+    sampler = CountingMetropolisHastings().sampler(
+        [model.foo()], {model.bar(): torch.tensor(0.5)}, 10
+    )
+    assert len(list(sampler)) == 10
+    # the structure of the model never changes
+    assert sampler.kernel.num_calls == 1
+
+    model = SwitchModel()
+    torch.manual_seed(0)
+    # enough iterations for foo to be flipped regardless of the order of the
+    # proposers, which is shuffled with the (unseeded) Python RNG
+    sampler = CountingMetropolisHastings().sampler([model.baz()], {}, 100)
+    # every world except the last one is the starting point of an iteration
+    worlds = list(sampler)[:-1]
+    num_structures = len({world.structure_version for world in worlds})
+    assert num_structures > 1
+    assert sampler.kernel.num_calls >= num_structures
+
+
+@pytest.mark.parametrize("num_samples", [0, 10])
+def test_sampler_finishes_adaptation_once(num_samples):
+    model = SampleModel()
+    sampler = AdaptationRecordingInference().sampler(
+        [model.foo()], {}, num_samples=num_samples, num_adaptive_samples=5
+    )
+    assert len(list(sampler)) == num_samples + 5
+    # the adaptation is finished once, right after the last adaptive step
+    assert sampler.kernel.proposer.finished_at == [5]
+    assert sampler.kernel.proposer.num_adaptations == 5
@@ -4,8 +4,12 @@
 # LICENSE file in the root directory of this source tree.
 
 import beanmachine.ppl as bm
+import pytest
 import torch
 import torch.distributions as dist
+from beanmachine.ppl.inference.proposer.base_single_site_mh_proposer import (
+    BaseSingleSiteMHProposer,
+)
 
 
 class SampleModel:
@@ -32,6 +36,38 @@ class ReproducibleModel:
         return dist.Normal(0, 1)
 
 
+class DynamicModel:
+    @bm.random_variable
+    def num_components(self):
+        return dist.Categorical(torch.ones(3))
+
+    @bm.random_variable
+    def mu(self, i):
+        return dist.Normal(0.0, 1.0)
+
+    @bm.random_variable
+    def obs(self):
+        k = self.num_components().int().item() + 1
+        return dist.Normal(sum(self.mu(i) for i in range(k)), 1.0)
+
+
+class PlateModel:
+    def __init__(self):
+        self.group = torch.tensor([0, 0, 1, 2, 2, 2])
+
+    @bm.plate(size=3)
+    def theta(self, i):
+        return dist.Normal(0.0, 1.0)
+
+    @bm.plate(size=6)
+    def y(self, j):
+        return dist.Normal(self.theta(self.group[j]), 1.0)
+
+    @bm.random_variable
+    def total(self):
+        return dist.Normal(self.theta().sum(), 1.0)
+
+
 def test_single_site_ancestral_mh():
     model = SampleModel()
     mh = bm.SingleSiteAncestralMetropolisHastings()
@@ -67,3 +103,43 @@ def test_single_site_ancestral_mh_reproducible_results():
     samples = mh.infer(queries, observations, num_samples=5, num_chains=1)
     run_3 = samples.get_variable(model.mu()).clone()
     assert not run_1.allclose(run_3)
+
+
+def test_local_log_prob_matches_full_joint(monkeypatch):
+    monkeypatch.setattr(BaseSingleSiteMHProposer, "validate_log_prob", True)
+    model = DynamicModel()
+    mh = bm.SingleSiteAncestralMetropolisHastings()
+    # _validate_log_prob raises if the Markov blanket acceptance ratio disagrees with
+    # the one computed from the full joint
+    mh.infer(
+        [model.num_components()],
+        {model.obs(): torch.tensor(1.5)},
+        num_samples=50,
+        num_chains=1,
+    )
+
+
+def test_plate_single_site_updates():
+    model = PlateModel()
+    mh = bm.SingleSiteAncestralMetropolisHastings()
+    bm.seed(0)
+    samples = mh.infer(
+        [model.theta(), model.theta(2)],
+        {model.y(): torch.ones(6)},
+        num_samples=2000,
+        num_chains=1,
+    )
+    # the posterior of each site is Normal(n / (n + 1), 1 / (n + 1)), where n is the
+    # number of observations in its group
+    expected = torch.tensor([2 / 3, 1 / 2, 3 / 4])
+    assert torch.allclose(samples[model.theta()].mean((0, 1)), expected, atol=0.1)
+    assert torch.equal(samples[model.theta(2)], samples[model.theta()][..., 2])
+
+    # total() depends on all of the sites, so they can't be updated independently
+    with pytest.raises(ValueError):
+        mh.infer(
+            [model.theta()],
+            {model.y(): torch.ones(6), model.total(): torch.tensor(1.0)},
+            num_samples=2,
+            num_chains=1,
+        )
@@ -0,0 +1,77 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+import sys
+
+import beanmachine.ppl as bm
+import pytest
+import torch
+import torch.distributions as dist
+from beanmachine.ppl.inference import StoppingRule
+
+
+class SampleModel:
+    @bm.random_variable
+    def foo(self):
+        return dist.Normal(torch.zeros(2), 1.0)
+
+    @bm.random_variable
+    def bar(self):
+        return dist.Normal(self.foo().sum(-1), 1.0)
+
+
+def test_is_converged():
+    rule = StoppingRule(max_split_r_hat=1.05, min_ess=100.0)
+    assert rule.is_converged([torch.randn(4, 500, 3)])
+    # chains that are stuck at different values have not mixed
+    stuck = torch.randn(4, 500, 3) * 0.01 + torch.arange(4.0).reshape(4, 1, 1)
+    assert not rule.is_converged([torch.randn(4, 500), stuck])
+    # not enough effective samples
+    assert not rule.is_converged([torch.randn(4, 10)])
+    # the R-hat cannot be computed with a single chain
+    assert not rule.is_converged([torch.randn(1, 500)])
+    rule = StoppingRule(max_split_r_hat=None, min_ess=100.0)
+    assert rule.is_converged([torch.randn(1, 500)])
+
+
+@pytest.mark.parametrize("multiprocess", [False, True])
+def test_infer_with_stopping_rule(multiprocess):
+    if multiprocess and sys.platform.startswith("win"):
+        pytest.skip("Windows does not support fork-based multiprocessing.")
+    model = SampleModel()
+    rule = StoppingRule(max_split_r_hat=1.1, min_ess=50.0, block_size=50)
+    torch.manual_seed(0)
+    samples = bm.GlobalNoUTurnSampler().infer(
+        [model.foo()],
+        {model.bar(): torch.tensor(0.5)},
+        num_samples=5000,
+        num_adaptive_samples=200,
+        num_chains=2,
+        show_progress_bar=False,
+        run_in_parallel=multiprocess,
+        mp_context="fork",
+        stopping_rule=rule,
+    )
+    num_samples = samples.get_num_samples()
+    assert num_samples < 5000 and num_samples % 50 == 0
+    assert samples[model.foo()].shape == (2, num_samples, 2)
+    assert samples.get_num_samples(include_adapt_steps=True) == num_samples + 200
+    assert rule.is_converged([samples[model.foo()]])
+    assert samples.log_likelihoods[model.bar()].shape == (2, num_samples)
+
+
+def test_infer_stops_at_max_samples():
+    model = SampleModel()
+    # a rule that is never satisfied
+    rule = StoppingRule(min_ess=float("inf"), block_size=7)
+    samples = bm.SingleSiteAncestralMetropolisHastings().infer(
+        [model.foo()],
+        {model.bar(): torch.tensor(0.5)},
+        num_samples=30,
+        num_chains=2,
+        show_progress_bar=False,
+        stopping_rule=rule,
+    )
+    assert samples[model.foo()].shape == (2, 30, 2)
@@ -401,7 +401,7 @@ class TestStochasticVariationalInfer:
                 **vi.observations,
             },
         )
-        mu_approx, _ = world._run_node(q_mu())
+        mu_approx, _, _ = world._run_node(q_mu())
         sample_mean_alpha_10 = mu_approx.sample((100, 1)).mean()
 
         world = VariationalWorld(
@@ -411,7 +411,7 @@ class TestStochasticVariationalInfer:
                 **vi.observations,
             },
         )
-        mu_approx, _ = world._run_node(q_mu())
+        mu_approx, _, _ = world._run_node(q_mu())
         sample_mean_alpha_neg_10 = mu_approx.sample((100, 1)).mean()
 
         assert sample_mean_alpha_neg_10 > sample_mean_alpha_10
@@ -87,10 +87,12 @@ class VerboseLevel(Enum):
     LOAD_BAR = 1
 
 
-def safe_log_prob_sum(distrib, value: torch.Tensor) -> torch.Tensor:
+def safe_log_prob_sum(
+    distrib, value: torch.Tensor, reduce: Callable = torch.sum
+) -> torch.Tensor:
     "Computes log_prob, converting out of support exceptions to -Infinity."
     try:
-        return distrib.log_prob(value).sum()
+        return reduce(distrib.log_prob(value))
     except (RuntimeError, ValueError) as e:
         if not distrib.support.check(value).all():
             return torch.tensor(float("-Inf")).to(value.device)
@@ -31,12 +31,12 @@ class VariationalWorld(World):
 
     def copy(self):
         world_copy = VariationalWorld(
-            observations=self.observations.copy(),
+            observations=self.observations,
             initialize_fn=self._initialize_fn,
             params=self._params.copy(),
             queries_to_guides=self._queries_to_guides.copy(),
         )
-        world_copy._variables = self._variables.copy()
+        world_copy._variables = self._variables
         return world_copy
 
     # TODO: distinguish params vs random_variables at the type-level
@@ -7,6 +7,7 @@ from beanmachine.ppl.model.rv_identifier import RVIdentifier
 from beanmachine.ppl.model.statistical_model import (
     functional,
     param,
+    plate,
     random_variable,
     StatisticalModel,
 )
@@ -19,6 +20,7 @@ __all__ = [
     "StatisticalModel",
     "functional",
     "param",
+    "plate",
     "query",
     "random_variable",
     "sample",
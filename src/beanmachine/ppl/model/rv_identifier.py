@@ -3,13 +3,23 @@
 # This source code is licensed under the MIT license found in the
 # LICENSE file in the root directory of this source tree.
 
+from __future__ import annotations
+
 import warnings
-from dataclasses import dataclass
-from typing import Callable, Tuple
+import weakref
+from dataclasses import dataclass, field
+from typing import Callable, MutableMapping, Optional, Tuple
 
 import torch
 
 
+# canonical instances of RVIdentifiers, keyed by (wrapper, arguments). Entries are
+# removed once the identifiers are no longer referenced anywhere else.
+_INTERNED_RV_IDENTIFIERS: MutableMapping[
+    Tuple[Callable, Tuple], RVIdentifier
+] = weakref.WeakValueDictionary()
+
+
 @dataclass(eq=True, frozen=True)
 class RVIdentifier:
     """
@@ -19,15 +29,66 @@ class RVIdentifier:
 
     wrapper: Callable
     arguments: Tuple
+    # RVIdentifiers are used as dictionary keys throughout inference, so the hash is
+    # computed once and cached
+    _hash: Optional[int] = field(init=False, repr=False, compare=False)
 
     def __post_init__(self):
         for arg in self.arguments:
             if torch.is_tensor(arg):
+                # point at the caller of the random variable, which goes through
+                # __init__, intern, get_func_key, and the wrapper of the function
                 warnings.warn(
                     "PyTorch tensors are hashed by memory address instead of value. "
                     "Therefore, it is not recommended to use tensors as indices of random variables.",
-                    stacklevel=3,
+                    stacklevel=6,
                 )
+        try:
+            rv_hash = hash((self.wrapper, self.arguments))
+        except TypeError:
+            # the identifier can still be compared even if the arguments are unhashable
+            rv_hash = None
+        object.__setattr__(self, "_hash", rv_hash)
+
+    @classmethod
+    def intern(cls, wrapper: Callable, arguments: Tuple) -> RVIdentifier:
+        """
+        Returns the canonical RVIdentifier for the given wrapper and arguments, so
+        that equal identifiers are usually the same object and can be compared by
+        identity.
+        """
+        key = (wrapper, arguments)
+        try:
+            rv = _INTERNED_RV_IDENTIFIERS.get(key)
+        except TypeError:
+            # unhashable arguments cannot be interned
+            return cls(wrapper=wrapper, arguments=arguments)
+        if rv is None:
+            rv = cls(wrapper=wrapper, arguments=arguments)
+            _INTERNED_RV_IDENTIFIERS[key] = rv
+        return rv
+
+    def __hash__(self) -> int:
+        if self._hash is None:
+            # raises the same TypeError as hashing the unhashable arguments
+            return hash((self.wrapper, self.arguments))
+        return self._hash
+
+    def __eq__(self, other) -> bool:
+        if self is other:
+            return True
+        if not isinstance(other, RVIdentifier):
+            return NotImplemented
+        return (
+            self._hash == other._hash
+            and self.wrapper == other.wrapper
+            and self.arguments == other.arguments
+        )
+
+    def __reduce__(self):
+        # the hash of the wrapper can change when an RVIdentifier is sent to another
+        # process, so the cached hash should not be pickled
+        return (RVIdentifier.intern, (self.wrapper, self.arguments))
 
     def __str__(self):
         return str(self.function.__name__) + str(self.arguments)
@@ -47,3 +108,30 @@ class RVIdentifier:
         w = self.wrapper
         assert hasattr(w, "is_random_variable")
         return w.is_random_variable
+
+    @property
+    def plate_size(self) -> Optional[int]:
+        """
+        The number of sites if the identifier refers to a whole plate (see
+        ``bm.plate``), or None otherwise.
+        """
+        size = getattr(self.wrapper, "plate_size", None)
+        if size is None or len(self.arguments) != self.wrapper.plate_arity - 1:
+            return None
+        return size
+
+    @property
+    def plate_site(self) -> Optional[Tuple[RVIdentifier, int]]:
+        """
+        If the identifier refers to a single site of a plate, returns the identifier
+        of the plate and the index of the site. Returns None otherwise.
+        """
+        if (
+            getattr(self.wrapper, "plate_size", None) is None
+            or len(self.arguments) != self.wrapper.plate_arity
+        ):
+            return None
+        return (
+            RVIdentifier.intern(self.wrapper, self.arguments[:-1]),
+            self.arguments[-1],
+        )
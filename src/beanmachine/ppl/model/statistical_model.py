@@ -3,6 +3,7 @@
 # This source code is licensed under the MIT license found in the
 # LICENSE file in the root directory of this source tree.
 
+import inspect
 from functools import wraps
 from typing import Callable, Union
 
@@ -43,9 +44,10 @@ class StatisticalModel:
 
         Returns:
           Tuple of function and arguments which is to be used to identify
-          a particular function call.
+          a particular function call. The same (interned) RVIdentifier is returned
+          for repeated calls with equal arguments.
         """
-        return RVIdentifier(wrapper=wrapper, arguments=arguments)
+        return RVIdentifier.intern(wrapper, arguments)
 
     @staticmethod
     def random_variable(
@@ -79,6 +81,61 @@ class StatisticalModel:
         wrapper.is_random_variable = True
         return wrapper
 
+    @staticmethod
+    def plate(
+        size: int,
+    ) -> Callable[
+        [Callable[..., dist.Distribution]],
+        Callable[..., Union[RVIdentifier, torch.Tensor]],
+    ]:
+        """
+        Decorator for a family of ``size`` random variables that are conditionally
+        independent given the rest of the model, indexed by the last argument of the
+        function. E.g.::
+
+          @bm.plate(size=100)
+          def theta(i):
+            return Normal(mu(), 1.)
+
+          @bm.plate(size=100)
+          def y(i):
+            return Normal(theta(i), 1.)
+
+        Each site (e.g. ``theta(3)``) can be used as a query or an observation just
+        like a regular random variable, while the whole plate can be referred to by
+        dropping the index (i.e. ``theta()``). During inference, the sites of a plate
+        are stored in a single batched tensor and evaluated with a single call to
+        the function, where the index is a tensor of all of the site indices. The
+        function should therefore be able to take a tensor index, and return a
+        distribution whose batch shape is either ``()`` (shared by all sites) or
+        ``(size,)``. Single site proposers update all of the sites of a plate with
+        independent MH steps at once, which requires other random variables to
+        depend on a single site of the plate.
+        """
+
+        def decorator(
+            f: Callable[..., dist.Distribution]
+        ) -> Callable[..., Union[RVIdentifier, torch.Tensor]]:
+            arity = len(inspect.signature(f).parameters)
+
+            @wraps(f)
+            def wrapper(*args) -> Union[RVIdentifier, torch.Tensor]:
+                world = get_world_context()
+                if world is None:
+                    return StatisticalModel.get_func_key(wrapper, args)
+                if len(args) == arity:
+                    plate = StatisticalModel.get_func_key(wrapper, args[:-1])
+                    return world.update_plate(plate, args[-1])
+                return world.update_plate(StatisticalModel.get_func_key(wrapper, args))
+
+            wrapper.is_functional = False
+            wrapper.is_random_variable = True
+            wrapper.plate_size = size
+            wrapper.plate_arity = arity
+            return wrapper
+
+        return decorator
+
     @staticmethod
     def functional(
         f: Callable[P, torch.Tensor]
@@ -142,5 +199,6 @@ class StatisticalModel:
 
 
 random_variable = StatisticalModel.random_variable
+plate = StatisticalModel.plate
 functional = StatisticalModel.functional
 param = StatisticalModel.param
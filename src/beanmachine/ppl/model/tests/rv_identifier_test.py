@@ -10,6 +10,7 @@ import warnings
 import beanmachine.ppl as bm
 import torch
 import torch.distributions as dist
+from beanmachine.ppl.model.rv_identifier import RVIdentifier
 
 
 @bm.random_variable
@@ -61,6 +62,20 @@ class RVIdentifierTest(unittest.TestCase):
             str(context.warning),
             msg="RVs indexed using tensor should show the correct user warning",
         )
+        # the warning points at the call of the random variable
+        self.assertEqual(context.filename, __file__)
+
+    def test_interned_rv_identifier(self):
+        model = self.SampleModelWithIndex()
+        self.assertIs(model.foo(1), model.foo(1))
+        self.assertIsNot(model.foo(1), model.foo(2))
+        self.assertEqual(hash(model.foo(1)), hash((model.foo.__func__, (model, 1))))
+        # RVIdentifiers that are not interned should still be equal to the canonical
+        # ones
+        rv = RVIdentifier(wrapper=model.foo.__func__, arguments=(model, 1))
+        self.assertIsNot(rv, model.foo(1))
+        self.assertEqual(rv, model.foo(1))
+        self.assertEqual(hash(rv), hash(model.foo(1)))
 
     def test_pickle_unbound_rv_identifier(self):
         original_foo_key = foo()
@@ -4,17 +4,20 @@
 # LICENSE file in the root directory of this source tree.
 
 from beanmachine.ppl.world.base_world import get_world_context
+from beanmachine.ppl.world.batched_world import BatchedWorld
 from beanmachine.ppl.world.initialize_fn import (
     init_from_prior,
     init_to_uniform,
     InitializeFn,
 )
 from beanmachine.ppl.world.utils import BetaDimensionTransform, get_default_transforms
-from beanmachine.ppl.world.world import RVDict, World
+from beanmachine.ppl.world.world import InitializationReport, RVDict, World
 
 
 __all__ = [
+    "BatchedWorld",
     "BetaDimensionTransform",
+    "InitializationReport",
     "InitializeFn",
     "RVDict",
     "World",
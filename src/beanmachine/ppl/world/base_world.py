@@ -5,18 +5,28 @@
 
 from __future__ import annotations
 
+import threading
 from abc import ABCMeta, abstractmethod
-from typing import Optional
+from typing import List, Optional, Union
 
 import torch
 from beanmachine.ppl.model.rv_identifier import RVIdentifier
 
 
-_WORLD_STACK: list[BaseWorld] = []
+class _WorldStack(threading.local):
+    """The stack of active world contexts, which is separate for each thread so that
+    multiple inferences can run concurrently in different threads."""
+
+    def __init__(self) -> None:
+        self.worlds: List[BaseWorld] = []
+
+
+_WORLD_STACK = _WorldStack()
 
 
 def get_world_context() -> Optional[BaseWorld]:
-    return _WORLD_STACK[-1] if _WORLD_STACK else None
+    worlds = _WORLD_STACK.worlds
+    return worlds[-1] if worlds else None
 
 
 class BaseWorld(metaclass=ABCMeta):
@@ -38,11 +48,11 @@ class BaseWorld(metaclass=ABCMeta):
             # back to updating world1
         ```
         """
-        _WORLD_STACK.append(self)
+        _WORLD_STACK.worlds.append(self)
         return self
 
     def __exit__(self, *args) -> None:
-        _WORLD_STACK.pop()
+        _WORLD_STACK.worlds.pop()
 
     def call(self, node: RVIdentifier):
         """
@@ -54,3 +64,21 @@ class BaseWorld(metaclass=ABCMeta):
     @abstractmethod
     def update_graph(self, node: RVIdentifier) -> torch.Tensor:
         raise NotImplementedError
+
+    def update_plate(
+        self, node: RVIdentifier, index: Optional[Union[int, torch.Tensor]] = None
+    ) -> torch.Tensor:
+        """
+        Returns the value of a site of the plate ``node`` (or the values of all of its
+        sites if ``index`` is None). By default, each site is added to the graph as an
+        individual random variable.
+        """
+        plate_size = node.plate_size
+        assert plate_size is not None
+        if index is None:
+            index = torch.arange(plate_size)
+        if torch.is_tensor(index):
+            values = [self.update_plate(node, i) for i in index.reshape(-1).tolist()]
+            return torch.stack(values).reshape(index.shape + values[0].shape)
+        site = RVIdentifier.intern(node.wrapper, (*node.arguments, index))
+        return self.update_graph(site)
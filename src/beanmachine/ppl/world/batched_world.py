@@ -0,0 +1,144 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+from __future__ import annotations
+
+from typing import Optional, Set, Tuple, Union
+
+import torch
+import torch.distributions as dist
+from beanmachine.ppl.model.rv_identifier import RVIdentifier
+from beanmachine.ppl.world.initialize_fn import init_from_prior, InitializeFn
+from beanmachine.ppl.world.world import _TempVar, PlateIndices, RVDict, World
+
+
+class BatchedWorld(World):
+    """
+    A World that holds the states of ``num_chains`` independent Markov chains, where
+    the value of every latent random variable has a leading dimension of size
+    ``num_chains``. Observations are shared by all of the chains and are not batched.
+
+    The model is evaluated once for all of the chains, so it should broadcast over the
+    leading chain dimension, i.e. it should index the values of random variables
+    from the right (e.g. ``theta()[..., 0]`` instead of ``theta()[0]``) and should not
+    have any control flow that depends on the values of random variables. The
+    distribution of a random variable that depends on other latent random variables
+    should have a leading batch dimension of size ``num_chains``, while the
+    distributions of the other random variables are expanded automatically.
+
+    Args:
+      observations (Optional): Optional observations, which fixes the random variables to observed values
+      initialize_fn (callable, Optional): Callable which takes a ``torch.distribution`` object as argument and returns a ``torch.Tensor``
+      static_structure (bool): Whether the dependency structure of the model is fixed.
+        See ``World`` for details.
+      num_chains (int): Number of chains in the batch.
+    """
+
+    def __init__(
+        self,
+        observations: Optional[RVDict] = None,
+        initialize_fn: InitializeFn = init_from_prior,
+        static_structure: bool = False,
+        num_chains: int = 1,
+    ) -> None:
+        super().__init__(observations, initialize_fn, static_structure)
+        self.num_chains = num_chains
+
+    def copy(self) -> BatchedWorld:
+        """
+        Returns:
+          Shallow copy of the current world.
+        """
+        world_copy = BatchedWorld(
+            None, self._initialize_fn, self._static_structure, self.num_chains
+        )
+        world_copy.observations = self.observations
+        world_copy._variables = self._variables
+        world_copy._log_prob = self._log_prob
+        world_copy._num_log_prob_updates = self._num_log_prob_updates
+        world_copy._structure_version = self._structure_version
+        world_copy.initialization_report = self.initialization_report
+        return world_copy
+
+    def merge(self, other: BatchedWorld, mask: torch.Tensor) -> BatchedWorld:
+        """
+        Args:
+          other (BatchedWorld): A world derived from the current world (e.g. by
+            ``replace``) that has the same set of random variables.
+          mask (torch.Tensor): A boolean tensor of shape ``(num_chains,)``.
+
+        Returns:
+          A world that takes the values of ``other`` for the chains where ``mask`` is
+          True and the values of the current world for the rest of the chains.
+        """
+        if mask.all():
+            return other
+        if not mask.any():
+            return self
+        if len(other) != len(self):
+            raise ValueError(
+                "Cannot merge worlds with different sets of random variables."
+            )
+        values = {}
+        for node in self._variables.diff(other._variables):
+            value, other_value = self[node], other[node]
+            if value is not other_value:
+                mask_shape = mask.shape + (1,) * (value.dim() - 1)
+                values[node] = torch.where(mask.reshape(mask_shape), other_value, value)
+        return self.replace(values)
+
+    def is_batched(self, node: RVIdentifier) -> bool:
+        """
+        Args:
+          node (RVIdentifier): A random variable or a functional.
+
+        Returns:
+          Whether the value of ``node`` has a leading chain dimension, i.e. whether
+          it is a latent random variable or a functional that depends on one.
+        """
+        if node.is_random_variable:
+            return node not in self.observations
+        self._call_stack.append(_TempVar(node))
+        try:
+            self.call(node)
+        finally:
+            temp_var = self._call_stack.pop()
+        for parent in temp_var.parents:
+            # a functional is not a child of the random variables it depends on
+            self._variables[parent].children.discard(node)
+        return any(parent not in self.observations for parent in temp_var.parents)
+
+    def reduce_log_prob(self, log_prob: torch.Tensor) -> torch.Tensor:
+        """
+        Args:
+          log_prob (torch.Tensor): Log prob terms with a leading chain dimension.
+
+        Returns:
+          The sum of the terms of each chain, with shape ``(num_chains,)``.
+        """
+        return log_prob.reshape(self.num_chains, -1).sum(-1)
+
+    def update_plate(
+        self, node: RVIdentifier, index: Optional[Union[int, torch.Tensor]] = None
+    ) -> torch.Tensor:
+        raise NotImplementedError("Plates are not supported by BatchedWorld.")
+
+    def _run_node(
+        self, node: RVIdentifier
+    ) -> Tuple[dist.Distribution, Set[RVIdentifier], PlateIndices]:
+        distribution, parents, parent_indices = super()._run_node(node)
+        if any(parent not in self.observations for parent in parents):
+            if distribution.batch_shape[:1] != (self.num_chains,):
+                raise ValueError(
+                    f"The distribution of {node} depends on latent random variables,"
+                    f" so it should have a leading batch dimension of size"
+                    f" {self.num_chains}, but got a batch shape of"
+                    f" {tuple(distribution.batch_shape)}."
+                )
+        else:
+            distribution = distribution.expand(
+                (self.num_chains,) + distribution.batch_shape
+            )
+        return distribution, parents, parent_indices
@@ -0,0 +1,209 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+from __future__ import annotations
+
+import sys
+from typing import Hashable, Iterator, List, Mapping, Optional, Set, Tuple, TypeVar
+
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+# number of hash bits consumed by each level of the trie
+_SHIFT = 5
+_WIDTH = 1 << _SHIFT
+_MASK = _WIDTH - 1
+# once all of the hash bits are consumed, keys with the same hash are stored in a
+# collision bucket
+_MAX_SHIFT = sys.hash_info.width
+_MISSING = object()
+
+
+class _Bucket(dict):
+    """A dict of keys that share the exact same hash value"""
+
+
+class PersistentMap(Mapping[K, V]):
+    """
+    An immutable hash map implemented as a path-copying hash trie (similar to a HAMT
+    without the bitmap compression). Updating a PersistentMap returns a new map that
+    shares all of the unchanged sub-tries with the original one, so "copying" a map
+    is O(1) and setting a key costs O(log N).
+
+    Example::
+
+        m1 = PersistentMap({"a": 1})
+        m2 = m1.set("b", 2)
+        assert "b" not in m1 and m2["b"] == 2
+
+    Args:
+        items (Optional): An optional mapping to initialize the map with.
+    """
+
+    __slots__ = ("_root", "_size")
+
+    def __init__(self, items: Optional[Mapping[K, V]] = None) -> None:
+        self._root: List = [None] * _WIDTH
+        self._size = 0
+        if items:
+            self._root, self._size = self._update(items)
+
+    def __getitem__(self, key: K) -> V:
+        h = hash(key)
+        node = self._root
+        shift = 0
+        while True:
+            entry = node[(h >> shift) & _MASK]
+            if entry is None:
+                raise KeyError(key)
+            entry_type = type(entry)
+            if entry_type is list:
+                node = entry
+                shift += _SHIFT
+            elif entry_type is tuple:
+                entry_key, entry_hash, value = entry
+                if entry_key is key or (entry_hash == h and entry_key == key):
+                    return value
+                raise KeyError(key)
+            else:
+                return entry[key]
+
+    def __contains__(self, key: object) -> bool:
+        try:
+            self[key]  # pyre-ignore[6]
+        except KeyError:
+            return False
+        return True
+
+    def __iter__(self) -> Iterator[K]:
+        stack = [self._root]
+        while stack:
+            node = stack.pop()
+            for entry in node:
+                entry_type = type(entry)
+                if entry_type is tuple:
+                    yield entry[0]
+                elif entry_type is list:
+                    stack.append(entry)
+                elif entry is not None:
+                    yield from entry
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({dict(self.items())})"
+
+    def set(self, key: K, value: V) -> PersistentMap[K, V]:
+        """
+        Returns:
+            A new map where ``key`` is associated with ``value``.
+        """
+        return self.update({key: value})
+
+    def update(self, items: Mapping[K, V]) -> PersistentMap[K, V]:
+        """
+        Returns:
+            A new map with the entries in ``items`` added to (or replaced in) the
+            current map. The nodes on the paths to the updated keys are copied at
+            most once, so a batch update touches O(len(items) * log N) nodes.
+        """
+        new_map = PersistentMap.__new__(PersistentMap)
+        new_map._root, new_map._size = self._update(items)
+        return new_map
+
+    def diff(self, other: PersistentMap[K, V]) -> Iterator[K]:
+        """
+        Returns:
+            An iterator over the keys that are only in one of the maps or whose values
+            are not the same object in both maps. Sub-tries that are shared between the
+            two maps are skipped, so comparing a map with one derived from it costs
+            O(num_changes * log N).
+        """
+        stack = [(self._root, other._root)]
+        while stack:
+            node, other_node = stack.pop()
+            for entry, other_entry in zip(node, other_node):
+                if entry is other_entry:
+                    continue
+                if type(entry) is list and type(other_entry) is list:
+                    stack.append((entry, other_entry))
+                    continue
+                items = dict(_iter_items(entry))
+                other_items = dict(_iter_items(other_entry))
+                for key in items.keys() | other_items.keys():
+                    if items.get(key, _MISSING) is not other_items.get(key, _MISSING):
+                        yield key
+
+    def _update(self, items: Mapping[K, V]):
+        # ids of the nodes that are created by this update and can thus be mutated
+        # in place without affecting other maps
+        owned: Set[int] = set()
+        root = self._root.copy()
+        owned.add(id(root))
+        size = self._size
+        for key, value in items.items():
+            size += _insert(root, key, value, owned)
+        return root, size
+
+
+def _iter_items(entry) -> Iterator[Tuple]:
+    """Iterate over the key-value pairs stored in an entry of the trie"""
+    entry_type = type(entry)
+    if entry_type is tuple:
+        yield entry[0], entry[2]
+    elif entry_type is list:
+        for child in entry:
+            yield from _iter_items(child)
+    elif entry is not None:
+        yield from entry.items()
+
+
+def _insert(root: List, key, value, owned: Set[int]) -> int:
+    """Insert key-value pair into the trie in place, copying the nodes that are not
+    in ``owned`` along the way. Returns the change in the number of entries."""
+    h = hash(key)
+    node = root
+    shift = 0
+    while True:
+        idx = (h >> shift) & _MASK
+        entry = node[idx]
+        if entry is None:
+            node[idx] = (key, h, value)
+            return 1
+        entry_type = type(entry)
+        if entry_type is list:
+            if id(entry) not in owned:
+                entry = entry.copy()
+                owned.add(id(entry))
+                node[idx] = entry
+            node = entry
+            shift += _SHIFT
+        elif entry_type is tuple:
+            entry_key, entry_hash, _ = entry
+            if entry_key is key or (entry_hash == h and entry_key == key):
+                node[idx] = (entry_key, h, value)
+                return 0
+            shift += _SHIFT
+            if shift >= _MAX_SHIFT:
+                bucket = _Bucket({entry_key: entry[2], key: value})
+                owned.add(id(bucket))
+                node[idx] = bucket
+                return 1
+            # push the existing entry one level down and retry from there
+            child = [None] * _WIDTH
+            owned.add(id(child))
+            child[(entry_hash >> shift) & _MASK] = entry
+            node[idx] = child
+            node = child
+        else:
+            if id(entry) not in owned:
+                entry = _Bucket(entry)
+                owned.add(id(entry))
+                node[idx] = entry
+            added = key not in entry
+            entry[key] = value
+            return int(added)
@@ -0,0 +1,75 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+import beanmachine.ppl as bm
+import pytest
+import torch
+import torch.distributions as dist
+from beanmachine.ppl.world import BatchedWorld
+
+
+class SampleModel:
+    @bm.random_variable
+    def foo(self):
+        return dist.Normal(torch.zeros(2), 1.0)
+
+    @bm.random_variable
+    def bar(self):
+        return dist.Normal(self.foo().sum(-1), 1.0)
+
+    @bm.random_variable
+    def baz(self):
+        # not vectorized over the chain dimension
+        return dist.Normal(self.foo().sum(), 1.0)
+
+    @bm.functional
+    def foo_sum(self):
+        return self.foo().sum(-1)
+
+    @bm.functional
+    def constant(self):
+        return torch.zeros(3)
+
+
+def test_batched_world():
+    model = SampleModel()
+    world = BatchedWorld.initialize_world(
+        [model.foo()], {model.bar(): torch.tensor(0.5)}, num_chains=3
+    )
+    assert world[model.foo()].shape == (3, 2)
+    assert world.get_variable(model.bar()).distribution.batch_shape == (3,)
+    log_prob = world.log_prob()
+    assert log_prob.shape == (3,)
+    for chain in range(3):
+        foo_val = world[model.foo()][chain]
+        expected = dist.Normal(0.0, 1.0).log_prob(foo_val).sum() + dist.Normal(
+            foo_val.sum(), 1.0
+        ).log_prob(torch.tensor(0.5))
+        assert torch.isclose(log_prob[chain], expected)
+
+    new_world = world.replace({model.foo(): torch.zeros(3, 2)})
+    merged = world.merge(new_world, torch.tensor([True, False, True]))
+    assert torch.equal(merged[model.foo()][0], torch.zeros(2))
+    assert torch.equal(merged[model.foo()][1], world[model.foo()][1])
+    assert torch.allclose(merged.log_prob(), merged.log_prob(recompute=True))
+    assert merged.log_prob()[1] == log_prob[1]
+
+    with pytest.raises(ValueError):
+        BatchedWorld.initialize_world([model.baz()], num_chains=3)
+
+
+def test_is_batched():
+    model = SampleModel()
+    world = BatchedWorld.initialize_world(
+        [model.foo()], {model.bar(): torch.tensor(0.5)}, num_chains=3
+    )
+    children = set(world.get_variable(model.foo()).children)
+    assert world.is_batched(model.foo())
+    assert world.is_batched(model.foo_sum())
+    assert not world.is_batched(model.bar())
+    # the first dimension of the value is not the chain dimension
+    assert not world.is_batched(model.constant())
+    # the functionals are not added to the graph
+    assert world.get_variable(model.foo()).children == children
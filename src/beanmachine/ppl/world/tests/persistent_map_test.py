@@ -0,0 +1,74 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+import random
+
+import pytest
+from beanmachine.ppl.world.persistent_map import PersistentMap
+
+
+class CollidingKey:
+    """A key whose hash collides with every other key of the same class"""
+
+    def __init__(self, val: int):
+        self.val = val
+
+    def __hash__(self):
+        return 42
+
+    def __eq__(self, other):
+        return isinstance(other, CollidingKey) and self.val == other.val
+
+
+def test_basic_operations():
+    m1 = PersistentMap({"a": 1, "b": 2})
+    assert len(m1) == 2
+    assert m1["a"] == 1
+    assert "c" not in m1
+    with pytest.raises(KeyError):
+        m1["c"]
+
+    m2 = m1.set("c", 3)
+    m3 = m2.update({"a": 10, "d": 4})
+    # the original maps should not be affected by the updates
+    assert dict(m1) == {"a": 1, "b": 2}
+    assert dict(m2) == {"a": 1, "b": 2, "c": 3}
+    assert dict(m3) == {"a": 10, "b": 2, "c": 3, "d": 4}
+    assert len(m3) == 4
+
+
+def test_hash_collision():
+    m = PersistentMap()
+    for i in range(10):
+        m = m.set(CollidingKey(i), i)
+    m2 = m.set(CollidingKey(3), 30)
+    assert len(m) == len(m2) == 10
+    assert m[CollidingKey(3)] == 3
+    assert m2[CollidingKey(3)] == 30
+    assert CollidingKey(10) not in m2
+
+
+def test_consistent_with_dict():
+    expected = {}
+    m = PersistentMap()
+    snapshots = []
+    for i in range(5000):
+        key = random.randint(-2000, 2000)
+        expected[key] = i
+        m = m.set(key, i)
+        if i % 1000 == 0:
+            snapshots.append((m, expected.copy()))
+
+    assert len(m) == len(expected)
+    assert dict(m) == expected
+    for snapshot, snapshot_expected in snapshots:
+        assert dict(snapshot) == snapshot_expected
+
+
+def test_diff():
+    m1 = PersistentMap({i: str(i) for i in range(1000)})
+    m2 = m1.update({3: "three", 1000: "1000"})
+    assert set(m1.diff(m2)) == set(m2.diff(m1)) == {3, 1000}
+    assert list(m1.diff(m1.set(5, m1[5]))) == []
@@ -3,10 +3,13 @@
 # This source code is licensed under the MIT license found in the
 # LICENSE file in the root directory of this source tree.
 
+import threading
+
 import beanmachine.ppl as bm
+import pytest
 import torch
 import torch.distributions as dist
-from beanmachine.ppl.world import World
+from beanmachine.ppl.world import get_world_context, World
 
 
 class SampleModel:
@@ -29,6 +32,30 @@ class DiscreteModel:
         return dist.Normal(self.foo().float(), torch.tensor(1.0))
 
 
+class IndependentModel:
+    @bm.random_variable
+    def x(self, i):
+        return dist.Normal(0.0, 1.0)
+
+    @bm.random_variable
+    def y(self, i):
+        return dist.Normal(self.x(i), 1.0)
+
+
+class PlateModel:
+    @bm.random_variable
+    def mu(self):
+        return dist.Normal(0.0, 1.0)
+
+    @bm.plate(size=3)
+    def theta(self, i):
+        return dist.Normal(self.mu(), 1.0)
+
+    @bm.plate(size=3)
+    def y(self, i):
+        return dist.Normal(self.theta(i), 1.0)
+
+
 class DynamicModel:
     @bm.random_variable
     def foo(self):
@@ -154,3 +181,179 @@ def test_distribution_and_log_prob_update():
     baz_var2 = world2.get_variable(model.baz())  # Bernoulli(1.0)
     # recall that baz() is observed to be 1.0
     assert baz_var.log_prob < baz_var2.log_prob
+
+
+def test_incremental_log_prob():
+    model = DynamicModel()
+    world = World.initialize_world([model.baz()], {})
+    world.log_prob()  # populate the cache
+    for foo_val in [1.0, 0.0, 1.0]:
+        world = world.replace({model.foo(): torch.tensor(foo_val)})
+        world = world.replace({model.baz(): torch.randn(())})
+        assert world._log_prob is not None
+        assert torch.isclose(world.log_prob(), world.log_prob(recompute=True))
+    # bar(0) and bar(1) are both in the world but only one of them is a parent of baz
+    assert len(world) == 4
+    assert torch.isclose(world.log_prob(), world.log_prob(world.keys()))
+
+
+def test_log_prob_cache_invalidation():
+    model = SampleModel()
+    world = World()
+    with world:
+        model.foo()
+    log_prob1 = world.log_prob()
+    with world:
+        model.bar()
+    # adding a new node should invalidate the cached log prob
+    assert world.log_prob() != log_prob1
+    assert torch.isclose(world.log_prob(), world.log_prob(recompute=True))
+
+
+def test_static_structure():
+    model = SampleModel()
+    world = World.initialize_world(
+        [model.foo()], {model.bar(): torch.tensor(0.5)}, static_structure=True
+    )
+    new_world = world.replace({model.foo(): torch.tensor(0.25)})
+    bar_var = new_world.get_variable(model.bar())
+    assert bar_var.distribution.mean == 0.25
+    assert bar_var.parents == {model.foo()}
+    assert new_world.get_variable(model.foo()).children == {model.bar()}
+    assert torch.isclose(new_world.log_prob(), new_world.log_prob(recompute=True))
+
+    # instantiating a new node is a violation of the static structure assumption
+    dynamic_model = DynamicModel()
+    world = World(
+        initialize_fn=lambda d: torch.zeros_like(d.sample()), static_structure=True
+    )
+    with world:
+        dynamic_model.baz()
+    with pytest.raises(RuntimeError):
+        world.replace({dynamic_model.foo(): torch.tensor(1.0)})
+
+
+def test_merge_nodes():
+    model = IndependentModel()
+    world = World.initialize_world(
+        [], {model.y(i): torch.tensor(1.0) for i in range(3)}
+    )
+    world.log_prob()  # populate the cache
+    xs = [model.x(i) for i in range(3)]
+    new_world = world.replace({node: torch.tensor(2.0) for node in xs})
+    merged_world = world.merge_nodes(new_world, xs[:1])
+    assert merged_world[xs[0]] == 2.0
+    assert merged_world[xs[1]] == world[xs[1]]
+    assert merged_world.get_variable(model.y(0)).distribution.mean == 2.0
+    assert merged_world.get_variable(model.y(1)).distribution.mean == world[xs[1]]
+    assert torch.isclose(merged_world.log_prob(), merged_world.log_prob(recompute=True))
+
+
+def test_structure_version():
+    model = DynamicModel()
+    world = World.initialize_world([model.baz()], {})
+    version = world.structure_version
+    assert world.copy().structure_version == version
+    # changing a value without changing the dependencies keeps the structure
+    new_world = world.replace({model.baz(): torch.randn(())})
+    assert new_world.structure_version == version
+    foo_val = world[model.foo()]
+    new_world = world.replace({model.foo(): 1 - foo_val})
+    assert new_world.structure_version != version
+    # switching back to the old dependencies is still considered a new structure
+    newer_world = new_world.replace({model.foo(): foo_val})
+    assert newer_world.structure_version not in {version, new_world.structure_version}
+    assert world.structure_version == version
+    assert World().structure_version != World().structure_version
+
+
+def test_plate():
+    model = PlateModel()
+    observations = {model.y(i): torch.tensor(float(i)) for i in range(3)}
+    world = World.initialize_world([model.theta(1)], observations)
+    # each plate is stored as a single batched variable
+    assert set(world.keys()) == {model.mu(), model.theta(), model.y()}
+    assert world.observations.keys() == {model.y()}
+    assert torch.equal(world[model.y()], torch.tensor([0.0, 1.0, 2.0]))
+    assert world.call(model.theta(1)) == world[model.theta()][1]
+    assert world.get_variable(model.theta()).distribution.batch_shape == (3,)
+
+    y_var = world.get_variable(model.y())
+    assert torch.equal(y_var.parent_indices[model.theta()], torch.arange(3))
+    # per-site log prob matches the one of the individual random variable
+    theta_1 = world.call(model.theta(1))
+    assert torch.isclose(
+        world.log_prob([model.y(1)]), dist.Normal(theta_1, 1.0).log_prob(1.0)
+    )
+    site_log_prob = world.plate_log_prob(model.theta(), [model.theta(), model.y()])
+    assert site_log_prob.shape == (3,)
+    assert torch.isclose(
+        site_log_prob.sum(), world.log_prob([model.theta(), model.y()])
+    )
+
+    new_world = world.replace({model.mu(): torch.tensor(1.0)})
+    assert torch.all(new_world.get_variable(model.theta()).distribution.mean == 1.0)
+
+    with pytest.raises(ValueError):
+        World.initialize_world([], {model.y(0): torch.tensor(0.0)})
+
+
+def test_replace_with_unchanged_values():
+    model = DiscreteModel()
+    world = World.initialize_world([model.foo()], {model.bar(): torch.tensor(0.5)})
+    bar_var = world.get_variable(model.bar())
+    # replacing a node with the same value should not re-evaluate its children
+    new_world = world.replace({model.foo(): world[model.foo()].clone()})
+    assert new_world.get_variable(model.bar()) is bar_var
+
+    # re-evaluating a distribution with the same parameters keeps the cached log prob
+    bar_log_prob = bar_var.log_prob
+    new_bar_var = bar_var.replace(
+        distribution=dist.Normal(bar_var.distribution.mean, 1.0)
+    )
+    assert new_bar_var.log_prob is bar_log_prob
+    new_bar_var = bar_var.replace(distribution=dist.Normal(10.0, 1.0))
+    assert new_bar_var.log_prob is not bar_log_prob
+
+
+def test_initialize_world_with_localized_retries():
+    @bm.random_variable
+    def scale():
+        return dist.HalfNormal(1.0)
+
+    @bm.random_variable
+    def x(i):
+        return dist.Normal(0.0, scale())
+
+    @bm.random_variable
+    def y():
+        # only positive values of x(0) are valid
+        return dist.Uniform(0.0, x(0).abs() + 1.0)
+
+    num_inits = 0
+
+    def init_fn(d: dist.Distribution):
+        nonlocal num_inits
+        num_inits += 1
+        # the first value of the scale is outside of its support
+        return torch.tensor(-1.0) if num_inits == 1 else torch.tensor(0.5)
+
+    queries = [x(i) for i in range(5)]
+    world = World.initialize_world(queries, {y(): torch.tensor(1.2)}, init_fn)
+    assert torch.isfinite(world.log_prob())
+    # only the scale is resampled, while the values of x are kept
+    assert num_inits == len(queries) + 2
+    report = world.initialization_report
+    assert report.num_retries == 1
+    assert report.retried_sites == {scale(): 1}
+    assert world.copy().initialization_report is report
+
+
+def test_world_context_is_thread_local():
+    contexts = []
+    with World() as world:
+        thread = threading.Thread(target=lambda: contexts.append(get_world_context()))
+        thread.start()
+        thread.join()
+        assert get_world_context() is world
+    assert contexts == [None]
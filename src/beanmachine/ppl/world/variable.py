@@ -6,7 +6,7 @@
 from __future__ import annotations
 
 import dataclasses
-from typing import Set
+from typing import Dict, Optional, Set
 
 import torch
 import torch.distributions as dist
@@ -33,6 +33,12 @@ class Variable:
     children: Set[RVIdentifier] = dataclasses.field(default_factory=set)
     "Set containing the RVIdentifiers of the children of the random variable"
 
+    parent_indices: Dict[RVIdentifier, Optional[torch.Tensor]] = dataclasses.field(
+        default_factory=dict
+    )
+    """Indices of the sites of the parent plates that the random variable depends on,
+    or None if it depends on the sites of a plate in an arbitrary way"""
+
     @lazy_property
     def log_prob(self) -> torch.Tensor:
         """
@@ -42,5 +48,48 @@ class Variable:
         return self.distribution.log_prob(self.value)
 
     def replace(self, **changes) -> Variable:
-        """Return a new Variable object with fields replaced by the changes"""
-        return dataclasses.replace(self, **changes)
+        """Return a new Variable object with fields replaced by the changes. If only the
+        distribution is replaced and it has the same parameters as the old one, the
+        cached log prob is carried over to the new Variable."""
+        new_var = dataclasses.replace(self, **changes)
+        if (
+            "log_prob" in self.__dict__
+            and "value" not in changes
+            and "distribution" in changes
+            and _is_same_distribution(self.distribution, new_var.distribution)
+        ):
+            new_var.__dict__["log_prob"] = self.__dict__["log_prob"]
+        return new_var
+
+
+def _is_same_distribution(d1: dist.Distribution, d2: dist.Distribution) -> bool:
+    """Whether two distributions are of the same type and have identical parameters.
+    Returns False if this can't be determined cheaply or if the parameters of d2
+    require grad (so that its log prob should be differentiable)."""
+    if d1 is d2:
+        return True
+    if (
+        type(d1) is not type(d2)
+        or d1.batch_shape != d2.batch_shape
+        or d1.event_shape != d2.event_shape
+    ):
+        return False
+    if isinstance(d1, dist.Independent):
+        return (
+            d1.reinterpreted_batch_ndims == d2.reinterpreted_batch_ndims
+            and _is_same_distribution(d1.base_dist, d2.base_dist)
+        )
+    # only compare the parameters that have been set, so that lazily computed ones
+    # (e.g. logits vs. probs) are not evaluated
+    params = [name for name in d1.arg_constraints if name in d1.__dict__]
+    if not params or any(name not in d2.__dict__ for name in params):
+        return False
+    for name in params:
+        param1, param2 = d1.__dict__[name], d2.__dict__[name]
+        if not torch.is_tensor(param2):
+            return False
+        if param2.requires_grad or not (
+            param1.dtype == param2.dtype and torch.equal(param1, param2)
+        ):
+            return False
+    return True
@@ -6,6 +6,9 @@
 from __future__ import annotations
 
 import dataclasses
+import itertools
+import logging
+from collections import defaultdict
 from typing import (
     Collection,
     Dict,
@@ -17,25 +20,53 @@ from typing import (
     Set,
     Tuple,
     TypeVar,
+    Union,
 )
 
 import torch
 import torch.distributions as dist
 from beanmachine.ppl.model.rv_identifier import RVIdentifier
-from beanmachine.ppl.world import init_to_uniform
 from beanmachine.ppl.world.base_world import BaseWorld
-from beanmachine.ppl.world.initialize_fn import init_from_prior, InitializeFn
+from beanmachine.ppl.world.initialize_fn import (
+    init_from_prior,
+    init_to_uniform,
+    InitializeFn,
+)
+from beanmachine.ppl.world.persistent_map import PersistentMap
 from beanmachine.ppl.world.variable import Variable
 
 
 RVDict = Dict[RVIdentifier, torch.Tensor]
+PlateIndices = Dict[RVIdentifier, Optional[torch.Tensor]]
 T = TypeVar("T", bound="World")
 
+LOGGER = logging.getLogger("beanmachine")
+
+# source of the structure versions of worlds, which are unique across all worlds
+_STRUCTURE_VERSIONS = itertools.count()
+
+
+@dataclasses.dataclass
+class InitializationReport:
+    """
+    Summary of the initialization of a world by ``World.initialize_world``.
+
+    Attributes:
+      num_retries: The number of rounds of resampling that were needed before all of
+        the random variables had a finite log prob.
+      retried_sites: The number of times that each random variable was resampled.
+        Random variables that were valid from the start are not included.
+    """
+
+    num_retries: int = 0
+    retried_sites: Dict[RVIdentifier, int] = dataclasses.field(default_factory=dict)
+
 
 @dataclasses.dataclass
 class _TempVar:
     node: RVIdentifier
     parents: Set[RVIdentifier] = dataclasses.field(default_factory=set)
+    parent_indices: PlateIndices = dataclasses.field(default_factory=dict)
 
 
 class World(BaseWorld, Mapping[RVIdentifier, torch.Tensor]):
@@ -60,18 +91,39 @@ class World(BaseWorld, Mapping[RVIdentifier, torch.Tensor]):
         assert x == y
 
     Args:
-      observations (Optional): Optional observations, which fixes the random variables to observed values
+      observations (Optional): Optional observations, which fixes the random variables to observed values.
+        Observations of the individual sites of a plate are merged into a single
+        observation of the plate, so either all or none of its sites should be observed.
       initialize_fn (callable, Optional): Callable which takes a ``torch.distribution`` object as argument and returns a ``torch.Tensor``
+      static_structure (bool): Whether the dependency structure of the model is fixed,
+        i.e. the set of parents of every random variable does not depend on the
+        values of other random variables. If True, ``replace`` will only re-evaluate
+        the distributions of the children nodes without re-discovering their parents.
+        Defaults to False.
     """
 
+    # maximum number of incremental updates to the cached joint log prob before it is
+    # recomputed from scratch
+    LOG_PROB_REFRESH_INTERVAL: int = 1000
+
     def __init__(
         self,
         observations: Optional[RVDict] = None,
         initialize_fn: InitializeFn = init_from_prior,
+        static_structure: bool = False,
     ) -> None:
-        self.observations: RVDict = observations or {}
+        self.observations: RVDict = _merge_plate_observations(observations or {})
         self._initialize_fn: InitializeFn = initialize_fn
-        self._variables: Dict[RVIdentifier, Variable] = {}
+        self._static_structure = static_structure
+        # an immutable map that is shared between copies of the world (and updated
+        # by path copying), so that copying a world is O(1)
+        self._variables: PersistentMap[RVIdentifier, Variable] = PersistentMap()
+        # the joint log prob of all variables in the world, which is updated
+        # incrementally by `replace` (None if it needs to be recomputed)
+        self._log_prob: Optional[torch.Tensor] = None
+        self._num_log_prob_updates = 0
+        self._structure_version = next(_STRUCTURE_VERSIONS)
+        self.initialization_report: Optional[InitializationReport] = None
 
         self._call_stack: List[_TempVar] = []
 
@@ -87,8 +139,11 @@ class World(BaseWorld, Mapping[RVIdentifier, torch.Tensor]):
         """
         Initializes a world with all of the random variables (queries and observations).
         In case of initializing values outside of support of the distributions, the
-        method will keep resampling until a valid initialization is found up to
-        ``max_retries`` times.
+        method will find the random variables whose log prob is not finite and only
+        resample them (or the latent parents of invalid observations), re-evaluating
+        their descendants, until a valid initialization is found up to
+        ``max_retries`` times. The sites that needed to be resampled are recorded in
+        the ``initialization_report`` of the returned world.
 
         Args:
             queries: A list of random variables that need to be inferred.
@@ -98,25 +153,72 @@ class World(BaseWorld, Mapping[RVIdentifier, torch.Tensor]):
                 error (default to 100).
         """
         observations = observations or {}
+        world = cls(observations, initialize_fn, **kwargs)
+        # recursively add parent nodes to the graph
+        for node in queries:
+            world.call(node)
+        for node in world.observations:
+            world.call(node)
+
+        report = InitializationReport()
         for _ in range(max_retries):
-            world = cls(observations, initialize_fn, **kwargs)
-            # recursively add parent nodes to the graph
-            for node in queries:
-                world.call(node)
-            for node in observations:
-                world.call(node)
-
             # check if the initial state is valid
-            log_prob = world.log_prob()
-            if not torch.isinf(log_prob) and not torch.isnan(log_prob):
+            if torch.isfinite(world.log_prob()).all():
+                world.initialization_report = report
+                if report.num_retries > 0:
+                    LOGGER.info(
+                        f"Initialization needed {report.num_retries} retries, resampled"
+                        f" sites: {report.retried_sites}"
+                    )
                 return world
 
+            nodes_to_resample = world._get_nodes_to_resample(report.retried_sites)
+            if not nodes_to_resample:
+                # invalid observations that do not depend on any latent variable
+                break
+            world = world.replace(
+                {
+                    node: initialize_fn(world.get_variable(node).distribution)
+                    for node in nodes_to_resample
+                }
+            )
+            report.num_retries += 1
+            for node in nodes_to_resample:
+                report.retried_sites[node] = report.retried_sites.get(node, 0) + 1
+
         # None of the world gives us a valid initial state
         raise ValueError(
             f"Cannot find a valid initialization after {max_retries} retries. The model"
             " might be misspecified."
         )
 
+    def _get_nodes_to_resample(
+        self, retried_sites: Dict[RVIdentifier, int]
+    ) -> Set[RVIdentifier]:
+        """Returns the latent nodes that should be resampled to fix the nodes with an
+        invalid log prob. Invalid latent nodes are resampled unless one of their parents
+        is invalid as well (in which case they are re-evaluated once the parent is
+        fixed), while invalid observations (and latent nodes that stay invalid after
+        being resampled) have their latent parents resampled."""
+        invalid_nodes = {
+            node
+            for node, var in self._variables.items()
+            if not torch.isfinite(var.log_prob).all()
+        }
+        invalid_latent_nodes = invalid_nodes - self.observations.keys()
+        nodes_to_resample = set()
+        for node in invalid_nodes:
+            parents = self._variables[node].parents
+            if node in self.observations or node in retried_sites:
+                nodes_to_resample.update(
+                    parent for parent in parents if parent not in self.observations
+                )
+            if node in invalid_latent_nodes and parents.isdisjoint(
+                invalid_latent_nodes
+            ):
+                nodes_to_resample.add(node)
+        return nodes_to_resample
+
     def __getitem__(self, node: RVIdentifier) -> torch.Tensor:
         """
         Args:
@@ -149,30 +251,118 @@ class World(BaseWorld, Mapping[RVIdentifier, torch.Tensor]):
         """
         assert not any(node in self.observations for node in values)
         new_world = self.copy()
-        for node, value in values.items():
-            new_world._variables[node] = new_world._variables[node].replace(
-                value=value.clone()
-            )
-        # changing the value of a node can change the dependencies of its children nodes
+        new_world._variables = new_world._variables.update(
+            {
+                node: new_world._variables[node].replace(value=value.clone())
+                for node, value in values.items()
+            }
+        )
+        # changing the value of a node can change the dependencies of its children
+        # nodes, while nodes whose values are not changed do not need to trigger the
+        # re-evaluation of their children (values that require grad are always
+        # treated as changed so that the log prob of the new world is differentiable
+        # with respect to them)
+        changed_nodes = [
+            node
+            for node, value in values.items()
+            if value.requires_grad or not _is_same_value(self[node], value)
+        ]
         nodes_to_update = set().union(
-            *(self._variables[node].children for node in values)
+            *(self._variables[node].children for node in changed_nodes)
         )
+        if self._static_structure:
+            new_world._update_distributions(nodes_to_update)
+            if len(new_world) != len(self):
+                raise RuntimeError(
+                    "New random variables are instantiated while replacing"
+                    f" {list(values)}, but the world is created with"
+                    " static_structure=True."
+                )
+            self._update_log_prob(new_world, nodes_to_update.union(values))
+            return new_world
+
         for node in nodes_to_update:
             # Invoke node conditioned on the provided values
-            new_distribution, new_parents = new_world._run_node(node)
+            new_distribution, new_parents, new_indices = new_world._run_node(node)
             # Update children's dependencies
             old_node_var = new_world._variables[node]
-            new_world._variables[node] = old_node_var.replace(
-                parents=new_parents, distribution=new_distribution
+            if new_parents != old_node_var.parents:
+                new_world._structure_version = next(_STRUCTURE_VERSIONS)
+            new_world._variables = new_world._variables.set(
+                node,
+                old_node_var.replace(
+                    parents=new_parents,
+                    distribution=new_distribution,
+                    parent_indices=new_indices,
+                ),
             )
             dropped_parents = old_node_var.parents - new_parents
             for parent in dropped_parents:
                 parent_var = new_world._variables[parent]
-                new_world._variables[parent] = parent_var.replace(
-                    children=parent_var.children - {node}
+                new_world._variables = new_world._variables.set(
+                    parent, parent_var.replace(children=parent_var.children - {node})
                 )
+        self._update_log_prob(new_world, nodes_to_update.union(values))
+        return new_world
+
+    def merge_nodes(self, other: World, nodes: Iterable[RVIdentifier]) -> World:
+        """
+        Args:
+          other (World): A world derived from the current world by ``replace``,
+            where the replaced nodes do not share any children and their
+            dependencies are unchanged.
+          nodes (Iterable[RVIdentifier]): Replaced nodes to take from ``other``.
+
+        Returns:
+          A world that takes the values of ``nodes`` (and the distributions of their
+          children) from ``other``, and the rest of the variables from the current
+          world. This is cheaper than replacing the values of ``nodes`` again, since
+          the children do not need to be re-evaluated.
+        """
+        nodes = set(nodes)
+        changed_nodes = set(nodes)
+        for node in nodes:
+            changed_nodes |= other._variables[node].children
+        new_world = self.copy()
+        new_world._variables = new_world._variables.update(
+            {node: other._variables[node] for node in changed_nodes}
+        )
+        self._update_log_prob(new_world, changed_nodes)
         return new_world
 
+    def _update_distributions(self, nodes: Set[RVIdentifier]) -> None:
+        """Re-evaluate the distributions of the given nodes in place, assuming that
+        their parents remain the same."""
+        variables = {}
+        with self:
+            for node in nodes:
+                variables[node] = self._variables[node].replace(
+                    distribution=_invoke(node)
+                )
+        self._variables = self._variables.update(variables)
+
+    def _update_log_prob(self, new_world: World, changed_nodes: Set[RVIdentifier]):
+        """Derive the joint log prob of new_world from the one of the current world by
+        swapping the terms of the nodes that have been changed (or added)."""
+        old_log_prob = self._log_prob
+        if (
+            old_log_prob is None
+            or old_log_prob.requires_grad
+            or not torch.isfinite(old_log_prob).all()
+        ):
+            # nothing to update from, or updating from a non-finite value or a
+            # differentiable one (which would chain the autograd graphs of all worlds)
+            new_world._log_prob = None
+            return
+        new_nodes = changed_nodes
+        if len(new_world) != len(self):
+            # new variables are instantiated because of a change in control flow
+            new_nodes = changed_nodes | (new_world.keys() - self.keys())
+        new_world._log_prob = (
+            old_log_prob - self.log_prob(changed_nodes) + new_world.log_prob(new_nodes)
+        )
+        new_world._num_log_prob_updates = self._num_log_prob_updates + 1
+
     def __iter__(self) -> Iterator[RVIdentifier]:
         return iter(self._variables)
 
@@ -186,28 +376,58 @@ class World(BaseWorld, Mapping[RVIdentifier, torch.Tensor]):
         """
         return self._variables.keys() - self.observations.keys()
 
+    @property
+    def static_structure(self) -> bool:
+        """
+        Whether the dependency structure of the model is declared to be fixed (see
+        the ``static_structure`` argument of ``World``).
+        """
+        return self._static_structure
+
+    @property
+    def structure_version(self) -> int:
+        """
+        An identifier of the structure of the world (its set of random variables and
+        their dependencies). Worlds that are derived from each other without any
+        change of structure share the same version, while a version is never reused
+        for a different structure.
+        """
+        return self._structure_version
+
     def copy(self) -> World:
         """
         Returns:
           Shallow copy of the current world.
         """
-        world_copy = World(self.observations.copy(), self._initialize_fn)
-        world_copy._variables = self._variables.copy()
+        world_copy = World(None, self._initialize_fn, self._static_structure)
+        # observations are never modified by the world, so they can be shared as well
+        world_copy.observations = self.observations
+        world_copy._variables = self._variables
+        world_copy._log_prob = self._log_prob
+        world_copy._num_log_prob_updates = self._num_log_prob_updates
+        world_copy._structure_version = self._structure_version
+        world_copy.initialization_report = self.initialization_report
         return world_copy
 
     def initialize_value(self, node: RVIdentifier) -> None:
         # recursively calls into parent nodes
-        distribution, parents = self._run_node(node)
+        distribution, parents, parent_indices = self._run_node(node)
 
         if node in self.observations:
             node_val = self.observations[node]
         else:
             node_val = self._initialize_fn(distribution)
 
-        self._variables[node] = Variable(
-            value=node_val,
-            distribution=distribution,
-            parents=parents,
+        self._log_prob = None
+        self._structure_version = next(_STRUCTURE_VERSIONS)
+        self._variables = self._variables.set(
+            node,
+            Variable(
+                value=node_val,
+                distribution=distribution,
+                parents=parents,
+                parent_indices=parent_indices,
+            ),
         )
 
     def update_graph(self, node: RVIdentifier) -> torch.Tensor:
@@ -231,24 +451,126 @@ class World(BaseWorld, Mapping[RVIdentifier, torch.Tensor]):
 
         return node_var.value
 
+    def update_plate(
+        self, node: RVIdentifier, index: Optional[Union[int, torch.Tensor]] = None
+    ) -> torch.Tensor:
+        """
+        All of the sites of a plate are stored in a single batched variable. This
+        function adds the plate to the graph if necessary, and keeps track of the sites
+        that the current random variable depends on.
+
+        Args:
+          node (RVIdentifier): RVIdentifier of the plate.
+          index (Optional): Index (or tensor of indices) of the site(s) to look up. If
+            None, the values of all of the sites are returned.
+
+        Returns:
+          The value of the site(s) stored in world.
+        """
+        value = self.update_graph(node)
+        if len(self._call_stack) > 0:
+            parent_indices = self._call_stack[-1].parent_indices
+            if index is not None and not torch.is_tensor(index):
+                index = torch.tensor(index)
+            if node not in parent_indices:
+                parent_indices[node] = index
+            elif not (
+                index is not None
+                and parent_indices[node] is not None
+                and torch.equal(parent_indices[node], index)
+            ):
+                # the sites are accessed more than once in different ways
+                parent_indices[node] = None
+        return value if index is None else value[index]
+
+    def plate_log_prob(
+        self, plate: RVIdentifier, nodes: Collection[RVIdentifier]
+    ) -> torch.Tensor:
+        """
+        Args:
+          plate (RVIdentifier): RVIdentifier of a plate.
+          nodes: Collection of RVIdentifiers, which should be either the plate itself
+            or random variables whose log prob terms each depend on a single site of
+            the plate.
+
+        Returns:
+          A tensor of shape ``(plate_size,)`` whose i-th entry is the sum of the log
+          prob terms of the nodes that depend on the i-th site of the plate.
+        """
+        plate_var = self._variables[plate]
+        log_prob = torch.zeros_like(plate_var.log_prob)
+        for node in set(nodes):
+            node_var = self._variables[node]
+            if node == plate:
+                log_prob = log_prob + node_var.log_prob
+                continue
+            index = node_var.parent_indices.get(plate)
+            node_log_prob = node_var.log_prob
+            try:
+                index = index.expand(node_log_prob.shape)
+            except (AttributeError, RuntimeError):
+                raise ValueError(
+                    f"The log prob of {node} depends on more than one site of {plate},"
+                    " so the sites cannot be updated independently."
+                )
+            log_prob = log_prob.index_add(
+                0, index.reshape(-1), node_log_prob.reshape(-1).to(log_prob.dtype)
+            )
+        return log_prob
+
     def log_prob(
-        self, nodes: Optional[Collection[RVIdentifier]] = None
+        self,
+        nodes: Optional[Collection[RVIdentifier]] = None,
+        recompute: bool = False,
     ) -> torch.Tensor:
         """
         Args:
           nodes (Optional): Optional collection of RVIdentifiers to evaluate the log prob of a subset of
                  the graph. If none is specified, then all the variables in the world are used.
+          recompute (bool): The joint log prob of all variables is cached and updated
+                 incrementally by ``replace``. If True, the cached value is discarded and
+                 recomputed from scratch. The cache is also periodically recomputed
+                 (every ``LOG_PROB_REFRESH_INTERVAL`` updates) to limit the accumulation
+                 of floating point error.
         Returns:
           The joint log prob of all of the nodes in the current world
         """
         if nodes is None:
-            nodes = self._variables.keys()
-
+            if (
+                recompute
+                or self._log_prob is None
+                or self._num_log_prob_updates >= self.LOG_PROB_REFRESH_INTERVAL
+            ):
+                self._log_prob = self._sum_log_prob(self._variables.keys())
+                self._num_log_prob_updates = 0
+            return self._log_prob
+        return self._sum_log_prob(nodes)
+
+    def _sum_log_prob(self, nodes: Collection[RVIdentifier]) -> torch.Tensor:
         log_prob = torch.tensor(0.0)
         for node in set(nodes):
-            log_prob = log_prob + torch.sum(self._variables[node].log_prob)
+            try:
+                node_log_prob = self._variables[node].log_prob
+            except KeyError:
+                site = node.plate_site
+                if site is None:
+                    raise
+                plate, index = site
+                node_log_prob = self._variables[plate].log_prob[index]
+            log_prob = log_prob + self.reduce_log_prob(node_log_prob)
         return log_prob
 
+    def reduce_log_prob(self, log_prob: torch.Tensor) -> torch.Tensor:
+        """
+        Args:
+          log_prob (torch.Tensor): Log prob terms evaluated on values of the world.
+
+        Returns:
+          The sum of the terms, which is a scalar for a World and a tensor of
+          shape ``(num_chains,)`` for a ``BatchedWorld``.
+        """
+        return torch.sum(log_prob)
+
     def enumerate_node(self, node: RVIdentifier) -> torch.Tensor:
         """
         Args:
@@ -264,7 +586,7 @@ class World(BaseWorld, Mapping[RVIdentifier, torch.Tensor]):
 
     def _run_node(
         self, node: RVIdentifier
-    ) -> Tuple[dist.Distribution, Set[RVIdentifier]]:
+    ) -> Tuple[dist.Distribution, Set[RVIdentifier], PlateIndices]:
         """
         Invoke a random variable function conditioned on the current world.
 
@@ -272,12 +594,70 @@ class World(BaseWorld, Mapping[RVIdentifier, torch.Tensor]):
           node (RVIdentifier): RVIdentifier of node.
 
         Returns:
-          Its distribution and set of parent nodes
+          Its distribution, set of parent nodes, and the indices of the sites of the
+          parent plates it depends on
         """
         self._call_stack.append(_TempVar(node))
-        with self:
-            distribution = node.function(*node.arguments)
-        temp_var = self._call_stack.pop()
-        if not isinstance(distribution, dist.Distribution):
-            raise TypeError("A random_variable is required to return a distribution.")
-        return distribution, temp_var.parents
+        try:
+            with self:
+                distribution = _invoke(node)
+        finally:
+            temp_var = self._call_stack.pop()
+        return distribution, temp_var.parents, temp_var.parent_indices
+
+
+def _is_same_value(old_value: torch.Tensor, new_value: torch.Tensor) -> bool:
+    return (
+        old_value is new_value
+        or old_value.dtype == new_value.dtype
+        and old_value.shape == new_value.shape
+        and torch.equal(old_value, new_value)
+    )
+
+
+def _invoke(node: RVIdentifier) -> dist.Distribution:
+    """Invoke the function of a random variable, evaluating all of the sites at once
+    if the node is a plate."""
+    plate_size = node.plate_size
+    if plate_size is None:
+        distribution = node.function(*node.arguments)
+    else:
+        distribution = node.function(*node.arguments, torch.arange(plate_size))
+    if not isinstance(distribution, dist.Distribution):
+        raise TypeError("A random_variable is required to return a distribution.")
+    if plate_size is not None:
+        batch_shape = distribution.batch_shape
+        if len(batch_shape) == 0:
+            distribution = distribution.expand((plate_size,))
+        elif batch_shape != (plate_size,):
+            raise ValueError(
+                f"The distribution of plate {node} should have a batch shape of () or"
+                f" ({plate_size},), but got {tuple(batch_shape)}."
+            )
+    return distribution
+
+
+def _merge_plate_observations(observations: RVDict) -> RVDict:
+    """Merge the observations of the individual sites of plates into observations of
+    the whole plates."""
+    sites = defaultdict(dict)
+    for node, value in observations.items():
+        site = node.plate_site
+        if site is not None:
+            plate, index = site
+            sites[plate][index] = value
+    if not sites:
+        return observations
+
+    merged = {
+        node: val for node, val in observations.items() if node.plate_site is None
+    }
+    for plate, values in sites.items():
+        plate_size = plate.plate_size
+        if plate in merged or values.keys() != set(range(plate_size)):
+            raise ValueError(
+                f"Either all or none of the {plate_size} sites of {plate} should be"
+                " observed."
+            )
+        merged[plate] = torch.stack([values[i] for i in range(plate_size)])
+    return merged